@@ -0,0 +1,228 @@
+"""Measure book search and lighting a book's spot on the LED strip
+
+Books are looked up through a trigram index built once per inventory save,
+and the LEDs in front of the matches are lit in a single /set_ranges request
+through the shared connection pool. This fills inventories of 1k, 5k and 10k
+synthetic books and reports the index build time, the search latency next to
+a linear difflib scan, and recall@1 for queries with a typo. Then it lights
+the matches of a query on a local stand-in for the ESP32, which adds a
+simulated round trip time per request and per new connection, once with one
+/set_led request per LED over a new connection each, like a simple client
+script would, and once batched. Run from the API directory:
+
+    python -m benchmarks.bench_book_lookup
+"""
+import argparse
+import asyncio
+import contextlib
+import difflib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Tuple
+
+import httpx
+import numpy as np
+
+from models import BookAnnotation
+from services import BookDetectionService, GeminiService, HTTPClientPool, ImageProcessingService
+from services.book_index import normalize_text
+from services.inventory import ShelfInventory
+from services.led_controller import LedController
+from .stubs import StubGeminiClient, StubRoboflowClient
+
+SIZES = [1000, 5000, 10000]
+WORDS = (
+    "the of a night garden house river silent shadow winter empire last city glass history stone queen "
+    "secret time ocean light letters war memory dark little road golden forest brother journey island "
+    "machine song fire lost kingdom wind mountain paper clock storm silver daughter book wild north"
+).split()
+NAMES = (
+    "austen tolstoy orwell morrison murakami achebe borges calvino woolf ishiguro adichie eco "
+    "dostoevsky lem atwood le_guin pratchett tokarczuk saramago marquez mann kafka nabokov sebald"
+).split()
+
+
+def _books(count: int, seed: int = 0) -> List[BookAnnotation]:
+    """Books with random titles, laid out on shelves of 40 spines"""
+    rng = np.random.default_rng(seed)
+    books = []
+    for i in range(count):
+        title = " ".join(rng.choice(WORDS, size=int(rng.integers(2, 6))))
+        author = f"{rng.choice(NAMES).replace('_', ' ')} {i}"
+        x, y = (i % 40) * 50, (i // 40) * 400
+        books.append(BookAnnotation(
+            title=title.capitalize(),
+            author=author.title(),
+            polygons=[[[x, y], [x + 40, y], [x + 40, y + 300], [x, y + 300]]],
+            xyxy=[x, y, x + 40, y + 300],
+        ))
+    return books
+
+
+def _typo(text: str, rng: np.random.Generator) -> str:
+    """Drop, double or swap one character"""
+    i = int(rng.integers(1, len(text) - 1))
+    kind = rng.integers(3)
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + text[i] + text[i:]
+    return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+
+
+def _linear_search(books: List[BookAnnotation], query: str) -> int:
+    query = normalize_text(query)
+    scores = [
+        difflib.SequenceMatcher(None, query, normalize_text(f"{book.title} {book.author}")).ratio() for book in books
+    ]
+    return int(np.argmax(scores))
+
+
+def _percentiles(latencies: List[float]) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    return f"{statistics.median(latencies) * 1000:>9.2f}{p95 * 1000:>9.2f}"
+
+
+class _StandInController(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, rtt: float, show: float):
+        self.rtt = rtt
+        self.show = show
+        self.connections = 0
+        self.requests = 0
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, don't let delayed ACKs skew the timings
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+        time.sleep(self.server.rtt)
+
+    def do_POST(self):
+        json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        # Every request refreshes the whole strip once
+        time.sleep(self.server.rtt + self.server.show)
+        self.server.requests += 1
+        body = b'{"status":"ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def _light_per_led(url: str, ranges: List[Tuple[int, int]]) -> None:
+    for start, end in ranges:
+        for led in range(start, end):
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{url}/set_led", json=[{"led": led, "r": 255, "g": 255, "b": 255, "a": 100}]
+                )
+            response.raise_for_status()
+
+
+def _search_table(args) -> None:
+    print(f"{'books':>7}{'build ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'difflib p50 ms':>16}{'recall@1':>10}{'difflib':>9}")
+    rng = np.random.default_rng(1)
+    for size in SIZES:
+        books = _books(size)
+        with tempfile.TemporaryDirectory() as directory:
+            service = BookDetectionService(
+                image_service=ImageProcessingService(client=StubRoboflowClient({}, latency=0.0)),
+                gemini_service=GeminiService(client=StubGeminiClient(0.0)),
+            )
+            service._inventory = ShelfInventory(os.path.join(directory, "inventory.db"), 0.5, 10)
+            fingerprint = (np.zeros(8, dtype=np.uint8), 0.1, np.zeros(3, dtype=np.float32))
+            service.inventory.save("bench", [(book, fingerprint) for book in books])
+
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(sys.stderr):
+                service.book_index("bench")
+            build = time.perf_counter() - started
+
+            targets = rng.choice(size, size=args.queries, replace=False)
+            queries = [_typo(books[i].title + " " + books[i].author.split()[0], rng) for i in targets]
+            latencies, hits = [], 0
+            for target, query in zip(targets, queries):
+                started = time.perf_counter()
+                matches = service.search_books("bench", query, limit=5)
+                latencies.append(time.perf_counter() - started)
+                hits += bool(matches) and matches[0].book == books[target]
+
+            linear_latencies, linear_hits = [], 0
+            for target, query in list(zip(targets, queries))[:args.linear_queries]:
+                started = time.perf_counter()
+                linear_hits += _linear_search(books, query) == target
+                linear_latencies.append(time.perf_counter() - started)
+
+            print(
+                f"{size:>7}{build * 1000:>10.1f}{_percentiles(latencies)}"
+                f"{statistics.median(linear_latencies) * 1000:>16.1f}"
+                f"{hits / len(queries):>10.2f}{linear_hits / len(linear_latencies):>9.2f}"
+            )
+            service.inventory._db.close()
+
+
+async def _lighting_table(args) -> None:
+    server = _StandInController(args.rtt, args.show)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    pool = HTTPClientPool()
+    controller = LedController(url, pool=pool, timeout=5)
+
+    # A spine is about 3 LEDs wide on a 60 LED strip
+    leds = [(i * 20, i * 20 + 3) for i in range(args.matches)]
+
+    print(f"\nLighting {args.matches} books ({sum(e - s for s, e in leds)} LEDs), "
+          f"{args.rtt * 1000:.0f} ms round trip, {args.show * 1000:.1f} ms per strip refresh\n")
+    print(f"{'update':<28}{'p50 ms':>9}{'p95 ms':>9}{'requests':>10}{'connections':>13}")
+    modes = [
+        ("per LED, new connection", lambda: _light_per_led(url, leds)),
+        ("batched ranges, pooled", lambda: controller.light(leds)),
+    ]
+    for name, update in modes:
+        requests, connections = server.requests, server.connections
+        latencies = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            await update()
+            latencies.append(time.perf_counter() - started)
+        print(
+            f"{name:<28}{_percentiles(latencies)}{(server.requests - requests) / args.repeats:>10.0f}"
+            f"{server.connections - connections:>13}"
+        )
+
+    await pool.aclose()
+    server.shutdown()
+
+
+async def main(args) -> None:
+    _search_table(args)
+    await _lighting_table(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=200, help="Typo queries per inventory size")
+    parser.add_argument("--linear-queries", type=int, default=20, help="Queries for the slower difflib scan")
+    parser.add_argument("--matches", type=int, default=3, help="Books to light")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--rtt", type=float, default=0.01, help="Simulated WiFi round trip time in seconds")
+    parser.add_argument("--show", type=float, default=0.002, help="Time the ESP32 takes to refresh the strip")
+    asyncio.run(main(parser.parse_args()))
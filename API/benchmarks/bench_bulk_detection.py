@@ -0,0 +1,104 @@
+"""Compare scanning a bookcase image by image with one bulk detection call
+
+Each synthetic shelf photo holds a different number of spines, so per-image
+calls leave partly filled Gemini batches behind. The bulk path pools the
+spines of every photo before batching, also when the photos are sent as
+base64 and decoded BULK_IMAGE_CONCURRENCY at a time, which bounds the peak
+memory. Caches and adaptive batching are disabled so all paths use the same
+fixed batch size. Run from the API directory:
+
+    python -m benchmarks.bench_bulk_detection
+"""
+import argparse
+import asyncio
+import base64
+import time
+import tracemalloc
+
+import cv2
+
+from config import settings
+from services import BookDetectionService, GeminiService, ImageProcessingService
+from .stubs import StubGeminiClient, StubRoboflowClient, make_roboflow_response, make_shelf_image
+
+
+class _PerImageRoboflowClient(StubRoboflowClient):
+    """Answers with the canned response of whichever image is sent"""
+
+    def __init__(self, responses: dict, latency: float):
+        super().__init__({}, latency)
+        self.responses = responses
+
+    def respond(self, image) -> dict:
+        return self.responses[int(image[0, 0, 0])]
+
+
+def _make_service(responses: dict, args) -> tuple:
+    gemini_client = StubGeminiClient(latency=args.gemini_latency)
+    service = BookDetectionService(
+        image_service=ImageProcessingService(client=_PerImageRoboflowClient(responses, args.roboflow_latency)),
+        gemini_service=GeminiService(client=gemini_client),
+    )
+    return service, gemini_client
+
+
+async def _run(service: BookDetectionService, images: list, mode: str) -> float:
+    started = time.perf_counter()
+    if mode == "bulk":
+        await service.detect_books_in_images(images)
+    elif mode == "bulk base64":
+        await service.detect_books_from_base64_bulk(images)
+    else:
+        for image in images:
+            await service.detect_books_in_image(image)
+    return time.perf_counter() - started
+
+
+def _peak_mb(responses: dict, images: list, mode: str, args) -> float:
+    """Peak memory allocated while running the mode, in a separate run as tracing slows it down"""
+    service, _ = _make_service(responses, args)
+    tracemalloc.start()
+    asyncio.run(_run(service, images, mode))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=8, help="Shelf photos in the bookcase")
+    parser.add_argument("--gemini-latency", type=float, default=0.5)
+    parser.add_argument("--roboflow-latency", type=float, default=0.2)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+
+    settings.RESULT_CACHE_ENABLED = False
+    settings.REGION_CACHE_ENABLED = False
+    settings.GEMINI_ADAPTIVE_BATCHING = False
+
+    # 3 to 13 spines per photo; the corner tells the stub which photo it got, a block so downscaling keeps it
+    images, responses = [], {}
+    for i in range(args.images):
+        image, polygons = make_shelf_image(width=args.width, height=args.height, books_per_shelf=3 + (i * 7) % 11, shelves=1, seed=i)
+        image[:64, :64, 0] = i
+        images.append(image)
+        responses[i] = make_roboflow_response(polygons, image.shape[1], image.shape[0])
+    # PNG keeps the corner intact through encoding
+    encoded = [base64.b64encode(cv2.imencode(".png", image)[1]).decode() for image in images]
+
+    total_books = sum(len(response["predictions"]) for response in responses.values())
+    batch_size = settings.BATCH_SIZE
+    print(f"{args.images} photos, {total_books} books, {batch_size} books per Gemini call\n")
+    print(f"{'mode':<14}{'gemini calls':>14}{'batch fill':>12}{'seconds':>10}{'peak MB':>10}")
+
+    for mode, inputs in (("per image", images), ("bulk", images), ("bulk base64", encoded)):
+        service, gemini_client = _make_service(responses, args)
+        elapsed = asyncio.run(_run(service, inputs, mode))
+        fill = total_books / (gemini_client.calls * batch_size)
+        peak = _peak_mb(responses, inputs, mode, args)
+        print(f"{mode:<14}{gemini_client.calls:>14}{fill:>12.0%}{elapsed:>10.2f}{peak:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Measure request coalescing under bursts of identical detection requests
+
+Several clients (dashboard, phone, a scheduled ESP32 trigger) often send the
+same shelf photo at about the same time. Each burst sends one photo from
+several concurrent clients, with request coalescing off and on, through
+stand-in Roboflow and Gemini clients with the usual service latencies. It
+reports the upstream calls made, latency percentiles and the coalesced
+request counter. Run from the API directory:
+
+    python -m benchmarks.bench_coalescing
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import statistics
+import sys
+import time
+from typing import List
+
+import cv2
+import numpy as np
+
+from config import settings
+from services import BookDetectionService, GeminiService, ImageProcessingService
+from services.metrics import COALESCED_REQUESTS
+from .stubs import StubGeminiClient, StubRoboflowClient, make_roboflow_response, make_shelf_image
+
+
+async def _run(args, coalescing: bool) -> dict:
+    settings.REQUEST_COALESCING_ENABLED = coalescing
+    image, polygons = make_shelf_image(books_per_shelf=args.books // 2, shelves=2)
+    roboflow_client = StubRoboflowClient(
+        make_roboflow_response(polygons, image.shape[1], image.shape[0]), latency=args.roboflow_latency
+    )
+    gemini_client = StubGeminiClient(latency=args.gemini_latency)
+    service = BookDetectionService(
+        image_service=ImageProcessingService(client=roboflow_client),
+        gemini_service=GeminiService(client=gemini_client),
+    )
+    # A cached result would answer repeated photos without coalescing
+    service.result_cache = None
+    service.region_cache = None
+
+    async def client(image_b64: str, delay: float) -> float:
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        await service.detect_books_from_base64(image_b64)
+        return time.perf_counter() - started
+
+    rng = np.random.default_rng(0)
+    coalesced = COALESCED_REQUESTS.value()
+    latencies: List[float] = []
+    for burst in range(args.bursts):
+        # A new photo per burst, clients arrive spread over the burst window
+        image[0, 0] = burst
+        image_b64 = base64.b64encode(cv2.imencode(".png", image)[1]).decode("utf-8")
+        delays = rng.uniform(0, args.spread, size=args.clients)
+        latencies.extend(await asyncio.gather(*[client(image_b64, delay) for delay in delays]))
+
+    latencies.sort()
+    return {
+        "roboflow_calls": roboflow_client.calls,
+        "gemini_calls": gemini_client.calls,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "coalesced": int(COALESCED_REQUESTS.value() - coalesced),
+    }
+
+
+async def main(args) -> None:
+    settings.GEMINI_MAX_CONCURRENCY = args.gemini_concurrency
+    print(f"{args.bursts} bursts of {args.clients} identical requests within {args.spread * 1000:.0f} ms\n")
+    print(f"{'coalescing':<12}{'roboflow':>10}{'gemini':>8}{'p50 ms':>9}{'p95 ms':>9}{'coalesced':>11}")
+    for coalescing in (False, True):
+        # Keep the table readable, the services log with print
+        with contextlib.redirect_stdout(sys.stderr):
+            result = await _run(args, coalescing)
+        print(
+            f"{'on' if coalescing else 'off':<12}{result['roboflow_calls']:>10}{result['gemini_calls']:>8}"
+            f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['coalesced']:>11}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=4, help="Identical requests per burst")
+    parser.add_argument("--spread", type=float, default=0.2, help="Seconds over which the requests of a burst arrive")
+    parser.add_argument("--roboflow-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--gemini-concurrency", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
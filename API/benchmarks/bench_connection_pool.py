@@ -0,0 +1,192 @@
+"""Compare Roboflow calls over the shared connection pool with a new connection per call
+
+The inference SDK opens a new HTTP session, and so a new TCP and TLS
+connection, for every call. RoboflowHTTPClient reuses the keep-alive
+connections of the process-wide pool instead. Both send bursts of concurrent
+requests to a local HTTPS stand-in server with a self-signed certificate
+that adds a simulated network round trip time: two for every new connection
+(TCP and TLS 1.3 handshakes) and one per request. Needs the cryptography
+package to create the certificate. Run from the API directory:
+
+    python -m benchmarks.bench_connection_pool
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import ssl
+import statistics
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import httpx
+
+from config import settings
+from services import HTTPClientPool, RoboflowHTTPClient
+from .stubs import make_roboflow_response, make_shelf_image
+
+
+def _self_signed_context() -> ssl.SSLContext:
+    """Server context with a fresh self-signed certificate for 127.0.0.1"""
+    import ipaddress
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .sign(key, hashes.SHA256())
+    )
+
+    with tempfile.NamedTemporaryFile(suffix=".pem") as cert_file, tempfile.NamedTemporaryFile(suffix=".pem") as key_file:
+        cert_file.write(certificate.public_bytes(serialization.Encoding.PEM))
+        key_file.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ))
+        cert_file.flush()
+        key_file.flush()
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert_file.name, key_file.name)
+    return context
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, response: dict, latency: float, rtt: float):
+        self.body = json.dumps(response).encode("utf-8")
+        self.latency = latency
+        self.rtt = rtt
+        self.connections = 0
+        self.context = _self_signed_context()
+        super().__init__(("127.0.0.1", 0), _Handler)
+
+    def get_request(self):
+        sock, address = self.socket.accept()
+        # Handshake in the handler thread, not in the accepting one
+        return self.context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), address
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+        time.sleep(2 * self.server.rtt)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency + self.server.rtt)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def do_HEAD(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _TrustingPool(HTTPClientPool):
+    """The shared pool, trusting the stand-in certificate"""
+
+    def __init__(self, verify: ssl.SSLContext):
+        super().__init__()
+        self.verify = verify
+
+    def _client_args(self) -> dict:
+        return {**super()._client_args(), "verify": self.verify}
+
+
+class _PerCallClient(RoboflowHTTPClient):
+    """Opens a new connection for every call, like the inference SDK"""
+
+    async def infer_async(self, image, model_id=None) -> dict:
+        request = self._request(image, model_id or settings.ROBOFLOW_MODEL_ID)
+        async with httpx.AsyncClient(verify=self.pool.verify) as client:
+            response = await client.post(**request)
+        response.raise_for_status()
+        return response.json()
+
+
+async def _run_bursts(client: RoboflowHTTPClient, image, bursts: int, size: int, pause: float) -> List[float]:
+    async def call() -> float:
+        started = time.perf_counter()
+        await client.infer_async(image)
+        return time.perf_counter() - started
+
+    latencies = []
+    for _ in range(bursts):
+        latencies.extend(await asyncio.gather(*[call() for _ in range(size)]))
+        await asyncio.sleep(pause)
+    return latencies
+
+
+def _summary(latencies: List[float]) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    p99 = latencies[int(0.99 * (len(latencies) - 1))]
+    return f"{statistics.median(latencies) * 1000:>9.1f}{p95 * 1000:>9.1f}{p99 * 1000:>9.1f}"
+
+
+async def main(args) -> None:
+    image, polygons = make_shelf_image(books_per_shelf=args.books // 2, shelves=2)
+    server = _StandInServer(make_roboflow_response(polygons, image.shape[1], image.shape[0]), args.latency, args.rtt)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"https://127.0.0.1:{server.server_address[1]}"
+
+    client_context = ssl.create_default_context()
+    client_context.check_hostname = False
+    client_context.verify_mode = ssl.CERT_NONE
+
+    print(f"{args.bursts} bursts of {args.burst_size} requests, {args.rtt * 1000:.0f} ms round trip\n")
+    print(f"{'client':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'connections':>13}")
+
+    settings.HTTP_MAX_CONNECTIONS = max(settings.HTTP_MAX_CONNECTIONS, args.burst_size)
+    settings.HTTP_MAX_KEEPALIVE_CONNECTIONS = max(settings.HTTP_MAX_KEEPALIVE_CONNECTIONS, args.burst_size)
+    for name, warm in (("new connection", None), ("pool, cold", False), ("pool, warmed up", True)):
+        pool = _TrustingPool(client_context)
+        client_class = _PerCallClient if warm is None else RoboflowHTTPClient
+        client = client_class(api_url=url, api_key="benchmark", pool=pool)
+        if warm:
+            await pool.warm_up([url], connections=args.burst_size)
+
+        connections = server.connections
+        latencies = await _run_bursts(client, image, args.bursts, args.burst_size, args.pause)
+        print(f"{name:<22}{_summary(latencies)}{server.connections - connections:>13}")
+        await pool.aclose()
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20, help="Spines in the synthetic shelf image")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=16, help="Concurrent requests per burst")
+    parser.add_argument("--pause", type=float, default=0.5, help="Seconds between bursts")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stand-in server processing time in seconds")
+    parser.add_argument("--rtt", type=float, default=0.04, help="Simulated network round trip time in seconds")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+"""Compare the remote Roboflow detector with the local ONNX Runtime backend
+
+The remote path runs the RoboflowHTTPClient of the remote backend, on the
+shared connection pool, against a local stand-in server that answers like
+detect.roboflow.com after a configurable delay, so the client's encoding,
+upload and mask rasterization are all measured. The
+local path runs only when an exported segmentation model is given, as
+onnxruntime is an optional dependency. Run from the API directory:
+
+    python -m benchmarks.bench_detector_backends
+    python -m benchmarks.bench_detector_backends --onnx-model models/bookshelf-seg.onnx
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import settings
+from services import DetectorBackend, OnnxDetector, RoboflowDetector, RoboflowHTTPClient
+from .stubs import make_roboflow_response, make_shelf_image
+
+
+def start_stand_in_server(response: dict, latency: float) -> ThreadingHTTPServer:
+    """Serve the canned Roboflow response on a free local port"""
+    body = json.dumps(response).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, as the pooled client reuses its connections
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _measure_latency(detector: DetectorBackend, image, repeats: int) -> dict:
+    detector.detect(image)  # warm-up
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        detections = detector.detect(image)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    return {
+        "detections": len(detections),
+        "p50_ms": round(statistics.median(timings) * 1000, 1),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))] * 1000, 1),
+    }
+
+
+async def _measure_throughput(detector: DetectorBackend, image, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def detect():
+        async with semaphore:
+            await detector.detect_async(image)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[detect() for _ in range(requests)])
+    return round(requests / (time.perf_counter() - started), 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20, help="Spines in the synthetic shelf image")
+    parser.add_argument("--remote-latency", type=float, default=0.3, help="Stand-in server delay in seconds")
+    parser.add_argument("--repeats", type=int, default=20, help="Sequential calls per backend")
+    parser.add_argument("--requests", type=int, default=40, help="Concurrent calls per backend")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--onnx-model", help="Exported YOLOv8-style segmentation model")
+    args = parser.parse_args()
+
+    image, polygons = make_shelf_image(books_per_shelf=args.books // 2, shelves=2)
+    server = start_stand_in_server(
+        make_roboflow_response(polygons, image.shape[1], image.shape[0]),
+        args.remote_latency,
+    )
+
+    client = RoboflowHTTPClient(api_url=f"http://127.0.0.1:{server.server_address[1]}", api_key="benchmark")
+    detectors = {"roboflow (stand-in)": RoboflowDetector(client)}
+    if args.onnx_model:
+        detectors["onnx"] = OnnxDetector(args.onnx_model)
+    else:
+        print("Pass --onnx-model to benchmark the local backend\n")
+
+    print(f"{'backend':<22}{'detections':>11}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}")
+    for name, detector in detectors.items():
+        latency = _measure_latency(detector, image, args.repeats)
+        throughput = asyncio.run(_measure_throughput(detector, image, args.requests, args.concurrency))
+        print(
+            f"{name:<22}{latency['detections']:>11}{latency['p50_ms']:>10}"
+            f"{latency['p95_ms']:>10}{throughput:>10}"
+        )
+
+    server.shutdown()
+    print(f"\nONNX workers: {settings.ONNX_WORKERS}, intra-op threads: {settings.ONNX_INTRA_OP_THREADS}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Micro-benchmark for ImageProcessingService.extract_book_regions
+
+Compares the current implementation, working on masks cropped to their
+boxes, with the original full-frame version on synthetic images, and the
+memory held by the cropped masks with N full frame masks. Also checks that
+degenerate predictions (under 3 points, or outside the frame) are dropped
+with their detection, so regions stay aligned with the boxes. Run from the
+API directory:
+
+    python -m benchmarks.bench_extract_regions --width 3840 --height 2160 --books 60
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from services import ImageProcessingService
+from services.masks import CROPPED_MASK_KEY, CroppedMask, detections_from_inference, drop_empty_masks
+from .stubs import make_roboflow_response, make_shelf_image
+
+
+def legacy_extract_book_regions(image: np.ndarray, detections: sv.Detections):
+    """The original implementation, scanning every full-frame mask twice"""
+    masks_isolated = []
+    polygons = [sv.mask_to_polygons(mask) for mask in detections.mask]
+
+    for mask in detections.mask:
+        y_indices, x_indices = np.where(mask)
+        if len(y_indices) == 0 or len(x_indices) == 0:
+            continue
+
+        x_min, x_max = np.min(x_indices), np.max(x_indices)
+        y_min, y_max = np.min(y_indices), np.max(y_indices)
+        roi = image[y_min:y_max+1, x_min:x_max+1].copy()
+        cropped_mask = mask[y_min:y_max+1, x_min:x_max+1]
+        roi[~cropped_mask] = [0, 0, 0]
+        masks_isolated.append(roi)
+
+    processed_regions = [cv2.rotate(region, cv2.ROTATE_90_COUNTERCLOCKWISE) for region in masks_isolated]
+    return processed_regions, polygons
+
+
+def make_detections(width: int, height: int, books: int, seed: int = 0):
+    """The image with the same detections twice, with full frame masks and with cropped masks"""
+    shelves = max(1, books // 20)
+    image, polygons = make_shelf_image(width, height, books_per_shelf=books // shelves, shelves=shelves, seed=seed)
+
+    masks = np.zeros((len(polygons), height, width), dtype=bool)
+    cropped_masks = []
+    xyxy = np.zeros((len(polygons), 4), dtype=np.float32)
+    for i, polygon in enumerate(polygons):
+        points = np.array(polygon, dtype=np.int32)
+        # Slightly skewed spines so the masks are not plain rectangles
+        points[1:3, 0] += 6
+        mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(mask, [points], 1)
+        masks[i] = mask.astype(bool)
+        cropped_masks.append(CroppedMask.from_polygon(points, (width, height)))
+        xyxy[i] = [points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()]
+
+    class_id = np.zeros(len(polygons), dtype=int)
+    return (
+        image,
+        sv.Detections(xyxy=xyxy, mask=masks, class_id=class_id),
+        sv.Detections(xyxy=xyxy, class_id=class_id, data={CROPPED_MASK_KEY: cropped_masks}),
+    )
+
+
+def check_degenerate_predictions(service: ImageProcessingService, width: int, height: int) -> int:
+    """Extract regions for a response with degenerate predictions mixed in, return how many were dropped"""
+    image, polygons = make_shelf_image(width, height, books_per_shelf=10, shelves=2)
+    response = make_roboflow_response(polygons, width, height)
+    degenerate = [
+        {**response["predictions"][0], "detection_id": "two-points", "points": response["predictions"][0]["points"][:2]},
+        {**response["predictions"][0], "detection_id": "outside", "points": [
+            {"x": width + 10.0, "y": 10.0}, {"x": width + 50.0, "y": 10.0}, {"x": width + 50.0, "y": 90.0},
+        ]},
+    ]
+    response["predictions"][3:3] = degenerate[:1]
+    response["predictions"].append(degenerate[1])
+
+    detections = drop_empty_masks(detections_from_inference(response))
+    regions, region_polygons = service.extract_book_regions(image, detections)
+    assert len(detections) == len(regions) == len(region_polygons) == len(polygons), "regions not aligned"
+    for region, (x_min, y_min, x_max, y_max) in zip(regions, detections.xyxy):
+        # Regions are rotated, their height is the box width
+        assert abs(region.shape[0] - (x_max - x_min)) <= 2 and abs(region.shape[1] - (y_max - y_min)) <= 2, "region of another box"
+    return len(response["predictions"]) - len(detections)
+
+
+def _time(function, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(args) -> None:
+    image, detections, cropped_detections = make_detections(args.width, args.height, args.books)
+    service = ImageProcessingService(client=object())
+
+    legacy_regions, _ = legacy_extract_book_regions(image, detections)
+    regions, _ = service.extract_book_regions(image, cropped_detections)
+    assert all(np.array_equal(a, b) for a, b in zip(legacy_regions, regions)), "regions differ"
+
+    legacy = _time(lambda: legacy_extract_book_regions(image, detections), args.repeats)
+    current = _time(lambda: service.extract_book_regions(image, cropped_detections), args.repeats)
+
+    dropped = check_degenerate_predictions(service, args.width, args.height)
+
+    print({
+        "image": f"{args.width}x{args.height}",
+        "masks": len(detections),
+        "legacy_ms": round(legacy * 1000, 1),
+        "current_ms": round(current * 1000, 1),
+        "speedup": round(legacy / current, 1),
+        "full_frame_masks_mb": round(detections.mask.nbytes / 2**20, 1),
+        "cropped_masks_mb": round(sum(mask.mask.nbytes for mask in cropped_detections.data[CROPPED_MASK_KEY]) / 2**20, 1),
+        "degenerate_predictions_dropped": dropped,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--books", type=int, default=60)
+    parser.add_argument("--repeats", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,149 @@
+"""Gemini batch scheduler under injected failures
+
+Runs the same spines against a local fake client that rate limits, returns
+server errors, malformed JSON and truncated answers: once through fixed
+concurrent batches without retries (the previous behavior) and once through
+GeminiBatchScheduler. Requests arrive at a steady interval, like scans from
+several clients. Run from the API directory:
+
+    python -m benchmarks.bench_gemini_scheduler
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from config import settings
+from models import ProcessingResult
+from services import GeminiService
+from services.gemini_scheduler import GeminiBatchScheduler
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class FailingGeminiClient:
+    """Async stand-in for genai.Client that injects rate limits and bad answers"""
+
+    def __init__(self, args, seed: int = 0):
+        self.args = args
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self.generate_content))
+
+    def _rate_limited(self) -> bool:
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start, self._window_calls = now, 0
+        self._window_calls += 1
+        return self._window_calls > self.args.calls_per_second
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        images = sum(1 for part in contents[0].parts if getattr(part, "inline_data", None) is not None)
+
+        if self._rate_limited():
+            await asyncio.sleep(0.01)
+            raise FakeAPIError(429, "Resource exhausted")
+
+        await asyncio.sleep(self.args.base_latency + self.args.per_image_latency * images)
+
+        roll = self._random.random()
+        if roll < self.args.server_error_rate:
+            raise FakeAPIError(503, "Service unavailable")
+        roll -= self.args.server_error_rate
+        if roll < self.args.malformed_rate:
+            return SimpleNamespace(text="Sorry, I can't help with that")
+        roll -= self.args.malformed_rate
+
+        books = [{"title": f"Title {i}", "author": f"Author {i}"} for i in range(images)]
+        if roll < self.args.truncated_rate:
+            books = books[:images // 2]
+        return SimpleNamespace(text=json.dumps(books))
+
+
+class FixedBatches:
+    """The previous behavior: fixed BATCH_SIZE chunks where any failure becomes unknown books"""
+
+    def __init__(self, gemini_service: GeminiService):
+        self.gemini_service = gemini_service
+        self.semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+
+    async def _run_batch(self, batch):
+        async with self.semaphore:
+            try:
+                return await self.gemini_service.process_book_regions_async(batch)
+            except Exception:
+                return [ProcessingResult(title="Title Unknown", author="Author Unknown") for _ in batch]
+
+    async def process(self, regions):
+        size = settings.BATCH_SIZE
+        results = await asyncio.gather(*[
+            self._run_batch(regions[i:i + size]) for i in range(0, len(regions), size)
+        ])
+        return [book for batch in results for book in batch]
+
+    def get_stats(self) -> dict:
+        return {}
+
+
+async def run(args, adaptive: bool) -> dict:
+    settings.GEMINI_MOSAIC_MODE = False
+    settings.GEMINI_MAX_RETRIES = args.max_retries
+    settings.GEMINI_BACKOFF_BASE = args.backoff_base
+
+    client = FailingGeminiClient(args)
+    gemini_service = GeminiService(client=client)
+    scheduler = GeminiBatchScheduler(gemini_service) if adaptive else FixedBatches(gemini_service)
+    regions = [np.full((40, 200, 3), i % 255, dtype=np.uint8) for i in range(args.books)]
+    requests = [regions[i:i + args.books_per_request] for i in range(0, len(regions), args.books_per_request)]
+
+    async def arrive(number, request):
+        await asyncio.sleep(number * args.arrival_interval)
+        return await scheduler.process(request)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*[arrive(number, request) for number, request in enumerate(requests)])
+    elapsed = time.perf_counter() - started
+
+    books = [book for request in results for book in request]
+    valid = sum(book.title != "Title Unknown" and book.author != "Author Unknown" for book in books)
+    return {
+        "mode": "adaptive" if adaptive else "fixed",
+        "books": len(books),
+        "seconds": round(elapsed, 2),
+        "valid_books_per_second": round(valid / elapsed, 1),
+        "valid_book_rate": round(valid / len(books), 4),
+        "gemini_calls": client.calls,
+        **scheduler.get_stats(),
+    }
+
+
+async def main(args) -> None:
+    print(await run(args, adaptive=False))
+    print(await run(args, adaptive=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=400)
+    parser.add_argument("--books-per-request", type=int, default=40)
+    parser.add_argument("--calls-per-second", type=int, default=3)
+    parser.add_argument("--base-latency", type=float, default=0.3)
+    parser.add_argument("--per-image-latency", type=float, default=0.05)
+    parser.add_argument("--server-error-rate", type=float, default=0.05)
+    parser.add_argument("--malformed-rate", type=float, default=0.05)
+    parser.add_argument("--truncated-rate", type=float, default=0.05)
+    parser.add_argument("--arrival-interval", type=float, default=1.0)
+    parser.add_argument("--max-retries", type=int, default=4)
+    parser.add_argument("--backoff-base", type=float, default=0.25)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""Compare detection on full resolution photos with the downscaled and tiled paths
+
+Large phone photos used to be sent to Roboflow at their native resolution.
+Now detection runs on a copy whose longer side is DETECTION_MAX_DIMENSION and
+only the crops are taken at full resolution, and panoramas are detected in
+overlapping square tiles. For
+synthetic 12, 24 and 48 MP photos and a panorama this runs the pipeline up to
+the Gemini call both ways and reports latency, peak traced memory and how
+many books were found. Run from the API directory:
+
+    python -m benchmarks.bench_large_images
+"""
+import argparse
+import asyncio
+import contextlib
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+
+from config import settings
+from services import BookDetectionService, GeminiService, ImageProcessingService
+from .stubs import StubGeminiClient, StubRoboflowClient, make_roboflow_response, make_shelf_image, scale_roboflow_response
+
+PHOTOS = [(4032, 3024), (5664, 4248), (8000, 6000)]
+# Panorama of 2000 px high units, tiled with 50% overlap every tile sees the same two units
+PANORAMA_UNIT = (1000, 2000)
+PANORAMA_UNITS = 6
+
+
+class _TileRoboflowClient(StubRoboflowClient):
+    """Answers square tiles with the tile response and anything else with the full panorama"""
+
+    def __init__(self, response: dict, tile_response: dict):
+        super().__init__(response, latency=0.0)
+        self.tile_response = tile_response
+
+    def respond(self, image) -> dict:
+        height, width = image.shape[:2]
+        return scale_roboflow_response(self.tile_response if width == height else self.response, width, height)
+
+
+def _photo(width: int, height: int) -> Tuple[bytes, StubRoboflowClient, int]:
+    image, polygons = make_shelf_image(width, height, books_per_shelf=20, shelves=2)
+    client = StubRoboflowClient(make_roboflow_response(polygons, width, height), latency=0.0)
+    return cv2.imencode(".jpg", image)[1].tobytes(), client, len(polygons)
+
+
+def _panorama() -> Tuple[bytes, StubRoboflowClient, int]:
+    unit_width, height = PANORAMA_UNIT
+    unit, polygons = make_shelf_image(unit_width, height, books_per_shelf=7, shelves=2, seed=1)
+    image = np.tile(unit, (1, PANORAMA_UNITS, 1))
+
+    def shifted(units: int) -> List:
+        return [[(x + k * unit_width, y) for x, y in polygon] for k in range(units) for polygon in polygons]
+
+    client = _TileRoboflowClient(
+        make_roboflow_response(shifted(PANORAMA_UNITS), image.shape[1], height),
+        make_roboflow_response(shifted(2), height, height),
+    )
+    return cv2.imencode(".jpg", image)[1].tobytes(), client, len(polygons) * PANORAMA_UNITS
+
+
+async def _measure(image_bytes: bytes, client: StubRoboflowClient, repeats: int) -> Tuple[float, float, int]:
+    service = BookDetectionService(
+        image_service=ImageProcessingService(client=client),
+        gemini_service=GeminiService(client=StubGeminiClient(0.0)),
+    )
+    service.result_cache = None
+
+    async def prepare() -> int:
+        image = service.image_service.decode_image_bytes(image_bytes)
+        _, _, _, regions, _ = await service._prepare_image(image)
+        return len(regions)
+
+    books = await prepare()
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await prepare()
+        latencies.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    await prepare()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(latencies), peak, books
+
+
+async def main(args) -> None:
+    settings.DETECTION_TILE_OVERLAP = 0.5
+    cases = [(f"{w}x{h} ({w * h / 1e6:.0f} MP)", _photo(w, h)) for w, h in PHOTOS]
+    cases.append((f"panorama ({PANORAMA_UNIT[0] * PANORAMA_UNITS}x{PANORAMA_UNIT[1]})", _panorama()))
+
+    modes = [
+        ("full resolution", {"DETECTION_MAX_DIMENSION": 0, "DETECTION_TILING": False}),
+        ("downscaled", {"DETECTION_MAX_DIMENSION": args.max_dimension, "DETECTION_TILING": False}),
+        ("downscaled, tiled", {"DETECTION_MAX_DIMENSION": args.max_dimension, "DETECTION_TILING": True}),
+    ]
+
+    print(f"{'image':<28}{'mode':<20}{'p50 ms':>9}{'peak MB':>10}{'books':>7}{'expected':>10}")
+    for name, (image_bytes, client, expected) in cases:
+        for mode, overrides in modes:
+            for key, value in overrides.items():
+                setattr(settings, key, value)
+            # Keep the table readable, the services log with print
+            with contextlib.redirect_stdout(sys.stderr):
+                latency, peak, books = await _measure(image_bytes, client, args.repeats)
+            print(f"{name:<28}{mode:<20}{latency * 1000:>9.1f}{peak / 2**20:>10.1f}{books:>7}{expected:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--max-dimension", type=int, default=settings.DETECTION_MAX_DIMENSION)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,223 @@
+"""Offline benchmark of the full detect_books_from_base64 pipeline
+
+Replays fixtures through stand-in Roboflow and Gemini clients, so no
+credentials or network are needed. By default synthetic fixtures are
+generated for a grid of image sizes and book counts; pass recorded fixtures
+(see benchmarks.fixtures) with --fixtures to replay real photos. Service
+latencies are left out unless --with-latency is given, so the numbers show
+the work done by this process.
+
+For every fixture it reports throughput, p50/p95 latency of the whole call
+and of every pipeline stage, and peak traced memory, as JSON that can be
+saved with --output and diffed against an earlier run with --compare:
+
+    python -m benchmarks.bench_pipeline --output before.json
+    python -m benchmarks.bench_pipeline --compare before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from config import settings
+from services import BookDetectionService, GeminiService, ImageProcessingService
+from services.metrics import STAGE_SECONDS
+from .fixtures import load_fixture, make_fixture
+from .stubs import StubGeminiClient, StubRoboflowClient
+
+SIZES = [(1280, 720), (1920, 1080), (4032, 3024)]
+BOOK_COUNTS = [10, 40, 80]
+
+# Gemini batches overlap, the gemini stage already covers their wall time
+_SKIPPED_STAGES = {"gemini_batch"}
+
+
+def _create_service(fixture: dict, with_latency: bool) -> BookDetectionService:
+    roboflow, gemini = fixture["roboflow"], fixture["gemini"]
+    service = BookDetectionService(
+        image_service=ImageProcessingService(
+            client=StubRoboflowClient(roboflow["response"], roboflow["latency"] if with_latency else 0.0)
+        ),
+        gemini_service=GeminiService(
+            client=StubGeminiClient(gemini["latency"] if with_latency else 0.0, books=gemini["books"])
+        ),
+    )
+    # Every request sends the same image, measure the pipeline rather than the caches
+    service.result_cache = None
+    service.region_cache = None
+    return service
+
+
+class _StageRecorder:
+    """Collects the STAGE_SECONDS observations of the request being measured"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = defaultdict(float)
+        self._observe = STAGE_SECONDS.observe
+
+    def __enter__(self) -> "_StageRecorder":
+        def observe(value: float, **labels: str) -> None:
+            self._observe(value, **labels)
+            if labels.get("stage") not in _SKIPPED_STAGES:
+                self.stages[labels.get("stage")] += value
+
+        STAGE_SECONDS.observe = observe
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        del STAGE_SECONDS.observe
+
+
+def _percentiles(values: List[float]) -> dict:
+    milliseconds = np.array(values) * 1000
+    return {
+        "p50": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95": round(float(np.percentile(milliseconds, 95)), 3),
+    }
+
+
+async def run_fixture(fixture: dict, requests: int, warmup: int, with_latency: bool) -> dict:
+    service = _create_service(fixture, with_latency)
+    image_b64 = fixture["image"]
+
+    for _ in range(warmup):
+        await service.detect_books_from_base64(image_b64)
+
+    latencies, stages = [], defaultdict(list)
+    started = time.perf_counter()
+    for _ in range(requests):
+        with _StageRecorder() as recorder:
+            request_started = time.perf_counter()
+            annotations = await service.detect_books_from_base64(image_b64)
+            latencies.append(time.perf_counter() - request_started)
+        for stage, seconds in recorder.stages.items():
+            stages[stage].append(seconds)
+    elapsed = time.perf_counter() - started
+
+    # Tracing slows allocations down, measure memory in a separate request
+    tracemalloc.start()
+    await service.detect_books_from_base64(image_b64)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    response = fixture["roboflow"]["response"]
+    return {
+        "name": fixture["name"],
+        "width": response["image"]["width"],
+        "height": response["image"]["height"],
+        "books": len(annotations),
+        "requests": requests,
+        "requests_per_second": round(requests / elapsed, 3),
+        "books_per_second": round(requests * len(annotations) / elapsed, 1),
+        "latency_ms": {**_percentiles(latencies), "mean": round(float(np.mean(latencies)) * 1000, 3)},
+        "stages_ms": {stage: _percentiles(values) for stage, values in sorted(stages.items())},
+        "peak_memory_mb": round(peak / 2**20, 2),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _print_table(results: List[dict]) -> None:
+    stage_names = sorted({stage for result in results for stage in result["stages_ms"]})
+    print(f"{'fixture':<28}{'books':>6}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'peak MB':>9}", file=sys.stderr)
+    for result in results:
+        latency = result["latency_ms"]
+        print(
+            f"{result['name']:<28}{result['books']:>6}{result['requests_per_second']:>8.2f}"
+            f"{latency['p50']:>9.1f}{latency['p95']:>9.1f}{result['peak_memory_mb']:>9.1f}",
+            file=sys.stderr,
+        )
+        stages = ", ".join(
+            f"{stage} {result['stages_ms'][stage]['p50']:.1f}" for stage in stage_names if stage in result["stages_ms"]
+        )
+        print(f"  p50 ms by stage: {stages}", file=sys.stderr)
+
+
+def _print_comparison(baseline: dict, report: dict) -> None:
+    """Relative change of every fixture found in both runs, negative is faster or smaller"""
+    previous = {result["name"]: result for result in baseline["results"]}
+    print(f"\nCompared with {baseline['metadata']['commit']}:", file=sys.stderr)
+    print(f"{'fixture':<28}{'p50':>9}{'p95':>9}{'peak MB':>9}", file=sys.stderr)
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old:+.1%}" if old else "n/a"
+
+    for result in report["results"]:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        print(
+            f"{result['name']:<28}"
+            f"{change(result['latency_ms']['p50'], old['latency_ms']['p50']):>9}"
+            f"{change(result['latency_ms']['p95'], old['latency_ms']['p95']):>9}"
+            f"{change(result['peak_memory_mb'], old['peak_memory_mb']):>9}",
+            file=sys.stderr,
+        )
+
+
+async def main(args) -> None:
+    settings.GEMINI_MAX_CONCURRENCY = args.gemini_concurrency
+    # The Gemini stand-in answers one book per image part
+    settings.GEMINI_MOSAIC_MODE = False
+
+    if args.fixtures:
+        fixtures = [load_fixture(path) for path in args.fixtures]
+    else:
+        fixtures = [make_fixture(width, height, books) for width, height in SIZES for books in BOOK_COUNTS]
+
+    results = []
+    # Keep stdout for the report, the services log with print
+    with contextlib.redirect_stdout(sys.stderr):
+        for fixture in fixtures:
+            results.append(await run_fixture(fixture, args.requests, args.warmup, args.with_latency))
+            print(f"Finished {fixture['name']}")
+
+    report = {
+        "metadata": {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "with_latency": args.with_latency,
+        },
+        "results": results,
+    }
+
+    _print_table(results)
+    if args.compare:
+        with open(args.compare) as f:
+            _print_comparison(json.load(f), report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", nargs="+", help="Recorded fixture files, synthetic fixtures are used otherwise")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--with-latency", action="store_true", help="Replay the recorded service latencies")
+    parser.add_argument("--gemini-concurrency", type=int, default=32)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="Earlier JSON report to compare with")
+    asyncio.run(main(parser.parse_args()))
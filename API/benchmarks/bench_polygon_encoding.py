@@ -0,0 +1,109 @@
+"""Compare response sizes and serialization time of the polygon encodings
+
+Builds a detection response for a shelf photo full of books whose polygons
+are traced from slightly ragged, rotated spine masks with supervision, like
+the masks coming back from the detector, and serializes it with every
+polygon format, with and without Douglas-Peucker simplification. Run from
+the API directory:
+
+    python -m benchmarks.bench_polygon_encoding
+"""
+import argparse
+import gzip
+import json
+import time
+
+import cv2
+import numpy as np
+import supervision as sv
+
+from models import BookAnnotation, BookDetectionResponse, Shelf
+from services import PolygonEncoding
+from services.polygon_encoding import POLYGON_FORMATS
+
+
+def make_response(books: int, shelves: int, seed: int = 0) -> BookDetectionResponse:
+    """A response whose polygons are traced from rotated, ragged spine masks"""
+    rng = np.random.default_rng(seed)
+    per_shelf = books // shelves
+    result = []
+    for shelf in range(shelves):
+        annotations = []
+        for book in range(per_shelf):
+            width, height = rng.uniform(25, 60), rng.uniform(250, 400)
+            center = (40 + book * 70, 220 + shelf * 450)
+            corners = cv2.boxPoints((center, (width, height), rng.uniform(-8, 8)))
+            # Jitter the outline so the traced contour has many points, like a predicted mask
+            outline = np.concatenate([
+                np.linspace(corners[i], corners[(i + 1) % 4], 40, endpoint=False) for i in range(4)
+            ])
+            outline += rng.normal(0, 1.2, outline.shape)
+
+            mask = np.zeros((shelves * 450, per_shelf * 70 + 80), dtype=np.uint8)
+            cv2.fillPoly(mask, [np.rint(outline).astype(np.int32)], 1)
+            polygons = sv.mask_to_polygons(mask.astype(bool))
+            x, y, w, h = cv2.boundingRect(mask)
+
+            annotations.append(BookAnnotation(
+                title=f"Title {shelf}-{book}",
+                author="Author",
+                polygons=[polygon.astype(np.float64).tolist() for polygon in polygons],
+                xyxy=[float(x), float(y), float(x + w), float(y + h)],
+            ))
+        result.append(Shelf(shelf_id=shelf + 1, annotations=annotations))
+    return BookDetectionResponse(shelves=result)
+
+
+def _serialize(response: BookDetectionResponse, encoding: PolygonEncoding, repeats: int):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        body = response.model_dump_json(context={"encode_polygons": encoding.encode})
+        timings.append(time.perf_counter() - started)
+    return min(timings), body.encode()
+
+
+def _parse_seconds(body: bytes, repeats: int) -> float:
+    """Time a client takes to parse the body"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        json.loads(body)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--shelves", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    response = make_response(args.books, args.shelves)
+    points = sum(len(polygon) for shelf in response.shelves for a in shelf.annotations for polygon in a.polygons)
+    print(f"{args.books} books, {points} polygon points\n")
+
+    started = time.perf_counter()
+    for _ in range(args.repeats):
+        baseline = response.model_dump_json().encode()
+    baseline_seconds = (time.perf_counter() - started) / args.repeats
+
+    print(f"{'encoding':<18}{'bytes':>9}{'gzip':>8}{'smaller':>9}{'dump ms':>9}{'parse ms':>10}")
+    print(
+        f"{'default':<18}{len(baseline):>9}{len(gzip.compress(baseline)):>8}{1.0:>8.1f}x"
+        f"{baseline_seconds * 1000:>9.2f}{_parse_seconds(baseline, args.repeats) * 1000:>10.2f}"
+    )
+    for tolerance in (0.0, 1.0, 2.0):
+        for polygon_format in POLYGON_FORMATS:
+            seconds, body = _serialize(response, PolygonEncoding(polygon_format, tolerance), args.repeats)
+            name = polygon_format + (f" simplify={tolerance:g}" if tolerance else "")
+            print(
+                f"{name:<18}{len(body):>9}{len(gzip.compress(body)):>8}"
+                f"{len(baseline) / len(body):>8.1f}x{seconds * 1000:>9.2f}"
+                f"{_parse_seconds(body, args.repeats) * 1000:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
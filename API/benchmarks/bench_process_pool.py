@@ -0,0 +1,133 @@
+"""Compare the local pipeline stages in threads with the process pool
+
+With PROCESS_POOL_WORKERS set, decoding, region extraction and the JPEG
+encoding of the crops run in worker processes, with frames and crops handed
+over through shared memory. This runs those stages for bursts of concurrent
+synthetic 12 MP shelf photos, the way the pipeline does, once in the
+default thread pool and once per pool size, and reports throughput, the
+speedup over threads and how late a 5 ms event loop timer fires meanwhile.
+It also times handing a frame to a worker and back, pickled and through
+shared memory. Scaling depends on the cores of the machine. Run from the
+API directory:
+
+    python -m benchmarks.bench_process_pool
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import settings
+from services import GeminiService, ImageProcessingService, NoDetector, ProcessWorkerPool
+from services.masks import detections_from_inference
+from services.process_pool import receive_arrays, share_arrays
+from .stubs import StubGeminiClient, make_roboflow_response, make_shelf_image
+
+
+def _echo(image: np.ndarray) -> np.ndarray:
+    return image
+
+
+def _echo_shared(shared):
+    block, shared_copy = share_arrays(receive_arrays(shared))
+    block.close()
+    return shared_copy
+
+
+def _handoff(image: np.ndarray, repeats: int) -> Tuple[float, float]:
+    """Median round trip of a frame to a worker, pickled and through shared memory"""
+    with ProcessPoolExecutor(1) as executor:
+        executor.submit(_echo, image[:1]).result()
+        pickled = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            executor.submit(_echo, image).result()
+            pickled.append(time.perf_counter() - started)
+
+        shared = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            block, description = share_arrays([image])
+            block.close()
+            receive_arrays(executor.submit(_echo_shared, description).result())
+            shared.append(time.perf_counter() - started)
+    return statistics.median(pickled), statistics.median(shared)
+
+
+async def _loop_lag(stop: asyncio.Event, lags: List[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.005)
+        lags.append(time.perf_counter() - started - 0.005)
+
+
+async def _run(pool: Optional[ProcessWorkerPool], image_bytes: bytes, response: dict, images: int) -> Tuple[float, float]:
+    image_service = ImageProcessingService(detector=NoDetector(), process_pool=pool)
+    gemini_service = GeminiService(client=StubGeminiClient(0.0), process_pool=pool)
+    loop = asyncio.get_running_loop()
+
+    async def process() -> None:
+        image = await loop.run_in_executor(None, image_service.decode_image_bytes, image_bytes)
+        detections = await loop.run_in_executor(None, detections_from_inference, response)
+        regions, _ = await loop.run_in_executor(None, image_service.extract_book_regions, image, detections)
+        await loop.run_in_executor(None, gemini_service._prepare_image_parts, regions)
+
+    await process()
+    stop, lags = asyncio.Event(), []
+    ticker = asyncio.create_task(_loop_lag(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*[process() for _ in range(images)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    lags.sort()
+    return images / elapsed, lags[int(0.99 * (len(lags) - 1))] if lags else 0.0
+
+
+async def main(args) -> None:
+    # Without a pool the services must not pick up the shared one either
+    settings.PROCESS_POOL_WORKERS = 0
+    image, polygons = make_shelf_image(args.width, args.height, books_per_shelf=args.books // 2, shelves=2)
+    image_bytes = cv2.imencode(".jpg", image)[1].tobytes()
+    response = make_roboflow_response(polygons, args.width, args.height)
+
+    pickled, shared = _handoff(image, args.repeats)
+    print(f"Handing a {args.width}x{args.height} frame to a worker and back: "
+          f"pickled {pickled * 1000:.1f} ms, shared memory {shared * 1000:.1f} ms\n")
+
+    print(f"{os.cpu_count()} cores, {args.images} concurrent {args.width}x{args.height} photos with {args.books} books\n")
+    print(f"{'mode':<20}{'images/s':>10}{'speedup':>9}{'loop lag p99 ms':>17}")
+    with contextlib.redirect_stdout(sys.stderr):
+        baseline, lag = await _run(None, image_bytes, response, args.images)
+    print(f"{'threads':<20}{baseline:>10.2f}{1.0:>9.2f}{lag * 1000:>17.1f}")
+
+    for workers in args.workers:
+        pool = ProcessWorkerPool(workers)
+        pool.warm_up()
+        with contextlib.redirect_stdout(sys.stderr):
+            throughput, lag = await _run(pool, image_bytes, response, args.images)
+        pool.shutdown()
+        print(f"{f'{workers} processes':<20}{throughput:>10.2f}{throughput / baseline:>9.2f}{lag * 1000:>17.1f}")
+
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--books", type=int, default=40)
+    parser.add_argument("--images", type=int, default=16, help="Photos processed concurrently")
+    parser.add_argument("--repeats", type=int, default=5, help="Frame handoffs timed")
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=sorted({2 ** i for i in range(cores.bit_length())} | {cores}),
+        help="Pool sizes to compare",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,131 @@
+"""Benchmark shelf grouping on synthetic bookcases with thousands of books
+
+Compares the previous single-pass grouping, which only checked each book
+against the last book of the current shelf, with the sweep-line engine in
+services.shelf_grouping. Layouts include tall books leaning past the shelf
+above, short books among tall ones, stacks of books lying on each other and
+photos taken at an angle. A shelf counts as recovered when exactly its books
+were grouped together. Run from the API directory:
+
+    python -m benchmarks.bench_shelf_grouping
+"""
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from services.shelf_grouping import group_boxes_into_shelves
+
+
+def make_layout(
+    shelves: int,
+    books_per_shelf: int,
+    tall_fraction: float = 0.0,
+    short_fraction: float = 0.0,
+    stacked_fraction: float = 0.0,
+    tilt_degrees: float = 0.0,
+    seed: int = 0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Boxes of a synthetic bookcase and the shelf of every book"""
+    rng = np.random.default_rng(seed)
+    shelf_height = 300.0
+    boxes, labels = [], []
+    for shelf in range(shelves):
+        bottom = (shelf + 1) * shelf_height
+        widths = rng.uniform(15, 45, size=books_per_shelf)
+        # Some places hold a stack of books lying on each other instead of a standing book
+        stacked = rng.random(books_per_shelf) < stacked_fraction if stacked_fraction > 0 else np.zeros(books_per_shelf, bool)
+        widths[stacked] = rng.uniform(150, 220, size=stacked.sum())
+        lefts = np.concatenate([[0.0], np.cumsum(widths + 2)[:-1]])
+        heights = rng.uniform(0.55, 0.9, size=books_per_shelf) * shelf_height
+        tall = rng.random(books_per_shelf) < tall_fraction
+        heights[tall] = rng.uniform(1.1, 1.4, size=tall.sum()) * shelf_height
+        short = ~tall & (rng.random(books_per_shelf) < short_fraction)
+        heights[short] = rng.uniform(0.1, 0.2, size=short.sum()) * shelf_height
+        y2 = bottom - rng.uniform(0, 6, size=books_per_shelf)
+        standing = ~stacked
+        boxes.append(np.column_stack([lefts, y2 - heights, lefts + widths, y2])[standing])
+        labels.append(np.full(standing.sum(), shelf))
+
+        for left, width, stack_bottom in zip(lefts[stacked], widths[stacked], y2[stacked]):
+            for _ in range(rng.integers(2, 6)):
+                thickness = rng.uniform(25, 45)
+                x1 = left + rng.uniform(0, 15)
+                boxes.append(np.array([[x1, stack_bottom - thickness, x1 + width - rng.uniform(0, 30), stack_bottom]]))
+                labels.append(np.array([shelf]))
+                stack_bottom -= thickness + rng.uniform(0, 2)
+
+    boxes, labels = np.concatenate(boxes), np.concatenate(labels)
+    # A camera rotated around the optical axis shifts each box down with its x position
+    shift = np.tan(np.radians(tilt_degrees)) * (boxes[:, 0] + boxes[:, 2]) / 2
+    boxes[:, [1, 3]] += shift[:, None]
+    return boxes, labels
+
+
+def legacy_group(xyxy: np.ndarray) -> List[List[int]]:
+    """The previous algorithm: sort by center, compare with the last book of the shelf only"""
+    infos = sorted(
+        ({"index": i, "centerY": (y1 + y2) / 2, "top": y1, "bottom": y2} for i, (x1, y1, x2, y2) in enumerate(xyxy.tolist())),
+        key=lambda info: info["centerY"],
+    )
+    shelves, current = [], [infos[0]]
+    for info in infos[1:]:
+        last = current[-1]
+        if max(last["top"], info["top"]) < min(last["bottom"], info["bottom"]):
+            current.append(info)
+        else:
+            shelves.append([item["index"] for item in current])
+            current = [info]
+    shelves.append([item["index"] for item in current])
+    return shelves
+
+
+def recovered_fraction(groups: List, labels: np.ndarray) -> float:
+    truth = {frozenset(np.flatnonzero(labels == shelf).tolist()) for shelf in np.unique(labels)}
+    found = {frozenset(np.asarray(group).tolist()) for group in groups}
+    return len(truth & found) / len(truth)
+
+
+def _time(function, repeats: int) -> Tuple[float, object]:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    scenarios = [
+        ("straight", dict(tall_fraction=0.0, tilt_degrees=0.0)),
+        ("tall books", dict(tall_fraction=0.03, tilt_degrees=0.0)),
+        ("mixed heights", dict(tall_fraction=0.03, short_fraction=0.03, tilt_degrees=0.0)),
+        ("tilted 2°", dict(tall_fraction=0.0, tilt_degrees=2.0)),
+        ("tilted + tall", dict(tall_fraction=0.03, tilt_degrees=2.0)),
+        ("tilted + mixed", dict(tall_fraction=0.03, short_fraction=0.03, tilt_degrees=2.0)),
+        ("stacked books", dict(stacked_fraction=0.05, tilt_degrees=0.0)),
+        ("tilted + stack", dict(tall_fraction=0.03, stacked_fraction=0.05, tilt_degrees=2.0)),
+    ]
+    sizes = [(10, 100), (20, 250), (40, 500)]
+
+    print(f"{'layout':<15}{'books':>7}{'legacy ms':>11}{'new ms':>9}{'legacy ok':>11}{'new ok':>9}{'new+tilt ok':>13}")
+    for name, options in scenarios:
+        for shelves, books_per_shelf in sizes:
+            xyxy, labels = make_layout(shelves, books_per_shelf, **options)
+            legacy_seconds, legacy_groups = _time(lambda: legacy_group(xyxy), args.repeats)
+            new_seconds, new_groups = _time(lambda: group_boxes_into_shelves(xyxy), args.repeats)
+            tilt_groups = group_boxes_into_shelves(xyxy, correct_tilt=True)
+            print(
+                f"{name:<15}{len(xyxy):>7}{legacy_seconds * 1000:>11.2f}{new_seconds * 1000:>9.2f}"
+                f"{recovered_fraction(legacy_groups, labels):>11.0%}{recovered_fraction(new_groups, labels):>9.0%}"
+                f"{recovered_fraction(tilt_groups, labels):>13.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Measure how fast a new API worker starts serving
+
+The detection stack (supervision, google.genai and the remote clients) is
+no longer imported and built when the app module loads: the server starts
+serving right away, builds the services in the background and reports
+through /ready when it is done. This starts uvicorn in a fresh process
+several times and reports the time until / first answers, until /ready
+answers 200, and the latency of the first request that needs the services
+when sent right after the server came up. For comparison it also starts
+servers that build the services before serving, like on import before.
+Credentials are a throwaway service account key, nothing is sent to
+Google, and the connection warm-up is off as it would need the network.
+Needs the cryptography package. Run from the API directory:
+
+    python -m benchmarks.bench_startup
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Tuple
+
+import httpx
+
+_SERVER = """
+import sys
+import uvicorn
+sys.path.insert(0, {api_dir!r})
+import main
+if {eager!r}:
+    from routes.dependencies import build_book_detection_service
+    build_book_detection_service()
+uvicorn.run(main.app, host="127.0.0.1", port={port}, log_level="warning")
+"""
+
+
+def _credentials(directory: str) -> str:
+    """Service account key file that lets the Gemini client be built offline"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = os.path.join(directory, "service_account.json")
+    with open(path, "w") as f:
+        json.dump({
+            "type": "service_account",
+            "project_id": "benchmark",
+            "private_key_id": "0",
+            "private_key": key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            ).decode(),
+            "client_email": "benchmark@benchmark.iam.gserviceaccount.com",
+            "client_id": "0",
+            "token_uri": "https://oauth2.googleapis.com/token",
+        }, f)
+    return path
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(client: httpx.Client, url: str, started: float, timeout: float) -> float:
+    """Seconds since ``started`` until ``url`` answers 200"""
+    while time.perf_counter() - started < timeout:
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} did not answer within {timeout}s")
+
+
+def _start(eager: bool, env: dict, timeout: float) -> Tuple[float, float, float]:
+    """Time to the first response, time to ready and latency of the first stats request"""
+    port = _free_port()
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = _SERVER.format(api_dir=api_dir, eager=eager, port=port)
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-c", code], env=env, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            serving = _wait_for(client, "/", started, timeout)
+            first_request = time.perf_counter()
+            client.get("/api/v1/books/stats").raise_for_status()
+            first_request = time.perf_counter() - first_request
+            ready = _wait_for(client, "/ready", started, timeout)
+    finally:
+        server.terminate()
+        server.wait()
+    return serving, ready, first_request
+
+
+def _import_time(env: dict) -> float:
+    code = "import sys, time; started = time.perf_counter(); import main; print(time.perf_counter() - started)"
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=api_dir, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def _median_ms(values: List[float]) -> str:
+    return f"{statistics.median(values) * 1000:>10.0f}"
+
+
+def main(args) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "GOOGLE_APPLICATION_CREDENTIALS": _credentials(directory),
+            "GOOGLE_CLOUD_PROJECT": "benchmark",
+            "HTTP_WARMUP": "False",
+            "INVENTORY_DB_PATH": os.path.join(directory, "inventory.db"),
+        }
+
+        imports = [_import_time(env) for _ in range(args.runs)]
+        print(f"import main: {statistics.median(imports) * 1000:.0f} ms (median of {args.runs})\n")
+
+        print(f"{'startup':<26}{'serving ms':>10}{'ready ms':>10}{'first request ms':>18}")
+        for name, eager in (("build before serving", True), ("lazy, warm-up", False)):
+            runs = [_start(eager, env, args.timeout) for _ in range(args.runs)]
+            serving, ready, first_request = zip(*runs)
+            print(f"{name:<26}{_median_ms(serving)}{_median_ms(ready)}{statistics.median(first_request) * 1000:>18.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Server starts per mode")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for a server to come up")
+    main(parser.parse_args())
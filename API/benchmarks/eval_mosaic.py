@@ -0,0 +1,124 @@
+"""Offline evaluation of the spine mosaic mode against a stubbed model
+
+Sends the same synthetic spines through GeminiService once per image and once
+as numbered mosaics. The stubbed model knows the ground truth of every call and
+answers mosaic entries in shuffled order, so the harness checks that answers
+are mapped back to the right regions and compares the request cost. Run from
+the API directory:
+
+    python -m benchmarks.eval_mosaic --books 50
+"""
+import argparse
+import json
+import math
+import random
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from config import settings
+from services import GeminiService
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Gemini image token estimate: 258 tokens for small images, else 258 per tile"""
+    if width <= 384 and height <= 384:
+        return 258
+    tile = min(max(min(width, height) / 1.5, 256), 768)
+    return math.ceil(width / tile) * math.ceil(height / tile) * 258
+
+
+def make_spines(count: int, seed: int = 0):
+    """Rotated spine crops with a readable title, plus their ground truth"""
+    rng = np.random.default_rng(seed)
+    spines, truths = [], []
+    for i in range(count):
+        width, height = int(rng.integers(900, 1600)), int(rng.integers(80, 200))
+        spine = np.full((height, width, 3), rng.integers(30, 220, size=3), dtype=np.uint8)
+        title = f"Book {i}"
+        cv2.putText(spine, title, (20, height // 2 + 12), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 2)
+        spines.append(spine)
+        truths.append({"title": title, "author": f"Author {i}"})
+    return spines, truths
+
+
+class ScriptedGeminiClient:
+    """Stub that answers with the ground truth of the current call and records its cost"""
+
+    def __init__(self, seed: int = 0):
+        self.expected = []
+        self.calls = 0
+        self.image_parts = 0
+        self.upload_bytes = 0
+        self.image_tokens = 0
+        self._random = random.Random(seed)
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        for part in contents[0].parts:
+            if getattr(part, "inline_data", None) is None:
+                continue
+            data = part.inline_data.data
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            self.image_parts += 1
+            self.upload_bytes += len(data)
+            self.image_tokens += estimate_image_tokens(image.shape[1], image.shape[0])
+
+        if settings.GEMINI_MOSAIC_MODE:
+            entries = [{"index": i + 1, **truth} for i, truth in enumerate(self.expected)]
+            self._random.shuffle(entries)
+        else:
+            entries = list(self.expected)
+        return SimpleNamespace(text=json.dumps(entries))
+
+
+def evaluate(spines, truths, mosaic: bool) -> dict:
+    settings.GEMINI_MOSAIC_MODE = mosaic
+    client = ScriptedGeminiClient()
+    service = GeminiService(client=client)
+
+    started = time.perf_counter()
+    results = []
+    batch_size = service.batch_size
+    for i in range(0, len(spines), batch_size):
+        client.expected = truths[i:i + batch_size]
+        results.extend(service.process_book_regions(spines[i:i + batch_size]))
+    elapsed = time.perf_counter() - started
+
+    correct = sum(
+        result.title == truth["title"] and result.author == truth["author"]
+        for result, truth in zip(results, truths)
+    )
+    return {
+        "mode": "mosaic" if mosaic else "per_image",
+        "books": len(spines),
+        "calls": client.calls,
+        "image_parts": client.image_parts,
+        "upload_kb": round(client.upload_bytes / 1024, 1),
+        "image_tokens": client.image_tokens,
+        "image_tokens_per_book": round(client.image_tokens / len(spines), 1),
+        "mapping_accuracy": round(correct / len(spines), 4),
+        "local_ms": round(elapsed * 1000, 1),
+    }
+
+
+def main(args) -> None:
+    settings.GEMINI_MOSAIC_PACK_SIZE = args.pack_size
+    settings.GEMINI_MOSAIC_WIDTH = args.mosaic_width
+    settings.GEMINI_MOSAIC_MAX_HEIGHT = args.mosaic_max_height
+
+    spines, truths = make_spines(args.books)
+    print(evaluate(spines, truths, mosaic=False))
+    print(evaluate(spines, truths, mosaic=True))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=50)
+    parser.add_argument("--pack-size", type=int, default=10)
+    parser.add_argument("--mosaic-width", type=int, default=1536)
+    parser.add_argument("--mosaic-max-height", type=int, default=2048)
+    main(parser.parse_args())
@@ -0,0 +1,121 @@
+"""Record detection fixtures from the live Roboflow and Gemini APIs for offline benchmarks
+
+A fixture holds a photo together with the Roboflow response and the books
+Gemini read from it, plus how long each service took. bench_pipeline replays
+fixtures through the stand-in clients in benchmarks.stubs, so the pipeline
+can be measured without credentials. Recording needs the usual Roboflow and
+Vertex AI settings. Run from the API directory:
+
+    python -m benchmarks.fixtures shelf1.jpg shelf2.jpg --output-dir benchmarks/fixtures
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import time
+from types import SimpleNamespace
+from typing import List
+
+import cv2
+
+from services import BookDetectionService, GeminiService, ImageProcessingService
+from .stubs import make_roboflow_response, make_shelf_image
+
+
+class _RecordingRoboflowClient:
+    """Wraps the Roboflow client, keeping every response and its latency"""
+
+    def __init__(self, client):
+        self._client = client
+        self.responses: List[dict] = []
+        self.latencies: List[float] = []
+
+    async def infer_async(self, image, model_id=None) -> dict:
+        started = time.perf_counter()
+        response = await self._client.infer_async(image, model_id=model_id)
+        self.latencies.append(time.perf_counter() - started)
+        self.responses.append(response)
+        return response
+
+
+class _RecordingGeminiClient:
+    """Wraps genai.Client, keeping the latency of every async generate_content call"""
+
+    def __init__(self, client):
+        self._client = client
+        self.latencies: List[float] = []
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_content))
+
+    async def _generate_content(self, **kwargs):
+        started = time.perf_counter()
+        response = await self._client.aio.models.generate_content(**kwargs)
+        self.latencies.append(time.perf_counter() - started)
+        return response
+
+
+def make_fixture(width: int, height: int, books: int, seed: int = 0) -> dict:
+    """A synthetic fixture in the recorded format, with typical service latencies"""
+    shelves = max(1, books // 20)
+    image, polygons = make_shelf_image(width, height, books_per_shelf=books // shelves, shelves=shelves, seed=seed)
+    return {
+        "name": f"synthetic-{width}x{height}-{books}",
+        "image": base64.b64encode(cv2.imencode(".jpg", image)[1]).decode("utf-8"),
+        "roboflow": {"response": make_roboflow_response(polygons, width, height), "latency": 0.3},
+        "gemini": {
+            "books": [{"title": f"Book {i}", "author": "Stub Author"} for i in range(len(polygons))],
+            "latency": 0.8,
+        },
+    }
+
+
+def load_fixture(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+async def record_fixture(image_path: str) -> dict:
+    """Run the live pipeline on a photo and capture what both services returned"""
+    image_service = ImageProcessingService()
+    roboflow_client = _RecordingRoboflowClient(image_service.detector.client)
+    image_service.detector.client = roboflow_client
+    gemini_service = GeminiService()
+    gemini_client = _RecordingGeminiClient(gemini_service.client)
+    gemini_service.client = gemini_client
+
+    service = BookDetectionService(image_service=image_service, gemini_service=gemini_service)
+    # Caches would hide the calls to record
+    service.result_cache = None
+    service.region_cache = None
+
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    annotations = await service.detect_books_from_bytes(image_bytes)
+
+    return {
+        "name": os.path.splitext(os.path.basename(image_path))[0],
+        "image": base64.b64encode(image_bytes).decode("utf-8"),
+        "roboflow": {"response": roboflow_client.responses[0], "latency": roboflow_client.latencies[0]},
+        "gemini": {
+            "books": [{"title": annotation.title, "author": annotation.author} for annotation in annotations],
+            "latency": statistics.median(gemini_client.latencies) if gemini_client.latencies else 0.0,
+        },
+    }
+
+
+async def main(args) -> None:
+    os.makedirs(args.output_dir, exist_ok=True)
+    for image_path in args.images:
+        fixture = await record_fixture(image_path)
+        path = os.path.join(args.output_dir, f"{fixture['name']}.json")
+        with open(path, "w") as f:
+            json.dump(fixture, f)
+        print(f"Recorded {len(fixture['gemini']['books'])} books from {image_path} to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="+", help="Photos of bookshelves to record")
+    parser.add_argument("--output-dir", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""Load test for the async detection pipeline against local stubs
+
+Runs the full BookDetectionService pipeline with stubbed Roboflow and Gemini
+clients at increasing client concurrency, while a heartbeat task measures how
+long the event loop is blocked. Run from the API directory:
+
+    python -m benchmarks.load_test_detect_books
+"""
+import argparse
+import asyncio
+import base64
+import time
+
+import cv2
+
+from config import settings
+from services import BookDetectionService, GeminiService, ImageProcessingService
+from .stubs import StubGeminiClient, StubRoboflowClient, make_roboflow_response, make_shelf_image
+
+
+async def _heartbeat(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst_lag = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst_lag = max(worst_lag, time.perf_counter() - started - interval)
+    return worst_lag
+
+
+async def _run_level(service: BookDetectionService, image_b64: str, clients: int, requests: int) -> dict:
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(image_b64)
+
+    async def client():
+        while not queue.empty():
+            await service.detect_books_from_base64(queue.get_nowait())
+
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+
+    return {
+        "clients": clients,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 2),
+        "max_event_loop_lag_ms": round(await heartbeat * 1000, 1),
+    }
+
+
+async def main(args) -> None:
+    settings.GEMINI_MAX_CONCURRENCY = args.gemini_concurrency
+    # Every client sends the same image, measure the pipeline rather than request coalescing
+    settings.REQUEST_COALESCING_ENABLED = False
+    image, polygons = make_shelf_image(books_per_shelf=args.books // 2, shelves=2)
+    image_b64 = base64.b64encode(cv2.imencode(".jpg", image)[1]).decode("utf-8")
+    response = make_roboflow_response(polygons, image.shape[1], image.shape[0])
+
+    service = BookDetectionService(
+        image_service=ImageProcessingService(client=StubRoboflowClient(response, latency=args.roboflow_latency)),
+        gemini_service=GeminiService(client=StubGeminiClient(latency=args.gemini_latency)),
+    )
+    # Every request sends the same image, measure the pipeline rather than the caches
+    service.result_cache = None
+    service.region_cache = None
+
+    for clients in args.clients:
+        print(await _run_level(service, image_b64, clients, args.requests))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--roboflow-latency", type=float, default=0.3)
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--gemini-concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
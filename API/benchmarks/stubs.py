@@ -0,0 +1,154 @@
+"""Local stand-ins for the remote Roboflow and Gemini clients used by the benchmarks"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def make_shelf_image(
+    width: int = 1920,
+    height: int = 1080,
+    books_per_shelf: int = 10,
+    shelves: int = 2,
+    seed: int = 0,
+) -> Tuple[np.ndarray, List[List[Tuple[int, int]]]]:
+    """Draw a synthetic bookcase and return the image with one polygon per spine"""
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 40, dtype=np.uint8)
+    polygons = []
+
+    shelf_height = height // shelves
+    spine_width = width // (books_per_shelf + 1)
+    for shelf in range(shelves):
+        top = shelf * shelf_height + shelf_height // 10
+        bottom = (shelf + 1) * shelf_height - shelf_height // 20
+        for book in range(books_per_shelf):
+            x1 = book * spine_width + spine_width // 2
+            x2 = x1 + int(spine_width * 0.85)
+            y1 = top + int(rng.integers(0, shelf_height // 10))
+            polygon = [(x1, y1), (x2, y1), (x2, bottom), (x1, bottom)]
+            color = tuple(int(c) for c in rng.integers(60, 255, size=3))
+            cv2.fillPoly(image, [np.array(polygon, dtype=np.int32)], color)
+            polygons.append(polygon)
+
+    return image, polygons
+
+
+def make_roboflow_response(polygons: List[List[Tuple[int, int]]], width: int, height: int) -> dict:
+    """Build a Roboflow instance segmentation response for the given polygons"""
+    predictions = []
+    for i, polygon in enumerate(polygons):
+        xs = [p[0] for p in polygon]
+        ys = [p[1] for p in polygon]
+        predictions.append({
+            "x": (min(xs) + max(xs)) / 2,
+            "y": (min(ys) + max(ys)) / 2,
+            "width": max(xs) - min(xs),
+            "height": max(ys) - min(ys),
+            "confidence": 0.9,
+            "class": "book",
+            "class_id": 0,
+            "detection_id": f"book-{i}",
+            "points": [{"x": float(x), "y": float(y)} for x, y in polygon],
+        })
+
+    return {
+        "image": {"width": width, "height": height},
+        "predictions": predictions,
+    }
+
+
+def scale_roboflow_response(response: dict, width: int, height: int) -> dict:
+    """The response for the same image resized to width x height"""
+    scale_x = width / response["image"]["width"]
+    scale_y = height / response["image"]["height"]
+    predictions = []
+    for prediction in response["predictions"]:
+        predictions.append({
+            **prediction,
+            "x": prediction["x"] * scale_x,
+            "y": prediction["y"] * scale_y,
+            "width": prediction["width"] * scale_x,
+            "height": prediction["height"] * scale_y,
+            "points": [{"x": p["x"] * scale_x, "y": p["y"] * scale_y} for p in prediction["points"]],
+        })
+    return {"image": {"width": width, "height": height}, "predictions": predictions}
+
+
+class StubRoboflowClient:
+    """Mimics the Roboflow client, returning a canned response after a fixed delay.
+
+    The response is scaled to the image it is sent, like the real API answers
+    for a downscaled copy of the photo.
+    """
+
+    def __init__(self, response: dict, latency: float = 0.2):
+        self.response = response
+        self.latency = latency
+        self.calls = 0
+
+    def respond(self, image) -> dict:
+        height, width = image.shape[:2]
+        if (width, height) == (self.response["image"]["width"], self.response["image"]["height"]):
+            return self.response
+        return scale_roboflow_response(self.response, width, height)
+
+    def infer(self, image, model_id: Optional[str] = None) -> dict:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.respond(image)
+
+    async def infer_async(self, image, model_id: Optional[str] = None) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.respond(image)
+
+
+class _StubModels:
+    def __init__(self, owner: "StubGeminiClient", is_async: bool):
+        self._owner = owner
+        self._is_async = is_async
+
+    def generate_content(self, model, contents, config=None):
+        if self._is_async:
+            return self._generate_async(contents)
+        time.sleep(self._owner.latency)
+        return self._owner.respond(contents)
+
+    async def _generate_async(self, contents):
+        await asyncio.sleep(self._owner.latency)
+        return self._owner.respond(contents)
+
+
+class StubGeminiClient:
+    """Mimics genai.Client, answering with one book per image part.
+
+    With ``books`` the answers are taken from that list in turn, e.g. books
+    recorded from real Gemini responses, instead of numbered placeholders.
+    """
+
+    def __init__(self, latency: float = 0.5, books: Optional[List[dict]] = None):
+        self.latency = latency
+        self.books = books
+        self.calls = 0
+        self._next_book = 0
+        self.models = _StubModels(self, is_async=False)
+        self.aio = SimpleNamespace(models=_StubModels(self, is_async=True))
+
+    def _count_images(self, contents) -> int:
+        parts = contents[0].parts
+        return sum(1 for part in parts if getattr(part, "inline_data", None) is not None)
+
+    def respond(self, contents) -> SimpleNamespace:
+        self.calls += 1
+        count = self._count_images(contents)
+        if self.books:
+            books = [self.books[(self._next_book + i) % len(self.books)] for i in range(count)]
+            self._next_book += count
+        else:
+            books = [{"title": f"Book {self.calls}-{i}", "author": "Stub Author"} for i in range(count)]
+        return SimpleNamespace(text=json.dumps(books))
@@ -12,17 +12,119 @@ class Settings:
     ROBOFLOW_API_KEY: str = os.getenv("ROBOFLOW_API_KEY")
     ROBOFLOW_MODEL_ID: str = "the-ultimate-bookshelf-fqvoz/3"
 
+    # Detector Configuration
+    DETECTOR_BACKEND: str = os.getenv("DETECTOR_BACKEND", "roboflow").lower()
+    ONNX_MODEL_PATH: Optional[str] = os.getenv("ONNX_MODEL_PATH")
+    ONNX_INPUT_SIZE: int = int(os.getenv("ONNX_INPUT_SIZE", "640"))
+    ONNX_CONFIDENCE: float = float(os.getenv("ONNX_CONFIDENCE", "0.4"))
+    ONNX_IOU_THRESHOLD: float = float(os.getenv("ONNX_IOU_THRESHOLD", "0.5"))
+    ONNX_MAX_DETECTIONS: int = int(os.getenv("ONNX_MAX_DETECTIONS", "300"))
+    ONNX_CLASS_NAMES: str = os.getenv("ONNX_CLASS_NAMES", "book")
+    ONNX_WORKERS: int = int(os.getenv("ONNX_WORKERS", "2"))
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv("ONNX_INTRA_OP_THREADS", "2"))
+
     # Google Cloud Configuration
     GOOGLE_CLOUD_PROJECT: str = os.getenv("GOOGLE_CLOUD_PROJECT")
     GOOGLE_CLOUD_LOCATION: str = os.getenv("GOOGLE_CLOUD_LOCATION", "global")
 
+    # HTTP Connection Pool Configuration, shared by the Roboflow and Gemini clients
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "32"))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", "60"))
+    # Requires the h2 package (pip install httpx[http2])
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "False").lower() == "true"
+    HTTP_WARMUP: bool = os.getenv("HTTP_WARMUP", "True").lower() == "true"
+    HTTP_WARMUP_CONNECTIONS: int = int(os.getenv("HTTP_WARMUP_CONNECTIONS", "2"))
+
+    # Image Pre-processing Configuration
+    # Larger images are rejected before they are decoded, which bounds memory per request
+    IMAGE_MAX_PIXELS: int = int(os.getenv("IMAGE_MAX_PIXELS", "64000000"))
+    # Detection runs on a copy downscaled to this longer side, crops keep the full resolution (0 disables)
+    DETECTION_MAX_DIMENSION: int = int(os.getenv("DETECTION_MAX_DIMENSION", "2048"))
+    # Panoramas wider (or taller) than this aspect ratio are detected in overlapping square tiles
+    DETECTION_TILING: bool = os.getenv("DETECTION_TILING", "True").lower() == "true"
+    DETECTION_TILE_MIN_ASPECT: float = float(os.getenv("DETECTION_TILE_MIN_ASPECT", "2.0"))
+    DETECTION_TILE_OVERLAP: float = float(os.getenv("DETECTION_TILE_OVERLAP", "0.2"))
+    DETECTION_TILE_CONCURRENCY: int = int(os.getenv("DETECTION_TILE_CONCURRENCY", "2"))
+
     # Processing Configuration
     BATCH_SIZE: int = 5
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+    GEMINI_BATCH_TIMEOUT: float = float(os.getenv("GEMINI_BATCH_TIMEOUT", "60"))
+    GEMINI_ADAPTIVE_BATCHING: bool = os.getenv("GEMINI_ADAPTIVE_BATCHING", "True").lower() == "true"
+    GEMINI_MIN_BATCH_SIZE: int = int(os.getenv("GEMINI_MIN_BATCH_SIZE", "1"))
+    GEMINI_MAX_BATCH_SIZE: int = int(os.getenv("GEMINI_MAX_BATCH_SIZE", "10"))
+    GEMINI_TARGET_BATCH_LATENCY: float = float(os.getenv("GEMINI_TARGET_BATCH_LATENCY", "10"))
+    GEMINI_MAX_RETRIES: int = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+    GEMINI_BACKOFF_BASE: float = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+    GEMINI_BACKOFF_MAX: float = float(os.getenv("GEMINI_BACKOFF_MAX", "20"))
+
+    # Shelf Grouping Configuration
+    SHELF_TILT_CORRECTION: bool = os.getenv("SHELF_TILT_CORRECTION", "True").lower() == "true"
+
+    # Bulk Detection Configuration
+    BULK_MAX_IMAGES: int = int(os.getenv("BULK_MAX_IMAGES", "20"))
+    BULK_IMAGE_CONCURRENCY: int = int(os.getenv("BULK_IMAGE_CONCURRENCY", "2"))
+
+    # Job Queue Configuration
+    JOB_QUEUE_MAX_SIZE: int = int(os.getenv("JOB_QUEUE_MAX_SIZE", "16"))
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_TTL_SECONDS: float = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+    JOB_MAX_ENTRIES: int = int(os.getenv("JOB_MAX_ENTRIES", "1000"))
+    JOB_DB_PATH: Optional[str] = os.getenv("JOB_DB_PATH")
+
+    # Inventory Configuration
+    INVENTORY_DB_PATH: str = os.getenv("INVENTORY_DB_PATH", "inventory.db")
+    INVENTORY_IOU_THRESHOLD: float = float(os.getenv("INVENTORY_IOU_THRESHOLD", "0.5"))
+    # Fraction of the query trigrams a book must contain to be found by a search
+    BOOK_SEARCH_MIN_SCORE: float = float(os.getenv("BOOK_SEARCH_MIN_SCORE", "0.3"))
+
+    # LED Controller Configuration
+    # Base URL of the ESP32 strip controller, e.g. http://192.168.1.50 (unset disables lighting)
+    LED_CONTROLLER_URL: Optional[str] = os.getenv("LED_CONTROLLER_URL")
+    LED_CONTROLLER_TIMEOUT: float = float(os.getenv("LED_CONTROLLER_TIMEOUT", "2"))
+    # Must match NUM_LEDS in the firmware config.h
+    LED_COUNT: int = int(os.getenv("LED_COUNT", "60"))
+    # Shelves the strip runs along, each gets an equal share of the LEDs
+    LED_STRIP_SHELVES: int = int(os.getenv("LED_STRIP_SHELVES", "1"))
+    # The strip runs back right to left along every other shelf
+    LED_SERPENTINE: bool = os.getenv("LED_SERPENTINE", "False").lower() == "true"
+
+    # Process Pool Configuration
+    # Worker processes for decoding, region extraction and crop encoding, 0 runs them in threads of the server process
+    PROCESS_POOL_WORKERS: int = int(os.getenv("PROCESS_POOL_WORKERS", "0"))
+
+    # Request Coalescing Configuration
+    # Identical images detected at the same time share one pipeline run
+    REQUEST_COALESCING_ENABLED: bool = os.getenv("REQUEST_COALESCING_ENABLED", "True").lower() == "true"
+
+    # Result Cache Configuration
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "True").lower() == "true"
+    RESULT_CACHE_MAX_ENTRIES: int = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "128"))
+    RESULT_CACHE_TTL_SECONDS: float = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600"))
+    RESULT_CACHE_DB_PATH: Optional[str] = os.getenv("RESULT_CACHE_DB_PATH")
+    RESULT_CACHE_HASH_SIZE: int = int(os.getenv("RESULT_CACHE_HASH_SIZE", "16"))
+
+    # Region Cache Configuration
+    REGION_CACHE_ENABLED: bool = os.getenv("REGION_CACHE_ENABLED", "True").lower() == "true"
+    REGION_CACHE_MAX_ENTRIES: int = int(os.getenv("REGION_CACHE_MAX_ENTRIES", "5000"))
+    REGION_CACHE_TTL_SECONDS: float = float(os.getenv("REGION_CACHE_TTL_SECONDS", "86400"))
+    REGION_CACHE_HASH_SIZE: int = int(os.getenv("REGION_CACHE_HASH_SIZE", "16"))
+    REGION_CACHE_MAX_DISTANCE: int = int(os.getenv("REGION_CACHE_MAX_DISTANCE", "24"))
 
     # Gemini Configuration
     GEMINI_MODEL: str = "gemini-2.5-flash"
     GEMINI_TEMPERATURE: float = 0.2
     GEMINI_MAX_OUTPUT_TOKENS: int = 2000
+    GEMINI_IMAGE_FORMAT: str = os.getenv("GEMINI_IMAGE_FORMAT", "jpeg").lower()
+    GEMINI_IMAGE_QUALITY: int = int(os.getenv("GEMINI_IMAGE_QUALITY", "85"))
+    GEMINI_MAX_REGION_DIMENSION: int = int(os.getenv("GEMINI_MAX_REGION_DIMENSION", "1024"))
+    GEMINI_ENCODE_WORKERS: int = int(os.getenv("GEMINI_ENCODE_WORKERS", "4"))
+    GEMINI_MOSAIC_MODE: bool = os.getenv("GEMINI_MOSAIC_MODE", "False").lower() == "true"
+    GEMINI_MOSAIC_PACK_SIZE: int = int(os.getenv("GEMINI_MOSAIC_PACK_SIZE", "10"))
+    GEMINI_MOSAIC_WIDTH: int = int(os.getenv("GEMINI_MOSAIC_WIDTH", "1536"))
+    GEMINI_MOSAIC_MAX_HEIGHT: int = int(os.getenv("GEMINI_MOSAIC_MAX_HEIGHT", "2048"))
 
     # CORS Configuration
     CORS_ORIGINS: list = ["*"]
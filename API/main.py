@@ -1,15 +1,48 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from config import settings
-from routes import books_router, index_router
+from routes import books_router, index_router, metrics_router
+from routes.dependencies import build_book_detection_service
+from services import MetricsMiddleware, http_pool, readiness, shared_process_pool, shutdown_shared_process_pool
+
+
+def _vertex_ai_url() -> str:
+    if settings.GOOGLE_CLOUD_LOCATION == "global":
+        return "https://aiplatform.googleapis.com"
+    return f"https://{settings.GOOGLE_CLOUD_LOCATION}-aiplatform.googleapis.com"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up in the background, so the server accepts requests right away and /ready tells when it's done
+    loop = asyncio.get_running_loop()
+    warm_up = [readiness.start("services", lambda: loop.run_in_executor(None, build_book_detection_service))]
+    # Open connections to Roboflow and Vertex AI before the first request needs them
+    if settings.HTTP_WARMUP:
+        warm_up.append(readiness.start("connections", lambda: http_pool.warm_up(
+            [settings.ROBOFLOW_API_URL, _vertex_ai_url()],
+            connections=settings.HTTP_WARMUP_CONNECTIONS,
+        )))
+    # Spawning a worker process takes about as long as starting the server
+    process_pool = shared_process_pool()
+    if process_pool is not None:
+        warm_up.append(readiness.start("process_pool", lambda: loop.run_in_executor(None, process_pool.warm_up)))
+    yield
+    for task in warm_up:
+        task.cancel()
+    await http_pool.aclose()
+    await loop.run_in_executor(None, shutdown_shared_process_pool)
 
 
 def create_app() -> FastAPI:
     app = FastAPI(
         title="Ultimate Bookshelf API",
         description="AI-powered book detection and metadata extraction service",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan,
     )
 
     # Add CORS middleware
@@ -21,9 +54,13 @@ def create_app() -> FastAPI:
         allow_headers=settings.CORS_HEADERS,
     )
 
+    # Record request counts, latency and body sizes for /metrics
+    app.add_middleware(MetricsMiddleware)
+
     # Include routers
     app.include_router(index_router)
     app.include_router(books_router)
+    app.include_router(metrics_router)
 
     return app
 
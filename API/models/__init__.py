@@ -1,17 +1,35 @@
 from .schemas import (
     ImageRequest,
+    BulkImageRequest,
     BookAnnotation,
     Shelf,
     BookDetectionResponse,
+    BulkDetectionResponse,
+    JobSubmitResponse,
+    JobStatusResponse,
+    InventoryScanResponse,
+    InventoryResponse,
+    BookMatch,
+    BookSearchResponse,
+    LocateRequest,
     ProcessingResult,
     StatsResponse
 )
 
 __all__ = [
     "ImageRequest",
+    "BulkImageRequest",
     "BookAnnotation",
     "Shelf",
     "BookDetectionResponse",
+    "BulkDetectionResponse",
+    "JobSubmitResponse",
+    "JobStatusResponse",
+    "InventoryScanResponse",
+    "InventoryResponse",
+    "BookMatch",
+    "BookSearchResponse",
+    "LocateRequest",
     "ProcessingResult",
     "StatsResponse"
 ]
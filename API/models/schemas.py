@@ -1,10 +1,14 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, SerializationInfo, field_serializer
+from typing import Any, List, Optional
 
 class ImageRequest(BaseModel):
     """Request model for image processing"""
     image: str = Field(..., description="Base64 encoded image data")
 
+class BulkImageRequest(BaseModel):
+    """Request model for processing several images at once"""
+    images: List[str] = Field(..., min_length=1, description="Base64 encoded images, for example every shelf of a bookcase")
+
 class BookAnnotation(BaseModel):
     """Model for a single book annotation"""
     title: str = Field(..., description="Book title")
@@ -12,6 +16,12 @@ class BookAnnotation(BaseModel):
     polygons: List[List[List[float]]] = Field(..., description="Polygon coordinates for book detection")
     xyxy: List[float] = Field(..., description="Bounding box coordinates [x1, y1, x2, y2]")
 
+    @field_serializer("polygons")
+    def serialize_polygons(self, polygons: List[List[List[float]]], info: SerializationInfo) -> Any:
+        # Routes pass a compact polygon encoder in the serialization context
+        encode = (info.context or {}).get("encode_polygons")
+        return encode(polygons) if encode is not None else polygons
+
 class Shelf(BaseModel):
     """Model for a shelf containing book annotations"""
     shelf_id: int = Field(..., description="Unique identifier for the shelf")
@@ -22,6 +32,66 @@ class BookDetectionResponse(BaseModel):
     shelves: List[Shelf] = Field(..., description="List of shelves containing books")
     message: str = Field(default="Books detected successfully", description="Response message")
 
+class BulkDetectionResponse(BaseModel):
+    """Response model for bulk book detection"""
+    results: List[BookDetectionResponse] = Field(..., description="Detection result per image, in request order")
+    message: str = Field(default="Books detected successfully", description="Response message")
+
+class JobSubmitResponse(BaseModel):
+    """Response model for a queued detection job"""
+    job_id: str = Field(..., description="Identifier to poll the job with")
+    status: str = Field(..., description="Job status: queued, running, done or failed")
+    status_url: str = Field(..., description="URL that returns the job status and result")
+
+class JobStatusResponse(BaseModel):
+    """Response model for the status of a detection job"""
+    job_id: str = Field(..., description="Job identifier")
+    status: str = Field(..., description="Job status: queued, running, done or failed")
+    books_detected: int = Field(..., description="Number of books found so far, known once detection has run")
+    books_completed: int = Field(..., description="Number of books whose title and author are known")
+    shelves: List[Shelf] = Field(..., description="Shelves with the books whose title and author are known so far")
+    result: Optional[BookDetectionResponse] = Field(default=None, description="Final result, once the job is done")
+    error: Optional[str] = Field(default=None, description="Error message, if the job failed")
+
+class InventoryScanResponse(BaseModel):
+    """Response model for a scan diffed against the stored inventory of a bookcase"""
+    inventory_id: str = Field(..., description="Identifier of the bookcase")
+    added: List[BookAnnotation] = Field(..., description="Books that weren't in the inventory")
+    removed: List[BookAnnotation] = Field(..., description="Books from the inventory that weren't found, as last seen")
+    moved: List[BookAnnotation] = Field(..., description="Books from the inventory found at a different position")
+    shelves: List[Shelf] = Field(..., description="Full state of the bookcase after the scan")
+    message: str = Field(default="Inventory updated successfully", description="Response message")
+
+class InventoryResponse(BaseModel):
+    """Response model for the stored inventory of a bookcase"""
+    inventory_id: str = Field(..., description="Identifier of the bookcase")
+    total_books: int = Field(..., description="Number of books in the inventory")
+    shelves: List[Shelf] = Field(..., description="Books of the last scan, grouped into shelves")
+
+class BookMatch(BaseModel):
+    """Model for a book found by a search, with where to find it"""
+    book: BookAnnotation = Field(..., description="The book as stored by the last scan")
+    shelf_id: int = Field(..., description="Shelf of the book, numbered top to bottom like in the inventory")
+    score: float = Field(..., description="Fraction of the query matched by the title and author, from 0 to 1")
+    leds: List[int] = Field(..., description="LED range in front of the book, [start, end) on the strip")
+
+class BookSearchResponse(BaseModel):
+    """Response model for a book search in an inventory"""
+    inventory_id: str = Field(..., description="Identifier of the bookcase")
+    query: str = Field(..., description="Search query")
+    results: List[BookMatch] = Field(..., description="Matching books, best first")
+    lit: bool = Field(default=False, description="Whether the LEDs in front of the results were lit")
+    message: str = Field(default="Search completed successfully", description="Response message")
+
+class LocateRequest(BaseModel):
+    """Request model to find books and light their spot on the shelf"""
+    query: str = Field(..., min_length=1, description="Title and/or author to look for, typos are tolerated")
+    limit: int = Field(default=1, ge=1, le=20, description="Number of best matches to light")
+    r: int = Field(default=255, ge=0, le=255, description="Red component of the LED color")
+    g: int = Field(default=255, ge=0, le=255, description="Green component of the LED color")
+    b: int = Field(default=255, ge=0, le=255, description="Blue component of the LED color")
+    a: int = Field(default=100, ge=0, le=100, description="LED brightness as a percentage")
+
 class ProcessingResult(BaseModel):
     """Model for internal processing results"""
     title: str
@@ -41,3 +111,11 @@ class StatsResponse(BaseModel):
     total_valid_books: int = Field(..., description="Total number of books with successfully extracted metadata")
     overall_accuracy: float = Field(..., description="Overall accuracy percentage of valid books vs total detected")
     average_books_per_request: float = Field(..., description="Average number of books detected per request")
+    cache_hits: int = Field(..., description="Number of requests answered from the result cache")
+    cache_misses: int = Field(..., description="Number of requests that ran the full detection pipeline")
+    cache_hit_ratio: float = Field(..., description="Fraction of requests answered from the result cache")
+    region_cache_hits: int = Field(..., description="Number of book spines answered from the region cache")
+    region_cache_misses: int = Field(..., description="Number of book spines sent to Gemini")
+    gemini_calls: int = Field(..., description="Number of Gemini calls made, including retries")
+    gemini_retries: int = Field(..., description="Number of Gemini batches that were retried")
+    gemini_batch_size: int = Field(..., description="Current number of book spines per Gemini call")
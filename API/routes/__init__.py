@@ -1,7 +1,9 @@
 from .books import router as books_router
 from .index import router as index_router
+from .metrics import router as metrics_router
 
 __all__ = [
     "books_router",
-    "index_router"
+    "index_router",
+    "metrics_router"
 ]
@@ -1,52 +1,518 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+import asyncio
+import json
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator, List, Optional, Union
 
-from models import ImageRequest, BookDetectionResponse, BookAnnotation, Shelf, StatsResponse
-from services import BookDetectionService
+from config import settings
+from models import (
+    ImageRequest,
+    BulkImageRequest,
+    BookDetectionResponse,
+    BulkDetectionResponse,
+    JobSubmitResponse,
+    JobStatusResponse,
+    InventoryScanResponse,
+    InventoryResponse,
+    BookSearchResponse,
+    LocateRequest,
+    BookAnnotation,
+    Shelf,
+    StatsResponse,
+)
+from services import BookDetectionService, DetectionJobQueue, JobQueueFullError, PolygonEncoding
+from .dependencies import get_book_detection_service, get_detection_job_queue
 
 router = APIRouter(prefix="/api/v1", tags=["books"])
-book_detection_service = BookDetectionService()
+
+def _build_detection_response(
+    service: BookDetectionService, annotations: List[BookAnnotation]
+) -> BookDetectionResponse:
+    # Group them into shelves
+    shelves = service.group_books_into_shelves(annotations)
+
+    # Flatten annotations from all shelves for statistics
+    all_annotations = []
+    for shelf in shelves:
+        all_annotations.extend(shelf.annotations)
+
+    # Get detection statistics for logging/monitoring
+    stats = service.get_detection_stats(all_annotations)
+    print(f"Detection stats: {stats}")
+
+    total_books = len(all_annotations)
+    total_shelves = len(shelves)
+
+    return BookDetectionResponse(
+        shelves=shelves,
+        message=f"Successfully detected {total_books} books organized into {total_shelves} shelves"
+    )
+
+def get_polygon_encoding(
+    request: Request,
+    polygon_format: Optional[str] = Query(
+        None, description="Polygon encoding: float (default), int, delta or binary"
+    ),
+    simplify: Optional[float] = Query(
+        None, ge=0, description="Douglas-Peucker tolerance in pixels used to simplify polygons"
+    ),
+) -> Optional[PolygonEncoding]:
+    """Polygon encoding asked for by the query string, or by the Accept header as in
+    ``application/json; polygons=delta; simplify=1.5``"""
+    try:
+        return PolygonEncoding.from_request(polygon_format, simplify, request.headers.get("accept", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _encoded_response(response: BaseModel, encoding: Optional[PolygonEncoding]):
+    """Return the model as is, or serialized with compact polygons when an encoding was requested"""
+    if encoding is None:
+        return response
+    # Skip response_model validation, the encoded polygons no longer match the schema
+    return Response(
+        content=response.model_dump_json(context={"encode_polygons": encoding.encode}),
+        media_type="application/json",
+    )
 
 @router.post("/detect-books", response_model=BookDetectionResponse)
-async def detect_books_endpoint(request: ImageRequest):
+async def detect_books_endpoint(
+    request: ImageRequest,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
     try:
         # Get the flat list of annotations
-        annotations = book_detection_service.detect_books_from_base64(request.image)
+        annotations = await service.detect_books_from_base64(request.image)
+        return _encoded_response(_build_detection_response(service, annotations), encoding)
 
-        # Group them into shelves
-        shelves = book_detection_service.group_books_into_shelves(annotations)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in book detection: {str(e)}")
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Error processing image: {str(e)}"
+        )
 
-        # Flatten annotations from all shelves for statistics
-        all_annotations = []
-        for shelf in shelves:
-            all_annotations.extend(shelf.annotations)
+@router.post("/detect-books/bulk", response_model=BulkDetectionResponse)
+async def detect_books_bulk_endpoint(
+    request: BulkImageRequest,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
+    """Detect books in several images, sharing Gemini batches across all of them"""
+    if len(request.images) > settings.BULK_MAX_IMAGES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BULK_MAX_IMAGES} images can be sent in one request"
+        )
 
-        # Get detection statistics for logging/monitoring
-        stats = book_detection_service.get_detection_stats(all_annotations)
-        print(f"Detection stats: {stats}")
+    try:
+        annotations_per_image = await service.detect_books_from_base64_bulk(request.images)
+        results = [_build_detection_response(service, annotations) for annotations in annotations_per_image]
 
-        total_books = len(all_annotations)
-        total_shelves = len(shelves)
+        total_books = sum(len(shelf.annotations) for result in results for shelf in result.shelves)
+        return _encoded_response(
+            BulkDetectionResponse(
+                results=results,
+                message=f"Successfully detected {total_books} books in {len(results)} images"
+            ),
+            encoding,
+        )
 
-        return BookDetectionResponse(
-            shelves=shelves,
-            message=f"Successfully detected {total_books} books organized into {total_shelves} shelves"
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in bulk book detection: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing images: {str(e)}"
         )
 
+async def _read_upload_bytes(request: Request) -> bytes:
+    """Read the image from a multipart form (field "image") or a raw image body"""
+    content_type = request.headers.get("content-type", "")
+
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart body must contain an 'image' file field")
+        return await upload.read()
+
+    if content_type.startswith("image/") or content_type.startswith("application/octet-stream"):
+        return await request.body()
+
+    raise HTTPException(
+        status_code=415,
+        detail="Send the image as multipart/form-data, image/* or application/octet-stream"
+    )
+
+@router.post(
+    "/detect-books/upload",
+    response_model=BookDetectionResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "image/jpeg": {"schema": {"type": "string", "format": "binary"}},
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "properties": {"image": {"type": "string", "format": "binary"}},
+                        "required": ["image"],
+                    }
+                },
+            },
+        }
+    },
+)
+async def detect_books_upload_endpoint(
+    request: Request,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
+    """Detect books in a binary image upload, skipping the base64 JSON encoding"""
+    try:
+        image_bytes = await _read_upload_bytes(request)
+        annotations = await service.detect_books_from_bytes(image_bytes)
+        return _encoded_response(_build_detection_response(service, annotations), encoding)
+
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error in book detection: {str(e)}")
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Error processing image: {str(e)}"
         )
 
+# Request body of the endpoints taking either an ImageRequest or an upload
+_IMAGE_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": ImageRequest.model_json_schema()},
+            "image/jpeg": {"schema": {"type": "string", "format": "binary"}},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"image": {"type": "string", "format": "binary"}},
+                    "required": ["image"],
+                }
+            },
+        },
+    }
+}
+
+async def _read_image_payload(request: Request) -> Union[str, bytes]:
+    """Read a base64 image from an ImageRequest JSON body, or the bytes of an upload"""
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            return ImageRequest.model_validate_json(await request.body()).image
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    return await _read_upload_bytes(request)
+
+@router.post(
+    "/detect-books/jobs",
+    response_model=JobSubmitResponse,
+    status_code=202,
+    responses={429: {"description": "The job queue is full, retry later"}},
+    openapi_extra=_IMAGE_REQUEST_BODY,
+)
+async def submit_detection_job_endpoint(
+    request: Request, job_queue: DetectionJobQueue = Depends(get_detection_job_queue)
+):
+    """Queue a detection and return a job id right away, poll the job for the result"""
+    image = await _read_image_payload(request)
+
+    try:
+        job_id = job_queue.submit(image)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+
+    return JobSubmitResponse(
+        job_id=job_id,
+        status="queued",
+        status_url=str(request.url_for("get_detection_job_endpoint", job_id=job_id)),
+    )
+
+@router.get("/detect-books/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_detection_job_endpoint(
+    job_id: str,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    job_queue: DetectionJobQueue = Depends(get_detection_job_queue),
+):
+    """Status of a detection job, with the books found so far and the final result once done"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    service = job_queue.detection_service
+    annotations = job["annotations"]
+    completed = {id(annotations[i]) for i in job["completed"] if i < len(annotations)}
+
+    # Group every detected book so shelf ids match the final result, then keep the finished ones
+    shelves = [
+        Shelf(
+            shelf_id=shelf.shelf_id,
+            annotations=[annotation for annotation in shelf.annotations if id(annotation) in completed],
+        )
+        for shelf in service.group_books_into_shelves(annotations)
+    ]
+
+    response = JobStatusResponse(
+        job_id=job_id,
+        status=job["status"],
+        books_detected=len(annotations),
+        books_completed=len(completed),
+        shelves=shelves,
+        result=_build_detection_response(service, annotations) if job["status"] == "done" else None,
+        error=job["error"],
+    )
+    return _encoded_response(response, encoding)
+
+def _layout_event(
+    service: BookDetectionService, annotations: List[BookAnnotation], encoding: Optional[PolygonEncoding] = None
+) -> dict:
+    """Shelves with the geometry of every detected book, before any title is known"""
+    indices = {id(annotation): index for index, annotation in enumerate(annotations)}
+    encode = encoding.encode if encoding is not None else (lambda polygons: polygons)
+    return {
+        "event": "layout",
+        "total_books": len(annotations),
+        "shelves": [
+            {
+                "shelf_id": shelf.shelf_id,
+                "books": [
+                    {"index": indices[id(annotation)], "polygons": encode(annotation.polygons), "xyxy": annotation.xyxy}
+                    for annotation in shelf.annotations
+                ],
+            }
+            for shelf in service.group_books_into_shelves(annotations)
+        ],
+    }
+
+def _books_event(annotations: List[BookAnnotation], completed: List[int]) -> dict:
+    return {
+        "event": "books",
+        "books": [
+            {"index": index, "title": annotations[index].title, "author": annotations[index].author}
+            for index in completed
+        ],
+    }
+
+async def _detection_events(
+    service: BookDetectionService, image, encoding: Optional[PolygonEncoding] = None
+) -> AsyncIterator[dict]:
+    """Run the pipeline, yielding the layout first and then the books of each finished Gemini batch"""
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_progress(annotations: List[BookAnnotation], completed: List[int]) -> None:
+        events.put_nowait(_books_event(annotations, completed) if completed else _layout_event(service, annotations, encoding))
+
+    task = asyncio.create_task(service.detect_books_in_image(image, on_progress))
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while (event := await events.get()) is not None:
+            yield event
+
+        annotations = task.result()
+        response = _build_detection_response(service, annotations)
+        yield {
+            "event": "done",
+            "total_books": len(annotations),
+            "valid_books": service.get_detection_stats(annotations)["valid_books"],
+            "message": response.message,
+        }
+    except Exception as e:
+        print(f"Error in streaming book detection: {str(e)}")
+        yield {"event": "error", "detail": f"Error processing image: {str(e)}"}
+    finally:
+        # Stop the pipeline when the client goes away mid-stream
+        task.cancel()
+
+@router.post(
+    "/detect-books/stream",
+    responses={200: {"content": {"application/x-ndjson": {}, "text/event-stream": {}}}},
+    openapi_extra=_IMAGE_REQUEST_BODY,
+)
+async def detect_books_stream_endpoint(
+    request: Request,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
+    """Stream the shelf layout as soon as the books are detected, then titles and authors as they arrive.
+
+    Sends newline delimited JSON, or server-sent events when the client accepts text/event-stream.
+    """
+    payload = await _read_image_payload(request)
+    # Decode before streaming, so invalid images still get a 400 response
+    image = await service.decode_image(payload)
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def body():
+            async for event in _detection_events(service, image, encoding):
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        media_type = "text/event-stream"
+    else:
+        async def body():
+            async for event in _detection_events(service, image, encoding):
+                yield json.dumps(event) + "\n"
+        media_type = "application/x-ndjson"
+
+    # Disable proxy buffering so each event reaches the client as soon as it is sent
+    return StreamingResponse(body(), media_type=media_type, headers={"X-Accel-Buffering": "no"})
+
+@router.post(
+    "/inventories/{inventory_id}/scans",
+    response_model=InventoryScanResponse,
+    openapi_extra=_IMAGE_REQUEST_BODY,
+)
+async def scan_inventory_endpoint(
+    inventory_id: str,
+    request: Request,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
+    """Diff a scan of a bookcase against its stored inventory, reading only new spines with Gemini"""
+    payload = await _read_image_payload(request)
+
+    try:
+        image = await service.decode_image(payload)
+        diff = await service.scan_inventory(inventory_id, image)
+        shelves = service.group_books_into_shelves(diff["annotations"])
+
+        response = InventoryScanResponse(
+            inventory_id=inventory_id,
+            added=diff["added"],
+            removed=diff["removed"],
+            moved=diff["moved"],
+            shelves=shelves,
+            message=(
+                f"{len(diff['annotations'])} books on {len(shelves)} shelves: {len(diff['added'])} added, "
+                f"{len(diff['removed'])} removed, {len(diff['moved'])} moved"
+            ),
+        )
+        return _encoded_response(response, encoding)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in inventory scan: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing image: {str(e)}"
+        )
+
+@router.get("/inventories/{inventory_id}", response_model=InventoryResponse)
+async def get_inventory_endpoint(
+    inventory_id: str,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
+    """Books stored for a bookcase by its last scan"""
+    # SQLite reads block, keep them off the event loop
+    loop = asyncio.get_running_loop()
+    stored = await loop.run_in_executor(None, lambda: service.inventory.load(inventory_id))
+    annotations = [annotation for annotation, _ in stored]
+    if not annotations:
+        raise HTTPException(status_code=404, detail=f"Inventory {inventory_id} not found")
+
+    response = InventoryResponse(
+        inventory_id=inventory_id,
+        total_books=len(annotations),
+        shelves=service.group_books_into_shelves(annotations),
+    )
+    return _encoded_response(response, encoding)
+
+@router.get("/inventories/{inventory_id}/books", response_model=BookSearchResponse)
+async def search_books_endpoint(
+    inventory_id: str,
+    q: str = Query(..., min_length=1, description="Title and/or author to look for, typos are tolerated"),
+    limit: int = Query(5, ge=1, le=50, description="Maximum number of results"),
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
+    """Search the books of a bookcase by title or author"""
+    # Building the index after a new scan is CPU work, keep it off the event loop
+    loop = asyncio.get_running_loop()
+    matches = await loop.run_in_executor(None, service.search_books, inventory_id, q, limit)
+    if matches is None:
+        raise HTTPException(status_code=404, detail=f"Inventory {inventory_id} not found")
+
+    response = BookSearchResponse(
+        inventory_id=inventory_id,
+        query=q,
+        results=matches,
+        message=f"Found {len(matches)} matching books",
+    )
+    return _encoded_response(response, encoding)
+
+@router.post("/inventories/{inventory_id}/locate", response_model=BookSearchResponse)
+async def locate_books_endpoint(
+    inventory_id: str,
+    request: LocateRequest,
+    encoding: Optional[PolygonEncoding] = Depends(get_polygon_encoding),
+    service: BookDetectionService = Depends(get_book_detection_service),
+):
+    """Find books by title or author and light their spot on the shelf"""
+    loop = asyncio.get_running_loop()
+    matches = await loop.run_in_executor(
+        None, service.search_books, inventory_id, request.query, request.limit
+    )
+    if matches is None:
+        raise HTTPException(status_code=404, detail=f"Inventory {inventory_id} not found")
+
+    try:
+        lit = bool(matches) and await service.light_books(
+            matches, color=(request.r, request.g, request.b), brightness=request.a
+        )
+    except httpx.HTTPError as e:
+        print(f"Error lighting books: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"LED controller error: {str(e)}")
+
+    if not matches:
+        message = "No matching books found"
+    elif lit:
+        message = f"Lit {len(matches)} books"
+    else:
+        message = f"Found {len(matches)} books, no LED controller is configured"
+    response = BookSearchResponse(
+        inventory_id=inventory_id, query=request.query, results=matches, lit=lit, message=message
+    )
+    return _encoded_response(response, encoding)
+
+@router.post("/leds/clear", status_code=204)
+async def clear_leds_endpoint(service: BookDetectionService = Depends(get_book_detection_service)):
+    """Turn off every LED of the strip"""
+    if service.led_controller is None:
+        raise HTTPException(status_code=503, detail="No LED controller is configured")
+    try:
+        await service.led_controller.clear()
+    except httpx.HTTPError as e:
+        print(f"Error clearing LEDs: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"LED controller error: {str(e)}")
+    return Response(status_code=204)
+
+@router.delete("/inventories/{inventory_id}", status_code=204)
+async def delete_inventory_endpoint(
+    inventory_id: str, service: BookDetectionService = Depends(get_book_detection_service)
+):
+    """Forget a bookcase, so its next scan starts from scratch"""
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(None, lambda: service.inventory.delete(inventory_id)):
+        raise HTTPException(status_code=404, detail=f"Inventory {inventory_id} not found")
+    return Response(status_code=204)
+
 @router.get("/books/stats", response_model=StatsResponse)
-async def get_books_stats():
+async def get_books_stats(service: BookDetectionService = Depends(get_book_detection_service)):
     """Get cumulative statistics for book detection service"""
     try:
-        stats = book_detection_service.get_cumulative_stats()
+        stats = service.get_cumulative_stats()
         return StatsResponse(**stats)
     except Exception as e:
         print(f"Error retrieving stats: {str(e)}")
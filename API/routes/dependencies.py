@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from typing import Optional
+
+from fastapi import Depends
+
+from config import settings
+from services import BookDetectionService, DetectionJobQueue
+
+# Built on first use rather than on import, so the server starts without loading the detection stack
+_book_detection_service: Optional[BookDetectionService] = None
+_detection_job_queue: Optional[DetectionJobQueue] = None
+_build_lock = threading.Lock()
+
+
+def build_book_detection_service() -> BookDetectionService:
+    """The process-wide detection service, built by the first caller.
+
+    Building it imports supervision and google.genai, creates the remote
+    clients and loads the ONNX model when configured, which takes a while:
+    call it from a worker thread. The startup warm-up does so in the background.
+    """
+    global _book_detection_service
+    with _build_lock:
+        if _book_detection_service is None:
+            _book_detection_service = BookDetectionService()
+    return _book_detection_service
+
+
+def peek_book_detection_service() -> Optional[BookDetectionService]:
+    """The detection service if it was already built, None otherwise, without building it"""
+    return _book_detection_service
+
+
+async def get_book_detection_service() -> BookDetectionService:
+    if _book_detection_service is not None:
+        return _book_detection_service
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, build_book_detection_service)
+
+
+async def get_detection_job_queue(
+    service: BookDetectionService = Depends(get_book_detection_service),
+) -> DetectionJobQueue:
+    global _detection_job_queue
+    # Only ever built on the event loop thread, no lock needed
+    if _detection_job_queue is None:
+        _detection_job_queue = DetectionJobQueue(
+            service,
+            max_queued=settings.JOB_QUEUE_MAX_SIZE,
+            workers=settings.JOB_WORKERS,
+            ttl_seconds=settings.JOB_TTL_SECONDS,
+            max_jobs=settings.JOB_MAX_ENTRIES,
+            db_path=settings.JOB_DB_PATH,
+        )
+    return _detection_job_queue
@@ -1,4 +1,6 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+
+from services import readiness
 
 router = APIRouter(tags=["index"])
 
@@ -11,6 +13,21 @@ async def root():
         "status": "operational",
         "endpoints": {
             "detect_books": "/api/v1/detect-books",
-            "service_stats": "/api/v1/books/stats"
+            "detect_books_upload": "/api/v1/detect-books/upload",
+            "detect_books_bulk": "/api/v1/detect-books/bulk",
+            "detect_books_jobs": "/api/v1/detect-books/jobs",
+            "detect_books_stream": "/api/v1/detect-books/stream",
+            "inventories": "/api/v1/inventories/{inventory_id}",
+            "service_stats": "/api/v1/books/stats",
+            "metrics": "/metrics",
+            "ready": "/ready"
         }
     }
+
+@router.get("/ready")
+async def ready(response: Response):
+    """Readiness probe: 503 until the services are built and the connection pool is warm"""
+    status = readiness.status()
+    if not status["ready"]:
+        response.status_code = 503
+    return status
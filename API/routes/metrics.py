@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services import metrics
+from services.metrics import CACHE_HIT_RATIO
+from .dependencies import peek_book_detection_service
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, HTTP traffic and cache hit ratios"""
+    # Scrapes never build the detection service, so metrics stay available while it is
+    # still being built or failed to build; the cache ratios appear once it exists
+    service = peek_book_detection_service()
+    if service is not None:
+        stats = service.get_cumulative_stats()
+        CACHE_HIT_RATIO.set(stats["cache_hit_ratio"], cache="result")
+        region_lookups = stats["region_cache_hits"] + stats["region_cache_misses"]
+        CACHE_HIT_RATIO.set(
+            stats["region_cache_hits"] / region_lookups if region_lookups > 0 else 0.0,
+            cache="region"
+        )
+
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
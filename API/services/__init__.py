@@ -1,9 +1,36 @@
+from .http_clients import HTTPClientPool, RoboflowHTTPClient, http_pool
+from .detectors import DetectorBackend, NoDetector, OnnxDetector, RoboflowDetector, create_detector
 from .image_service import ImageProcessingService
 from .gemini_service import GeminiService
 from .book_detection_service import BookDetectionService
+from .job_queue import DetectionJobQueue, JobQueueFullError
+from .metrics import MetricsMiddleware, metrics
+from .polygon_encoding import PolygonEncoding
+from .process_pool import ProcessWorkerPool, shared_process_pool, shutdown_shared_process_pool
+from .readiness import Readiness, readiness
+from .single_flight import SingleFlight
 
 __all__ = [
+    "HTTPClientPool",
+    "RoboflowHTTPClient",
+    "http_pool",
+    "DetectorBackend",
+    "NoDetector",
+    "RoboflowDetector",
+    "OnnxDetector",
+    "create_detector",
     "ImageProcessingService",
     "GeminiService", 
-    "BookDetectionService"
+    "BookDetectionService",
+    "DetectionJobQueue",
+    "JobQueueFullError",
+    "MetricsMiddleware",
+    "metrics",
+    "PolygonEncoding",
+    "ProcessWorkerPool",
+    "shared_process_pool",
+    "shutdown_shared_process_pool",
+    "Readiness",
+    "readiness",
+    "SingleFlight"
 ]
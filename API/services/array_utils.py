@@ -0,0 +1,23 @@
+import numpy as np
+
+# Number of set bits for every possible byte value
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint16)
+
+
+def hamming_distances(bits: np.ndarray, other_bits: np.ndarray) -> np.ndarray:
+    """Bit differences between packed uint8 bit arrays along their last axis, broadcast like np.bitwise_xor"""
+    return _POPCOUNT[np.bitwise_xor(bits, other_bits)].sum(axis=-1)
+
+
+def pairwise_iou(boxes: np.ndarray, other_boxes: np.ndarray) -> np.ndarray:
+    """IoU of every box in ``boxes`` with every box in ``other_boxes``, as an (n, m) matrix"""
+    x1 = np.maximum(boxes[:, None, 0], other_boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], other_boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], other_boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], other_boxes[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    other_areas = (other_boxes[:, 2] - other_boxes[:, 0]) * (other_boxes[:, 3] - other_boxes[:, 1])
+    union = areas[:, None] + other_areas[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
@@ -1,117 +1,432 @@
-from typing import List, Optional, Dict, Any
+import asyncio
+import hashlib
+import threading
+from typing import Callable, List, Optional, Dict, Any, Tuple, Union
 import numpy as np
 
 from config import settings
-from models import BookAnnotation, Shelf
+from models import BookAnnotation, BookMatch, Shelf, ProcessingResult
+from .book_index import BookIndex
 from .image_service import ImageProcessingService
 from .gemini_service import GeminiService
+from .gemini_scheduler import GeminiBatchScheduler
+from .inventory import ShelfInventory
+from .led_controller import create_led_controller, led_ranges
+from .metrics import STAGE_SECONDS
+from .region_cache import RegionCache
+from .result_cache import ResultCache
+from .shelf_grouping import group_boxes_into_shelves
+from .single_flight import SingleFlight
+
+# Called with the annotations of an image and the indices of the books whose
+# title and author just arrived; an empty list announces the detected layout
+ProgressCallback = Callable[[List[BookAnnotation], List[int]], None]
 
 class BookDetectionService:
     """Main service that orchestrates the book detection pipeline"""
 
-    def __init__(self):
-        self.image_service = ImageProcessingService()
-        self.gemini_service = GeminiService()
-        # Initialize cumulative stats tracking
+    def __init__(
+        self,
+        image_service: Optional[ImageProcessingService] = None,
+        gemini_service: Optional[GeminiService] = None,
+    ):
+        self.image_service = image_service or ImageProcessingService()
+        self.gemini_service = gemini_service or GeminiService()
+        # Shared across requests, so concurrency caps and batch sizing apply globally
+        self.gemini_scheduler = GeminiBatchScheduler(self.gemini_service)
+        self.result_cache = ResultCache(
+            max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.RESULT_CACHE_TTL_SECONDS,
+            db_path=settings.RESULT_CACHE_DB_PATH,
+        ) if settings.RESULT_CACHE_ENABLED else None
+        self.region_cache = RegionCache(
+            max_entries=settings.REGION_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.REGION_CACHE_TTL_SECONDS,
+            max_distance=settings.REGION_CACHE_MAX_DISTANCE,
+            fingerprint_bytes=(settings.REGION_CACHE_HASH_SIZE ** 2 + 7) // 8,
+        ) if settings.REGION_CACHE_ENABLED else None
+        # Identical images in flight at the same time are detected once
+        self._in_flight = SingleFlight()
+        # Opened on first use, so the database file is only created when inventories are used
+        self._inventory: Optional[ShelfInventory] = None
+        # Inventories are used from worker threads, only one of them may open the database
+        self._inventory_lock = threading.Lock()
+        # Search index per inventory, with the inventory save time it was built from
+        self._book_indexes: Dict[str, Tuple[float, BookIndex]] = {}
+        # Lookups run in executor threads, the lock guards the dict while indexes are built outside it
+        self._book_indexes_lock = threading.Lock()
+        self.led_controller = create_led_controller()
+        # Initialize cumulative stats tracking, guarded by a lock as requests may run in worker threads
+        self._stats_lock = threading.Lock()
         self._total_requests = 0
         self._total_books_detected = 0
         self._total_valid_books = 0
 
-    def _get_book_vertical_info(self, book: BookAnnotation) -> Optional[Dict[str, float]]:
-        if not book.xyxy or len(book.xyxy) != 4:
-            return None
+    def group_books_into_shelves(self, books: List[BookAnnotation]) -> List[Shelf]:
+        with STAGE_SECONDS.time(stage="shelf_grouping"):
+            return self._group_books_into_shelves(books)
 
-        x1, y1, x2, y2 = book.xyxy
-        center_y = (y1 + y2) / 2
+    def _group_books_into_shelves(self, books: List[BookAnnotation]) -> List[Shelf]:
+        # Books without a usable bounding box can't be placed on a shelf
+        placed = [book for book in books if book.xyxy and len(book.xyxy) == 4]
+        if not placed:
+            return []
 
-        return {
-            "centerY": center_y,
-            "top": y1,
-            "bottom": y2
-        }
+        shelves = group_boxes_into_shelves(
+            np.array([book.xyxy for book in placed]),
+            correct_tilt=settings.SHELF_TILT_CORRECTION,
+        )
+        return [
+            Shelf(shelf_id=shelf_id, annotations=[placed[index] for index in indices])
+            for shelf_id, indices in enumerate(shelves, start=1)
+        ]
+
+    async def decode_image(self, image: Union[str, bytes]) -> np.ndarray:
+        """Decode a base64 string or raw image bytes, off the event loop as decoding is CPU-bound"""
+        decode = (
+            self.image_service.decode_image_bytes if isinstance(image, bytes)
+            else self.image_service.decode_base64_image
+        )
+        loop = asyncio.get_running_loop()
+        with STAGE_SECONDS.time(stage="decode"):
+            return await loop.run_in_executor(None, decode, image)
 
-    def _should_be_on_same_shelf(self, book1_info: Dict[str, float], book2_info: Dict[str, float]) -> bool:
-        if not book1_info or not book2_info:
-            return False
+    async def detect_books_from_base64(
+        self, base64_image: str, on_progress: Optional[ProgressCallback] = None
+    ) -> List[BookAnnotation]:
+        # Coalesce on the image bytes, so a photo sent as base64 and as an upload count as the same
+        loop = asyncio.get_running_loop()
+        image_bytes = await loop.run_in_executor(None, self.image_service.base64_to_bytes, base64_image)
+        return await self.detect_books_from_bytes(image_bytes, on_progress)
 
-        # Check for vertical overlap
-        overlap_top = max(book1_info["top"], book2_info["top"])
-        overlap_bottom = min(book1_info["bottom"], book2_info["bottom"])
+    async def detect_books_from_bytes(
+        self, image_bytes: bytes, on_progress: Optional[ProgressCallback] = None
+    ) -> List[BookAnnotation]:
+        """Detect the books in an encoded image.
 
-        # If there's any vertical overlap, they should be on the same shelf
-        return overlap_top < overlap_bottom
+        Without ``on_progress``, concurrent requests for the same image bytes
+        share one pipeline run and get the same annotations, which callers
+        must not modify.
+        """
+        if on_progress is not None or not settings.REQUEST_COALESCING_ENABLED:
+            return await self.detect_books_in_image(await self.decode_image(image_bytes), on_progress)
 
-    def group_books_into_shelves(self, books: List[BookAnnotation]) -> List[Shelf]:
-        if not books:
-            return []
+        loop = asyncio.get_running_loop()
+        key = await loop.run_in_executor(None, lambda: hashlib.sha256(image_bytes).hexdigest())
 
-        # Get book info and sort by vertical position
-        book_infos = []
-        for book in books:
-            info = self._get_book_vertical_info(book)
-            if info is not None:
-                book_infos.append({"book": book, "info": info})
+        async def detect() -> List[BookAnnotation]:
+            return await self.detect_books_in_image(await self.decode_image(image_bytes))
 
-        if not book_infos:
-            return []
+        return await self._in_flight.run(key, detect)
 
-        # Sort by vertical center position
-        book_infos.sort(key=lambda x: x["info"]["centerY"])
+    async def detect_books_from_base64_bulk(self, base64_images: List[str]) -> List[List[BookAnnotation]]:
+        """detect_books_in_images for base64 images, decoded one by one as they are detected.
 
-        shelves = []
-        current_shelf = [book_infos[0]["book"]]
-        shelf_counter = 1
+        At most BULK_IMAGE_CONCURRENCY full resolution frames are held at a
+        time, each is dropped once its book regions are extracted.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(max(1, settings.BULK_IMAGE_CONCURRENCY))
 
-        # Single pass grouping
-        for i in range(1, len(book_infos)):
-            current_book = book_infos[i]
-            last_book_in_shelf = current_shelf[-1]
-            last_book_info = self._get_book_vertical_info(last_book_in_shelf)
+        async def prepare(base64_image: str):
+            async with semaphore:
+                # Decoding is CPU-bound, run it in the default executor
+                with STAGE_SECONDS.time(stage="decode"):
+                    image = await loop.run_in_executor(None, self.image_service.decode_base64_image, base64_image)
+                return await self._prepare_image(image)
 
-            if self._should_be_on_same_shelf(last_book_info, current_book["info"]):
-                current_shelf.append(current_book["book"])
-            else:
-                shelves.append(Shelf(shelf_id=shelf_counter, annotations=current_shelf))
-                current_shelf = [current_book["book"]]
-                shelf_counter += 1
+        prepared = await asyncio.gather(*[prepare(base64_image) for base64_image in base64_images])
+        return await self._detect_books_in_prepared(prepared, [None] * len(prepared))
 
-        # Add the last shelf
-        shelves.append(Shelf(shelf_id=shelf_counter, annotations=current_shelf))
-        return shelves
+    async def detect_books_in_image(
+        self, image: np.ndarray, on_progress: Optional[ProgressCallback] = None
+    ) -> List[BookAnnotation]:
+        return (await self.detect_books_in_images([image], [on_progress]))[0]
 
-    def detect_books_from_base64(self, base64_image: str) -> List[BookAnnotation]:
-        image = self.image_service.decode_base64_image(base64_image)
-        detections = self.image_service.detect_books_in_image(image)
+    async def detect_books_in_images(
+        self,
+        images: List[np.ndarray],
+        on_progress: Optional[List[Optional[ProgressCallback]]] = None,
+    ) -> List[List[BookAnnotation]]:
+        """Detect books in several images, sending the spines of all images to Gemini together.
+
+        Detection runs concurrently per image, then the regions of every image
+        are pooled so Gemini batches are filled across image boundaries, and the
+        results are split back into one annotation list per image.
+
+        ``on_progress`` optionally holds one callback per image. It is called
+        once with the detected layout before any title is known, then with the
+        books of each Gemini batch as soon as the batch finishes.
+        """
+        callbacks = on_progress or [None] * len(images)
+        prepared = await asyncio.gather(*[self._prepare_image(image) for image in images])
+        return await self._detect_books_in_prepared(prepared, callbacks)
+
+    async def _detect_books_in_prepared(
+        self, prepared: List[Tuple], callbacks: List[Optional[ProgressCallback]]
+    ) -> List[List[BookAnnotation]]:
+        """Annotate images returned by _prepare_image, reading the titles of all of them in shared Gemini batches"""
+        # Build the annotations from the detections alone, titles are filled in as batches finish
+        annotations_per_image = []
+        pooled_regions = []
+        owners: List[Tuple[int, int]] = []
+        for image_index, (cache_key, cached_annotations, detections, regions, polygons) in enumerate(prepared):
+            callback = callbacks[image_index]
+            if cached_annotations is not None:
+                annotations_per_image.append(cached_annotations)
+                if callback is not None:
+                    callback(cached_annotations, [])
+                    callback(cached_annotations, list(range(len(cached_annotations))))
+                continue
+
+            with STAGE_SECONDS.time(stage="annotation"):
+                annotations = self._create_annotations(
+                    books=[self._unknown_result()] * len(regions),
+                    polygons=polygons,
+                    detections=detections
+                )
+            annotations_per_image.append(annotations)
+            if callback is not None:
+                callback(annotations, [])
+
+            pooled_regions.extend(regions)
+            owners.extend((image_index, book_index) for book_index in range(len(regions)))
+
+        def on_books(indices: List[int], books: List[ProcessingResult]) -> None:
+            completed: Dict[int, List[int]] = {}
+            for pooled_index, book in zip(indices, books):
+                image_index, book_index = owners[pooled_index]
+                annotations = annotations_per_image[image_index]
+                if book_index >= len(annotations):
+                    continue
+                print(f"Processing book {book_index+1}: {book}")
+                annotations[book_index].title = book.title
+                annotations[book_index].author = book.author
+                completed.setdefault(image_index, []).append(book_index)
+
+            for image_index, book_indices in completed.items():
+                if callbacks[image_index] is not None:
+                    callbacks[image_index](annotations_per_image[image_index], book_indices)
+
+        if pooled_regions:
+            await self._process_regions_in_batches(pooled_regions, on_books)
 
-        # Extract book regions from detections
-        processed_regions, polygons = self.image_service.extract_book_regions(image, detections)
+        print("Processed books...")
 
-        if not processed_regions:
-            return []
+        for (cache_key, cached_annotations, *_), annotations in zip(prepared, annotations_per_image):
+            # Update cumulative stats
+            self._update_cumulative_stats(annotations)
+
+            # Don't cache results where Gemini failed for every book, so they get retried
+            if (cached_annotations is None and cache_key is not None
+                    and self.get_detection_stats(annotations)["valid_books"] > 0):
+                await self.result_cache.set_async(*cache_key, annotations)
+
+        return annotations_per_image
+
+    @property
+    def inventory(self) -> ShelfInventory:
+        with self._inventory_lock:
+            if self._inventory is None:
+                self._inventory = ShelfInventory(
+                    db_path=settings.INVENTORY_DB_PATH,
+                    iou_threshold=settings.INVENTORY_IOU_THRESHOLD,
+                    max_distance=settings.REGION_CACHE_MAX_DISTANCE,
+                )
+        return self._inventory
+
+    def book_index(self, inventory_id: str) -> Optional[BookIndex]:
+        """Search index of an inventory, None if it doesn't exist.
+
+        Cached until the inventory is saved again, also by another process
+        sharing the database, so a lookup only costs one timestamp query.
+        """
+        updated_at = self.inventory.updated_at(inventory_id)
+        with self._book_indexes_lock:
+            if updated_at is None:
+                self._book_indexes.pop(inventory_id, None)
+                return None
+            cached = self._book_indexes.get(inventory_id)
+        if cached is not None and cached[0] == updated_at:
+            return cached[1]
+
+        with STAGE_SECONDS.time(stage="book_index"):
+            books = [annotation for annotation, _ in self.inventory.load(inventory_id)]
+            xyxy = np.array([book.xyxy for book in books], dtype=np.float32).reshape(-1, 4)
+            shelves = group_boxes_into_shelves(xyxy, correct_tilt=settings.SHELF_TILT_CORRECTION) if books else []
+            shelf_indices = np.zeros(len(books), dtype=np.int32)
+            for shelf_index, indices in enumerate(shelves):
+                shelf_indices[indices] = shelf_index
+            leds = led_ranges(
+                xyxy, shelf_indices, len(shelves), settings.LED_COUNT,
+                strip_shelves=settings.LED_STRIP_SHELVES, serpentine=settings.LED_SERPENTINE,
+            )
+            index = BookIndex(books, shelf_ids=shelf_indices + 1, leds=leds)
+
+        with self._book_indexes_lock:
+            # A concurrent lookup may have indexed a newer save meanwhile, keep that one
+            cached = self._book_indexes.get(inventory_id)
+            if cached is None or cached[0] <= updated_at:
+                self._book_indexes[inventory_id] = (updated_at, index)
+        return index
+
+    def search_books(self, inventory_id: str, query: str, limit: int = 5) -> Optional[List[BookMatch]]:
+        """Best matches for a title or author in an inventory, None if the inventory doesn't exist"""
+        index = self.book_index(inventory_id)
+        if index is None:
+            return None
+        return [
+            BookMatch(
+                book=index.books[book_id],
+                shelf_id=int(index.shelf_ids[book_id]),
+                score=round(score, 3),
+                leds=index.leds[book_id].tolist(),
+            )
+            for book_id, score in index.search(query, limit=limit, min_score=settings.BOOK_SEARCH_MIN_SCORE)
+        ]
 
-        # Process regions in batches using Gemini
-        books = []
-        batch_size = settings.BATCH_SIZE
+    async def light_books(self, matches: List[BookMatch], color: Tuple[int, int, int], brightness: int) -> bool:
+        """Light the LEDs in front of the books, clearing the rest of the strip, in one request to the
+        controller. Returns False when no controller is configured."""
+        if self.led_controller is None:
+            return False
+        await self.led_controller.light([match.leds for match in matches], color=color, brightness=brightness)
+        return True
+
+    async def scan_inventory(self, inventory_id: str, image: np.ndarray) -> Dict[str, List[BookAnnotation]]:
+        """Diff a scan against the stored inventory of a bookcase, reading only new spines with Gemini.
+
+        Returns the books of the scan ("annotations") and the books that were
+        "added", "removed" or "moved" since the previous scan, then stores the
+        scan as the new inventory.
+        """
+        loop = asyncio.get_running_loop()
+        _, _, detections, regions, polygons = await self._prepare_image(image, use_result_cache=False)
+
+        with STAGE_SECONDS.time(stage="inventory_match"):
+            fingerprints = await loop.run_in_executor(
+                None, self.image_service.compute_region_fingerprints, regions, settings.REGION_CACHE_HASH_SIZE
+            )
 
-        for i in range(0, len(processed_regions), batch_size):
-            batch = processed_regions[i:i + batch_size]
-            print(f"Processing batch {i//batch_size + 1} with {len(batch)} regions...")
-            batch_results = self.gemini_service.process_book_regions(batch)
-            books.extend(batch_results)
+            def load_and_match():
+                stored = self.inventory.load(inventory_id)
+                return stored, *self.inventory.match(stored, detections.xyxy, fingerprints)
 
-        print("Processed books...")
+            # SQLite reads and the matching both block, keep them off the event loop
+            stored, matches, moved = await loop.run_in_executor(None, load_and_match)
 
-        # Create annotations using only Gemini results
-        annotations = self._create_annotations(
-            books=books,
-            polygons=polygons,
-            detections=detections
-        )
+        books: List[Optional[ProcessingResult]] = [None] * len(regions)
+        for scanned, stored_index in matches.items():
+            annotation = stored[stored_index][0]
+            # Books Gemini couldn't read last time get another try
+            if annotation.title != "Title Unknown" and annotation.author != "Author Unknown":
+                books[scanned] = ProcessingResult(title=annotation.title, author=annotation.author)
+
+        pending = [i for i, book in enumerate(books) if book is None]
+        print(f"Inventory {inventory_id}: reusing {len(regions) - len(pending)} books, sending {len(pending)} to Gemini...")
+        if pending:
+            pending_results = await self._process_regions_in_batches([regions[i] for i in pending])
+            for index, book in zip(pending, pending_results):
+                books[index] = book
+
+        with STAGE_SECONDS.time(stage="annotation"):
+            annotations = self._create_annotations(books=books, polygons=polygons, detections=detections)
 
-        # Update cumulative stats
         self._update_cumulative_stats(annotations)
+        await loop.run_in_executor(None, self.inventory.save, inventory_id, list(zip(annotations, fingerprints)))
 
-        return annotations
+        matched_stored = set(matches.values())
+        return {
+            "annotations": annotations,
+            "added": [annotation for i, annotation in enumerate(annotations) if i not in matches],
+            "removed": [annotation for j, (annotation, _) in enumerate(stored) if j not in matched_stored],
+            "moved": [annotation for i, annotation in enumerate(annotations) if i in moved],
+        }
+
+    async def _prepare_image(
+        self, image: np.ndarray, use_result_cache: bool = True
+    ) -> Tuple[Optional[Tuple[str, str]], Optional[List[BookAnnotation]], Any, List[np.ndarray], List]:
+        """Look the image up in the result cache, or detect its books and extract their regions.
+
+        Returns the cache key and image digest, the cached annotations (None on a miss), and the
+        detections, regions and polygons to send to Gemini.
+        """
+        loop = asyncio.get_running_loop()
+
+        # Re-scans of an unchanged shelf are answered from the result cache
+        cache_key = None
+        if self.result_cache is not None and use_result_cache:
+            with STAGE_SECONDS.time(stage="result_cache_lookup"):
+                cache_key = await loop.run_in_executor(
+                    None, self.image_service.compute_result_cache_key, image, settings.RESULT_CACHE_HASH_SIZE
+                )
+            cached_annotations = await self.result_cache.get_async(*cache_key)
+            if cached_annotations is not None:
+                print("Returning cached detection result...")
+                return cache_key, cached_annotations, None, [], []
+
+        if self.image_service.should_tile(image):
+            with STAGE_SECONDS.time(stage="tiled_detection"):
+                detections, processed_regions, polygons = await self.image_service.detect_and_extract_tiled(image)
+            return cache_key, None, detections, processed_regions, polygons
+
+        with STAGE_SECONDS.time(stage="detection"):
+            detections = await self.image_service.detect_books_in_image_async(image)
+
+        # Extract book regions from detections
+        with STAGE_SECONDS.time(stage="mask_extraction"):
+            processed_regions, polygons = await loop.run_in_executor(
+                None, self.image_service.extract_book_regions, image, detections
+            )
+
+        return cache_key, None, detections, processed_regions, polygons
+
+    async def _process_regions_in_batches(
+        self,
+        regions: List[np.ndarray],
+        on_books: Optional[Callable[[List[int], List[ProcessingResult]], None]] = None,
+    ) -> List[ProcessingResult]:
+        """Send regions to Gemini in concurrent batches, keeping the original region order.
+
+        ``on_books`` is called with region indices and their results as soon as
+        they are known, first for region cache hits, then per Gemini batch.
+        """
+        books: List[Optional[ProcessingResult]] = [None] * len(regions)
+
+        # Spines seen in an earlier scan are answered from the region cache
+        fingerprints = None
+        if self.region_cache is not None:
+            loop = asyncio.get_running_loop()
+            with STAGE_SECONDS.time(stage="region_cache_lookup"):
+                fingerprints = await loop.run_in_executor(
+                    None, self.image_service.compute_region_fingerprints, regions, settings.REGION_CACHE_HASH_SIZE
+                )
+            for i, fingerprint in enumerate(fingerprints):
+                books[i] = self.region_cache.get(*fingerprint)
+
+        pending = [i for i, book in enumerate(books) if book is None]
+        if len(pending) < len(regions):
+            print(f"Reusing {len(regions) - len(pending)} cached books, sending {len(pending)} to Gemini...")
+            if on_books is not None:
+                cached = [i for i, book in enumerate(books) if book is not None]
+                on_books(cached, [books[i] for i in cached])
+
+        def on_batch(start: int, results: List[ProcessingResult]) -> None:
+            on_books(pending[start:start + len(results)], results)
+
+        with STAGE_SECONDS.time(stage="gemini"):
+            pending_results = await self.gemini_scheduler.process(
+                [regions[index] for index in pending],
+                on_batch if on_books is not None else None,
+            )
+
+        for index, book in zip(pending, pending_results):
+            books[index] = book
+            # Only remember readable spines, unknown ones should be retried next scan
+            if fingerprints is not None and book.title != "Title Unknown" and book.author != "Author Unknown":
+                self.region_cache.set(*fingerprints[index], book)
+
+        return books
 
     def _create_annotations(
         self,
@@ -121,16 +436,11 @@ class BookDetectionService:
     ) -> List[BookAnnotation]:
         annotations = []
 
-        for i, (book, polygon_list, xyxy) in enumerate(
-            zip(books, polygons, detections.xyxy)
-        ):
+        for book, polygon_list, xyxy in zip(books, polygons, detections.xyxy):
             # Use only Gemini results
-            print(f"Processing book {i+1}: {book}")
             title = book.title
             author = book.author
 
-            print(f"Title: {title}, Author: {author}")
-
             annotation = BookAnnotation(
                 title=title,
                 author=author,
@@ -141,6 +451,9 @@ class BookDetectionService:
 
         return annotations
 
+    def _unknown_result(self) -> ProcessingResult:
+        return ProcessingResult(title="Title Unknown", author="Author Unknown")
+
     def get_detection_stats(self, annotations: List[BookAnnotation]) -> dict:
         total_books = len(annotations)
 
@@ -155,22 +468,42 @@ class BookDetectionService:
 
     def _update_cumulative_stats(self, annotations: List[BookAnnotation]) -> None:
         """Update cumulative statistics with data from the current detection request"""
-        self._total_requests += 1
         total_books = len(annotations)
         valid_books = sum(1 for book in annotations if book.title != "Title Unknown" and book.author != "Author Unknown")
 
-        self._total_books_detected += total_books
-        self._total_valid_books += valid_books
+        with self._stats_lock:
+            self._total_requests += 1
+            self._total_books_detected += total_books
+            self._total_valid_books += valid_books
 
     def get_cumulative_stats(self) -> dict:
         """Get cumulative statistics across all detection requests"""
-        overall_accuracy = (self._total_valid_books / self._total_books_detected) if self._total_books_detected > 0 else 0.0
-        average_books_per_request = (self._total_books_detected / self._total_requests) if self._total_requests > 0 else 0.0
+        with self._stats_lock:
+            total_requests = self._total_requests
+            total_books_detected = self._total_books_detected
+            total_valid_books = self._total_valid_books
+
+        overall_accuracy = (total_valid_books / total_books_detected) if total_books_detected > 0 else 0.0
+        average_books_per_request = (total_books_detected / total_requests) if total_requests > 0 else 0.0
+
+        cache_stats = self.result_cache.get_stats() if self.result_cache is not None else {
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "cache_hit_ratio": 0.0,
+        }
+        scheduler_stats = self.gemini_scheduler.get_stats()
+        region_cache_stats = self.region_cache.get_stats() if self.region_cache is not None else {
+            "region_cache_hits": 0,
+            "region_cache_misses": 0,
+        }
 
         return {
-            "total_requests": self._total_requests,
-            "total_books_detected": self._total_books_detected,
-            "total_valid_books": self._total_valid_books,
+            "total_requests": total_requests,
+            "total_books_detected": total_books_detected,
+            "total_valid_books": total_valid_books,
             "overall_accuracy": round(overall_accuracy, 4),
-            "average_books_per_request": round(average_books_per_request, 2)
+            "average_books_per_request": round(average_books_per_request, 2),
+            **cache_stats,
+            **region_cache_stats,
+            **scheduler_stats
         }
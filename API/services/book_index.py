@@ -0,0 +1,83 @@
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from models import BookAnnotation
+
+# Placeholders stored for books Gemini couldn't read, never worth matching
+_UNKNOWN = {"title unknown", "author unknown"}
+
+
+def normalize_text(text: str) -> str:
+    """Casefold, strip accents and punctuation and collapse whitespace, so "Gödel, Escher" matches "godel escher" """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrams of every word of a normalized text, padded like pg_trgm.
+
+    Two leading spaces make the first letters of a word trigrams of their
+    own, so a prefix such as "tol" matches "tolkien".
+    """
+    result = set()
+    for word in text.split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class BookIndex:
+    """Trigram index over the titles and authors of an inventory, for fuzzy book search.
+
+    Every trigram maps to the array of books containing it. A query scores
+    books by the fraction of its trigrams they contain, so typos and partial
+    titles still match, and ties go to the book whose text is closest to the
+    query as a whole. The index also holds where every book is: its shelf and
+    the range of LEDs in front of it.
+    """
+
+    def __init__(self, books: Sequence[BookAnnotation], shelf_ids: np.ndarray, leds: np.ndarray):
+        self.books = list(books)
+        self.shelf_ids = shelf_ids
+        self.leds = leds
+
+        postings: Dict[str, List[int]] = defaultdict(list)
+        self._trigram_counts = np.zeros(len(self.books), dtype=np.int32)
+        for book_id, book in enumerate(self.books):
+            fields = [normalize_text(book.title), normalize_text(book.author)]
+            book_trigrams = trigrams(" ".join(field for field in fields if field not in _UNKNOWN))
+            self._trigram_counts[book_id] = len(book_trigrams)
+            for trigram in book_trigrams:
+                postings[trigram].append(book_id)
+
+        self._postings = {trigram: np.array(ids, dtype=np.int32) for trigram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.books)
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.3) -> List[Tuple[int, float]]:
+        """Best matching books as (index, score) pairs, best first.
+
+        The score is the fraction of the query trigrams found in the book,
+        books under ``min_score`` are left out.
+        """
+        query_trigrams = trigrams(normalize_text(query))
+        postings = [self._postings[trigram] for trigram in query_trigrams if trigram in self._postings]
+        if not postings:
+            return []
+
+        hits = np.bincount(np.concatenate(postings), minlength=len(self.books))
+        candidates = np.flatnonzero(hits >= min_score * len(query_trigrams))
+        if len(candidates) == 0:
+            return []
+
+        candidate_hits = hits[candidates]
+        coverage = candidate_hits / len(query_trigrams)
+        similarity = candidate_hits / (len(query_trigrams) + self._trigram_counts[candidates] - candidate_hits)
+        order = np.lexsort((-similarity, -coverage))[:limit]
+        return [(int(candidates[i]), float(coverage[i])) for i in order]
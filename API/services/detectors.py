@@ -0,0 +1,208 @@
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import settings
+from .http_clients import RoboflowHTTPClient
+from .masks import CROPPED_MASK_KEY, CroppedMask, detections_from_inference
+
+if TYPE_CHECKING:
+    import supervision as sv
+
+
+class DetectorBackend(ABC):
+    """Turns an image into book detections with segmentation masks.
+
+    Masks are returned cropped to their boxes, as a CroppedMask per detection
+    in ``detections.data[CROPPED_MASK_KEY]``, never as full frame masks.
+    """
+
+    @abstractmethod
+    def detect(self, image: np.ndarray) -> "sv.Detections":
+        ...
+
+    async def detect_async(self, image: np.ndarray) -> "sv.Detections":
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.detect, image)
+
+
+class NoDetector(DetectorBackend):
+    """Finds no books, for services that only decode images and extract regions, like the process pool workers"""
+
+    def detect(self, image: np.ndarray) -> "sv.Detections":
+        import supervision as sv
+
+        detections = sv.Detections.empty()
+        detections.data[CROPPED_MASK_KEY] = []
+        return detections
+
+    async def detect_async(self, image: np.ndarray) -> "sv.Detections":
+        return self.detect(image)
+
+
+class RoboflowDetector(DetectorBackend):
+    """Runs the hosted Roboflow segmentation model over HTTP"""
+
+    def __init__(self, client: Optional[RoboflowHTTPClient] = None):
+        # Also accepts an inference_sdk InferenceHTTPClient, which opens a new connection per call
+        self.client = client or RoboflowHTTPClient(
+            api_url=settings.ROBOFLOW_API_URL,
+            api_key=settings.ROBOFLOW_API_KEY,
+        )
+
+    def detect(self, image: np.ndarray) -> "sv.Detections":
+        results = self.client.infer(image, model_id=settings.ROBOFLOW_MODEL_ID)
+        return detections_from_inference(results)
+
+    async def detect_async(self, image: np.ndarray) -> "sv.Detections":
+        results = await self.client.infer_async(image, model_id=settings.ROBOFLOW_MODEL_ID)
+        # Rasterizing the masks is CPU work, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, detections_from_inference, results)
+
+
+class OnnxDetector(DetectorBackend):
+    """Runs a YOLOv8-style segmentation model locally with ONNX Runtime.
+
+    The model is loaded once and shared by a dedicated thread pool. It must
+    take a 1x3xSxS RGB float input and return the usual two outputs: boxes,
+    class scores and mask coefficients of shape (1, 4 + classes + 32, N), and
+    mask prototypes of shape (1, 32, S/4, S/4). Roboflow and Ultralytics
+    segmentation models exported to ONNX use this layout.
+    """
+
+    def __init__(self, model_path: Optional[str] = None):
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError(
+                "The onnx detector backend requires onnxruntime, install it with `pip install onnxruntime`"
+            ) from e
+
+        model_path = model_path or settings.ONNX_MODEL_PATH
+        if not model_path:
+            raise ValueError("ONNX_MODEL_PATH must be set to use the onnx detector backend")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = settings.ONNX_INTRA_OP_THREADS
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+        input_shape = self.session.get_inputs()[0].shape
+        self.input_size = input_shape[-1] if isinstance(input_shape[-1], int) else settings.ONNX_INPUT_SIZE
+        self.class_names = [name.strip() for name in settings.ONNX_CLASS_NAMES.split(",")]
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.ONNX_WORKERS),
+            thread_name_prefix="onnx-detector",
+        )
+
+    async def detect_async(self, image: np.ndarray) -> "sv.Detections":
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.detect, image)
+
+    def _letterbox(self, image: np.ndarray) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+        """Resize keeping the aspect ratio and pad to a square model input"""
+        height, width = image.shape[:2]
+        ratio = self.input_size / max(height, width)
+        resized_width, resized_height = round(width * ratio), round(height * ratio)
+        pad_x = (self.input_size - resized_width) // 2
+        pad_y = (self.input_size - resized_height) // 2
+
+        canvas = np.full((self.input_size, self.input_size, 3), 114, dtype=np.uint8)
+        canvas[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width] = cv2.resize(
+            image, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR
+        )
+        blob = cv2.dnn.blobFromImage(canvas, scalefactor=1 / 255.0, swapRB=True)
+        return blob, ratio, (pad_x, pad_y)
+
+    def detect(self, image: np.ndarray) -> "sv.Detections":
+        height, width = image.shape[:2]
+        blob, ratio, (pad_x, pad_y) = self._letterbox(image)
+        predictions, prototypes = self.session.run(None, {self.input_name: blob})
+
+        predictions = predictions[0].T
+        num_classes = predictions.shape[1] - 4 - prototypes.shape[1]
+        scores = predictions[:, 4:4 + num_classes]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores.max(axis=1)
+
+        keep = confidences >= settings.ONNX_CONFIDENCE
+        predictions, class_ids, confidences = predictions[keep], class_ids[keep], confidences[keep]
+
+        # Boxes in model input coordinates, then non-maximum suppression
+        boxes_xywh = predictions[:, :4].copy()
+        boxes_xywh[:, :2] -= boxes_xywh[:, 2:] / 2
+        indices = cv2.dnn.NMSBoxes(
+            boxes_xywh.tolist(), confidences.tolist(), settings.ONNX_CONFIDENCE, settings.ONNX_IOU_THRESHOLD
+        )
+        indices = np.array(indices, dtype=int).reshape(-1)[:settings.ONNX_MAX_DETECTIONS]
+
+        input_xyxy = np.column_stack([boxes_xywh[indices, :2], boxes_xywh[indices, :2] + boxes_xywh[indices, 2:]])
+        coefficients = predictions[indices, 4 + num_classes:]
+
+        # Undo the letterbox to get boxes in image coordinates
+        xyxy = (input_xyxy - [pad_x, pad_y, pad_x, pad_y]) / ratio
+        xyxy = np.clip(xyxy, 0, [width, height, width, height]).astype(np.float32)
+
+        masks = self._build_masks(coefficients, prototypes[0], input_xyxy, xyxy, (height, width))
+
+        import supervision as sv
+
+        return sv.Detections(
+            xyxy=xyxy,
+            confidence=confidences[indices].astype(np.float32),
+            class_id=class_ids[indices].astype(int),
+            data={
+                "class_name": np.array([
+                    self.class_names[class_id] if class_id < len(self.class_names) else str(class_id)
+                    for class_id in class_ids[indices]
+                ]),
+                CROPPED_MASK_KEY: masks,
+            },
+        )
+
+    def _build_masks(
+        self,
+        coefficients: np.ndarray,
+        prototypes: np.ndarray,
+        input_xyxy: np.ndarray,
+        xyxy: np.ndarray,
+        image_shape: Tuple[int, int],
+    ) -> List[Optional[CroppedMask]]:
+        """Combine mask prototypes per detection, resizing only the part inside each box"""
+        channels, proto_height, proto_width = prototypes.shape
+        masks: List[Optional[CroppedMask]] = [None] * len(coefficients)
+        if len(coefficients) == 0:
+            return masks
+
+        logits = (coefficients @ prototypes.reshape(channels, -1)).reshape(-1, proto_height, proto_width)
+        scale = proto_width / self.input_size
+
+        for i, (logit, input_box, box) in enumerate(zip(logits, input_xyxy, xyxy)):
+            px1, py1, px2, py2 = np.clip(
+                np.round(input_box * scale).astype(int), 0, [proto_width, proto_height, proto_width, proto_height]
+            )
+            x1, y1, x2, y2 = np.round(box).astype(int)
+            if px2 <= px1 or py2 <= py1 or x2 <= x1 or y2 <= y1:
+                continue
+
+            # sigmoid(x) > 0.5 is the same as x > 0, so threshold the resized logits directly
+            crop = cv2.resize(logit[py1:py2, px1:px2], (x2 - x1, y2 - y1), interpolation=cv2.INTER_LINEAR)
+            masks[i] = CroppedMask.from_crop(int(x1), int(y1), crop > 0, (image_shape[1], image_shape[0]))
+
+        return masks
+
+
+def create_detector(client: Optional[RoboflowHTTPClient] = None) -> DetectorBackend:
+    """Build the detector backend selected by settings.DETECTOR_BACKEND"""
+    backend = settings.DETECTOR_BACKEND
+    if backend == "roboflow":
+        return RoboflowDetector(client)
+    if backend == "onnx":
+        return OnnxDetector()
+    raise ValueError(f"Unknown DETECTOR_BACKEND: {backend}")
@@ -0,0 +1,191 @@
+import asyncio
+import random
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from config import settings
+from models import ProcessingResult
+from .gemini_service import GeminiService
+from .metrics import GEMINI_CALLS, STAGE_SECONDS
+
+# HTTP status codes worth retrying after a pause
+RATE_LIMIT_STATUS_CODE = 429
+RETRYABLE_STATUS_CODES = {RATE_LIMIT_STATUS_CODE, 500, 502, 503, 504}
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+class GeminiBatchScheduler:
+    """Runs Gemini batches concurrently, adapting the batch size and retrying failures.
+
+    The batch size grows by one while batches finish under the target latency,
+    shrinks in proportion when they are slower, and halves on server errors and
+    timeouts. Rate limits are per call, so they pause every batch for a jittered,
+    exponentially growing cooldown instead, and the batch size keeps growing so
+    fewer calls are needed. Failing and timed out batches are retried after a
+    jittered exponential backoff. A batch whose response can't be parsed is
+    split in half, and regions the response left out are retried on their own,
+    so one bad answer no longer turns a whole batch into "Title Unknown".
+    """
+
+    def __init__(self, gemini_service: GeminiService):
+        self.gemini_service = gemini_service
+        self.batch_size = float(gemini_service.batch_size)
+        self.average_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.total_calls = 0
+        self.total_retries = 0
+        self._consecutive_rate_limits = 0
+        self._resume_at = 0.0
+        # Created lazily so it binds to the running event loop
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _current_batch_size(self) -> int:
+        if not settings.GEMINI_ADAPTIVE_BATCHING:
+            return self.gemini_service.batch_size
+        return max(1, int(self.batch_size))
+
+    def _record(self, latency: Optional[float], failed: bool, overloaded: bool = False) -> None:
+        self.total_calls += 1
+        self.error_rate = 0.8 * self.error_rate + 0.2 * (1.0 if failed else 0.0)
+        if latency is not None:
+            self.average_latency = latency if self.average_latency is None else 0.8 * self.average_latency + 0.2 * latency
+
+        minimum, maximum = settings.GEMINI_MIN_BATCH_SIZE, settings.GEMINI_MAX_BATCH_SIZE
+        if overloaded:
+            self.batch_size = max(minimum, self.batch_size / 2)
+        elif latency is not None and latency > settings.GEMINI_TARGET_BATCH_LATENCY:
+            self.batch_size = max(minimum, self.batch_size * settings.GEMINI_TARGET_BATCH_LATENCY / latency)
+        elif not failed and self.error_rate < 0.1:
+            self.batch_size = min(maximum, self.batch_size + 1)
+
+    def _record_rate_limit(self) -> None:
+        # Rate limits count calls, not regions: fewer, larger batches help
+        self.total_calls += 1
+        self.batch_size = min(settings.GEMINI_MAX_BATCH_SIZE, self.batch_size + 1)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter keeps retries from many batches from arriving together
+        delay = min(settings.GEMINI_BACKOFF_MAX, settings.GEMINI_BACKOFF_BASE * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    async def _wait_for_cooldown(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def process(
+        self,
+        regions: List[np.ndarray],
+        on_batch: Optional[Callable[[int, List[ProcessingResult]], None]] = None,
+    ) -> List[ProcessingResult]:
+        """Process all regions and return one result per region, in the original order.
+
+        ``on_batch`` is called with the index of the first region and the results
+        of each batch as soon as that batch is done, retries included.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, settings.GEMINI_MAX_CONCURRENCY))
+
+        batch_size = self._current_batch_size()
+
+        async def run(start: int) -> List[ProcessingResult]:
+            results = await self._run_batch(regions[start:start + batch_size])
+            if on_batch is not None:
+                on_batch(start, results)
+            return results
+
+        # gather keeps submission order, so results line up with the regions
+        batch_results = await asyncio.gather(*[run(start) for start in range(0, len(regions), batch_size)])
+        return [book for results in batch_results for book in results]
+
+    async def _run_batch(self, batch: List[np.ndarray], attempt: int = 0) -> List[ProcessingResult]:
+        try:
+            async with self._semaphore:
+                await self._wait_for_cooldown()
+                started = time.perf_counter()
+                results = await asyncio.wait_for(
+                    self.gemini_service.generate_book_results_async(batch),
+                    timeout=settings.GEMINI_BATCH_TIMEOUT,
+                )
+        except asyncio.TimeoutError:
+            GEMINI_CALLS.inc(outcome="timeout")
+            print(f"Gemini batch of {len(batch)} timed out after {settings.GEMINI_BATCH_TIMEOUT}s")
+            self._record(None, failed=True, overloaded=True)
+            return await self._retry(batch, attempt, split=len(batch) > 1)
+        except Exception as e:
+            status_code = _status_code(e)
+            GEMINI_CALLS.inc(outcome=str(status_code) if status_code else "error")
+            print(f"Gemini batch of {len(batch)} failed ({status_code or type(e).__name__}): {str(e)}")
+            if status_code == RATE_LIMIT_STATUS_CODE:
+                # Pause all batches, then retry this one once the cooldown is over
+                self._consecutive_rate_limits += 1
+                cooldown = self._backoff_delay(self._consecutive_rate_limits - 1)
+                self._resume_at = max(self._resume_at, time.monotonic() + cooldown)
+                self._record_rate_limit()
+                return await self._retry(batch, attempt, split=False, backoff=False)
+            if status_code in RETRYABLE_STATUS_CODES:
+                self._record(None, failed=True, overloaded=True)
+                return await self._retry(batch, attempt, split=False)
+            if status_code is not None:
+                # Other API errors (bad request, auth) won't improve on retry
+                self._record(None, failed=True)
+                return self._unknown_results(len(batch))
+            # Unparseable responses: retry each half on its own
+            self._record(None, failed=True)
+            return await self._retry(batch, attempt, split=len(batch) > 1)
+
+        latency = time.perf_counter() - started
+        STAGE_SECONDS.observe(latency, stage="gemini_batch")
+        GEMINI_CALLS.inc(outcome="success")
+        self._consecutive_rate_limits = 0
+        self._record(latency, failed=False)
+
+        # Retry only the regions the response left out
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing and attempt < settings.GEMINI_MAX_RETRIES:
+            print(f"Retrying {len(missing)} of {len(batch)} regions missing from the Gemini response...")
+            self.total_retries += 1
+            retried = await self._run_batch([batch[i] for i in missing], attempt + 1)
+            for i, result in zip(missing, retried):
+                results[i] = result
+
+        return [result or self._unknown_result() for result in results]
+
+    async def _retry(
+        self, batch: List[np.ndarray], attempt: int, split: bool, backoff: bool = True
+    ) -> List[ProcessingResult]:
+        if attempt >= settings.GEMINI_MAX_RETRIES:
+            return self._unknown_results(len(batch))
+
+        self.total_retries += 1
+        if backoff:
+            await asyncio.sleep(self._backoff_delay(attempt))
+
+        if not split:
+            return await self._run_batch(batch, attempt + 1)
+
+        middle = len(batch) // 2
+        first, second = await asyncio.gather(
+            self._run_batch(batch[:middle], attempt + 1),
+            self._run_batch(batch[middle:], attempt + 1),
+        )
+        return first + second
+
+    def _unknown_result(self) -> ProcessingResult:
+        return ProcessingResult(title="Title Unknown", author="Author Unknown")
+
+    def _unknown_results(self, count: int) -> List[ProcessingResult]:
+        return [self._unknown_result() for _ in range(count)]
+
+    def get_stats(self) -> dict:
+        return {
+            "gemini_calls": self.total_calls,
+            "gemini_retries": self.total_retries,
+            "gemini_batch_size": self._current_batch_size(),
+        }
@@ -1,22 +1,63 @@
-import base64
+import asyncio
 import json
 import re
-from io import BytesIO
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Optional
 import cv2
 import numpy as np
-from google import genai
-from google.genai import types
 
 from config import settings
 from models import ProcessingResult
+from .http_clients import http_pool
+from .metrics import GEMINI_UPLOAD_BYTES
+from .mosaic import build_spine_mosaic
+from .process_pool import ProcessWorkerPool, shared_process_pool
+
+if TYPE_CHECKING:
+    # google.genai takes about half a second to import, it is loaded when the first service is built
+    from google import genai
+    from google.genai import types
+
+# OpenCV extension, encoder quality flag and MIME type per supported image format
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+def encode_image(image: np.ndarray, max_dimension: int) -> bytes:
+    """Encode an image in GEMINI_IMAGE_FORMAT, downscaled so its longest side fits ``max_dimension`` (0 keeps it)"""
+    height, width = image.shape[:2]
+    if max_dimension > 0 and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        image = cv2.resize(
+            image,
+            (max(1, round(width * scale)), max(1, round(height * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+
+    extension, quality_flag, _ = IMAGE_FORMATS[settings.GEMINI_IMAGE_FORMAT]
+    success, buffer = cv2.imencode(extension, image, [quality_flag, settings.GEMINI_IMAGE_QUALITY])
+    if not success:
+        raise ValueError("Could not encode image")
+
+    return buffer.tobytes()
 
 class GeminiService:
-    def __init__(self):
-        self.client = genai.Client(
-            vertexai=True,
-            project=settings.GOOGLE_CLOUD_PROJECT,
-            location=settings.GOOGLE_CLOUD_LOCATION,
+    def __init__(self, client: Optional["genai.Client"] = None, process_pool: Optional[ProcessWorkerPool] = None):
+        self.client = client
+        if client is None:
+            # Build it now, so missing credentials fail when the service is built
+            self.client
+
+        if settings.GEMINI_IMAGE_FORMAT not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported GEMINI_IMAGE_FORMAT: {settings.GEMINI_IMAGE_FORMAT}")
+
+        # OpenCV releases the GIL while encoding, so crops encode in parallel threads,
+        # or in worker processes when PROCESS_POOL_WORKERS is set
+        self.process_pool = process_pool
+        self._encode_executor = ThreadPoolExecutor(
+            max_workers=max(1, settings.GEMINI_ENCODE_WORKERS),
+            thread_name_prefix="gemini-encode",
         )
         
         self.system_instruction = (
@@ -34,83 +75,203 @@ class GeminiService:
             "\n\n"
             "Output your response as structured JSON, maintaining the exact order of the images provided."
         )
+
+        self.mosaic_system_instruction = (
+            "You are an expert bibliographic AI specialized in analyzing images of books and book spines."
+            "Each provided image is a mosaic of book spines stacked in horizontal strips, separated by white lines."
+            "Each strip is numbered at its left edge, consecutively across images, and shows exactly one book. If a book's title or author is not clearly visible, explicitly return 'Title Unknown' and/or 'Author Unknown' accordingly."
+            "Return your results in structured JSON, with exactly one entry per strip, including the strip number as 'index'."
+        )
+
+        self.mosaic_text_prompt = (
+            "Analyze each numbered strip in the images, identifying the book shown in that strip."
+            "Provide the book's title and author only if clearly readable from the spine."
+            "\n"
+            "If the title or author is unclear or unreadable, use 'Title Unknown' or 'Author Unknown' accordingly."
+            "\n\n"
+            "Output your response as structured JSON with one entry per strip, using the strip number as 'index'."
+        )
+
+    @property
+    def batch_size(self) -> int:
+        """Number of regions sent per Gemini call"""
+        return settings.GEMINI_MOSAIC_PACK_SIZE if settings.GEMINI_MOSAIC_MODE else settings.BATCH_SIZE
     
-    def _prepare_image_parts(self, regions: List[np.ndarray]) -> List[types.Part]:
-        image_parts = []
-        for region in regions:
-            base64_image = base64.b64encode(
-                BytesIO(cv2.imencode(".jpg", region)[1]).read()
-            ).decode("utf-8")
-
-            image_part = types.Part.from_bytes(
-                data=base64.b64decode(base64_image),
-                mime_type="image/jpeg",
+    def _encode_region(self, region: np.ndarray) -> bytes:
+        return self._encode_image(region, settings.GEMINI_MAX_REGION_DIMENSION)
+
+    def _encode_image(self, image: np.ndarray, max_dimension: int) -> bytes:
+        return encode_image(image, max_dimension)
+
+    def _prepare_mosaic_parts(self, regions: List[np.ndarray]) -> List["types.Part"]:
+        """Pack the regions into numbered mosaics of at most GEMINI_MOSAIC_PACK_SIZE spines each"""
+        from google.genai import types
+
+        pack_size = max(1, settings.GEMINI_MOSAIC_PACK_SIZE)
+        mime_type = IMAGE_FORMATS[settings.GEMINI_IMAGE_FORMAT][2]
+        parts = []
+        for i in range(0, len(regions), pack_size):
+            mosaic = build_spine_mosaic(
+                regions[i:i + pack_size],
+                width=settings.GEMINI_MOSAIC_WIDTH,
+                max_height=settings.GEMINI_MOSAIC_MAX_HEIGHT,
+                first_number=i + 1,
             )
-            image_parts.append(image_part)
-        
-        return image_parts
+            if settings.SAVE_DEBUG_IMAGES:
+                cv2.imwrite(f"mosaic_{i // pack_size}.jpg", mosaic)
+            encoded_mosaic = self._encode_image(mosaic, 0)
+            GEMINI_UPLOAD_BYTES.inc(len(encoded_mosaic))
+            parts.append(types.Part.from_bytes(data=encoded_mosaic, mime_type=mime_type))
+        return parts
+
+    @property
+    def process_pool(self) -> Optional[ProcessWorkerPool]:
+        """The given pool, or the shared one, looked up on every use as it is replaced after a shutdown"""
+        return self._process_pool or shared_process_pool()
+
+    @process_pool.setter
+    def process_pool(self, process_pool: Optional[ProcessWorkerPool]) -> None:
+        self._process_pool = process_pool
+
+    @property
+    def client(self) -> "genai.Client":
+        """The given client, or one on the shared connection pools, rebuilt when they were closed and reopened"""
+        if self._client is not None and self._pooled_clients is None:
+            return self._client
+
+        pooled_clients = (http_pool.client, http_pool.async_client)
+        if self._pooled_clients is None or any(a is not b for a, b in zip(pooled_clients, self._pooled_clients)):
+            from google import genai
+            from google.genai import types
+
+            self._client = genai.Client(
+                vertexai=True,
+                project=settings.GOOGLE_CLOUD_PROJECT,
+                location=settings.GOOGLE_CLOUD_LOCATION,
+                # Share the process-wide keep-alive connection pools
+                http_options=types.HttpOptions(
+                    httpx_client=pooled_clients[0],
+                    httpx_async_client=pooled_clients[1],
+                ),
+            )
+            self._pooled_clients = pooled_clients
+        return self._client
+
+    @client.setter
+    def client(self, client: Optional["genai.Client"]) -> None:
+        self._client = client
+        # Set for clients built on the shared pools only
+        self._pooled_clients = None
+
+    def _prepare_image_parts(self, regions: List[np.ndarray]) -> List["types.Part"]:
+        from google.genai import types
+
+        process_pool = self.process_pool
+        if process_pool is not None and len(regions) > 1:
+            encoded_regions = process_pool.encode_images(regions, settings.GEMINI_MAX_REGION_DIMENSION)
+        elif len(regions) > 1:
+            encoded_regions = list(self._encode_executor.map(self._encode_region, regions))
+        else:
+            encoded_regions = [self._encode_region(region) for region in regions]
+
+        GEMINI_UPLOAD_BYTES.inc(sum(len(encoded_region) for encoded_region in encoded_regions))
+        mime_type = IMAGE_FORMATS[settings.GEMINI_IMAGE_FORMAT][2]
+        return [
+            types.Part.from_bytes(data=encoded_region, mime_type=mime_type)
+            for encoded_region in encoded_regions
+        ]
     
-    def _create_generation_config(self) -> types.GenerateContentConfig:
+    def _create_generation_config(self) -> "types.GenerateContentConfig":
+        from google.genai import types
+
+        properties = {
+            "title": {"type": "STRING"},
+            "author": {"type": "STRING"}
+        }
+        required = ["title", "author"]
+        system_instruction = self.system_instruction
+
+        # In mosaic mode each entry carries the number of its strip
+        if settings.GEMINI_MOSAIC_MODE:
+            properties = {"index": {"type": "INTEGER"}, **properties}
+            required = ["index"] + required
+            system_instruction = self.mosaic_system_instruction
+
         return types.GenerateContentConfig(
             temperature=settings.GEMINI_TEMPERATURE,
             thinking_config=types.ThinkingConfig(thinking_budget=-1),
             max_output_tokens=settings.GEMINI_MAX_OUTPUT_TOKENS,
-            system_instruction=[types.Part.from_text(text=self.system_instruction)],
+            system_instruction=[types.Part.from_text(text=system_instruction)],
             response_mime_type="application/json",
             response_schema={
                 "type": "ARRAY",
                 "items": {
                     "type": "OBJECT",
-                    "properties": {
-                        "title": {"type": "STRING"},
-                        "author": {"type": "STRING"}
-                    },
-                    "required": ["title", "author"]
+                    "properties": properties,
+                    "required": required
                 }
             },
         )
+
+    def _order_mosaic_entries(self, books_data: list, num_regions: int) -> list:
+        """Place mosaic answers at the position of their 1-based strip number"""
+        ordered = [None] * num_regions
+        for book in books_data:
+            if not isinstance(book, dict):
+                continue
+            try:
+                index = int(book.get("index")) - 1
+            except (TypeError, ValueError):
+                continue
+            if 0 <= index < num_regions and ordered[index] is None:
+                ordered[index] = book
+        return ordered
     
-    def _parse_gemini_response(self, response, num_regions: int) -> List[ProcessingResult]:
+    def _parse_books_data(self, response, num_regions: int) -> List[Optional[ProcessingResult]]:
+        """Parse the response strictly: raises if it holds no JSON, None marks regions without an answer"""
+        # Extract response text
+        if hasattr(response, 'text'):
+            response_text = response.text
+        else:
+            response_text = str(response)
+
+        # Parse JSON response
         try:
-            # Extract response text
-            if hasattr(response, 'text'):
-                response_text = response.text
+            books_data = json.loads(response_text)
+        except (json.JSONDecodeError, TypeError):
+            # Try to extract JSON from response using regex
+            json_match = re.search(r'\[.*\]', response_text or "", re.DOTALL)
+            if json_match:
+                books_data = json.loads(json_match.group(0))
             else:
-                response_text = str(response)
+                raise ValueError("Could not extract JSON from response")
 
-            # Parse JSON response
-            try:
-                books_data = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Try to extract JSON from response using regex
-                json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
-                if json_match:
-                    books_data = json.loads(json_match.group(0))
-                else:
-                    raise ValueError("Could not extract JSON from response")
-
-            # Process each book in the response
-            results = []
-            for i in range(num_regions):
-                if i < len(books_data):
-                    book = books_data[i]
-                    if isinstance(book, dict):
-                        title = book.get("title", "Title Unknown")
-                        author = book.get("author", "Author Unknown")
-                    else:
-                        title = "Title Unknown"
-                        author = "Author Unknown"
-                else:
-                    title = "Title Unknown"
-                    author = "Author Unknown"
-
-                result = ProcessingResult(
-                    title=title,
-                    author=author
-                )
-                results.append(result)
-
-            return results
+        if not isinstance(books_data, list):
+            raise ValueError("Expected a JSON array in the response")
+
+        if settings.GEMINI_MOSAIC_MODE:
+            books_data = self._order_mosaic_entries(books_data, num_regions)
+
+        # Process each book in the response
+        results = []
+        for i in range(num_regions):
+            book = books_data[i] if i < len(books_data) else None
+            if isinstance(book, dict):
+                results.append(ProcessingResult(
+                    title=book.get("title", "Title Unknown"),
+                    author=book.get("author", "Author Unknown")
+                ))
+            else:
+                results.append(None)
+
+        return results
+
+    def _parse_gemini_response(self, response, num_regions: int) -> List[ProcessingResult]:
+        try:
+            return [
+                result or ProcessingResult(title="Title Unknown", author="Author Unknown")
+                for result in self._parse_books_data(response, num_regions)
+            ]
 
         except Exception as e:
             print(f"Error parsing response: {e}")
@@ -125,35 +286,61 @@ class GeminiService:
                 for _ in range(num_regions)
             ]
     
-    def process_book_regions(self, regions: List[np.ndarray]) -> List[ProcessingResult]:
-        print(f"Processing {len(regions)} masks with Gemini...")
+    def _build_contents(self, regions: List[np.ndarray]) -> List["types.Content"]:
+        from google.genai import types
 
         # Prepare image parts for Gemini
-        image_parts = self._prepare_image_parts(regions)
-
-        # Create text part
-        text_part = types.Part.from_text(text=self.text_prompt)
+        if settings.GEMINI_MOSAIC_MODE:
+            image_parts = self._prepare_mosaic_parts(regions)
+            text_part = types.Part.from_text(text=self.mosaic_text_prompt)
+        else:
+            image_parts = self._prepare_image_parts(regions)
+            text_part = types.Part.from_text(text=self.text_prompt)
 
-        # Create generation config
-        config = self._create_generation_config()
-        
         # Create content for the request
         parts = image_parts + [text_part]
-        contents = [
+        return [
             types.Content(
                 role="user",
                 parts=parts
             ),
         ]
 
+    def process_book_regions(self, regions: List[np.ndarray]) -> List[ProcessingResult]:
+        print(f"Processing {len(regions)} masks with Gemini...")
+
+        contents = self._build_contents(regions)
+
         # Make request to Gemini
         response = self.client.models.generate_content(
             model=settings.GEMINI_MODEL,
             contents=contents,
-            config=config,
+            config=self._create_generation_config(),
         )
 
         # Parse response and convert to formatted strings
-        processing_results = self._parse_gemini_response(response, len(regions))
-        
-        return processing_results
+        return self._parse_gemini_response(response, len(regions))
+
+    async def _generate_content_async(self, regions: List[np.ndarray]):
+        print(f"Processing {len(regions)} masks with Gemini...")
+
+        # Encoding the crops is CPU work, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        contents = await loop.run_in_executor(None, self._build_contents, regions)
+
+        # Make non-blocking request to Gemini
+        return await self.client.aio.models.generate_content(
+            model=settings.GEMINI_MODEL,
+            contents=contents,
+            config=self._create_generation_config(),
+        )
+
+    async def process_book_regions_async(self, regions: List[np.ndarray]) -> List[ProcessingResult]:
+        response = await self._generate_content_async(regions)
+        return self._parse_gemini_response(response, len(regions))
+
+    async def generate_book_results_async(self, regions: List[np.ndarray]) -> List[Optional[ProcessingResult]]:
+        """Like process_book_regions_async, but raises on API and parse errors and
+        returns None for regions the response left out, so callers can retry them"""
+        response = await self._generate_content_async(regions)
+        return self._parse_books_data(response, len(regions))
@@ -0,0 +1,146 @@
+import asyncio
+import base64
+import time
+from typing import List, Optional
+
+import cv2
+import httpx
+import numpy as np
+
+from config import settings
+
+# Statuses the Roboflow API may answer while overloaded or restarting
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+class HTTPClientPool:
+    """Keep-alive HTTP clients shared by every outbound call of the process.
+
+    One sync and one async httpx client hold the connection pools, sized from
+    the HTTP_* settings, so concurrent requests reuse open TLS connections to
+    Roboflow and Vertex AI instead of handshaking on every call. The app
+    lifespan warms the pools on startup and closes them on shutdown. Users
+    fetch the clients from the pool on every call rather than keeping them,
+    so they pick up the new ones after a close.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    def _client_args(self) -> dict:
+        if settings.HTTP2_ENABLED:
+            try:
+                import h2  # noqa: F401
+            except ImportError as e:
+                raise RuntimeError(
+                    "HTTP2_ENABLED requires the h2 package, install it with `pip install httpx[http2]`"
+                ) from e
+
+        return {
+            "limits": httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "timeout": httpx.Timeout(settings.HTTP_TIMEOUT),
+            "http2": settings.HTTP2_ENABLED,
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(**self._client_args())
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(**self._client_args())
+        return self._async_client
+
+    async def warm_up(self, urls: List[str], connections: int) -> None:
+        """Open ``connections`` keep-alive connections to each URL, so the first requests skip the handshakes.
+
+        Any HTTP response leaves its connection in the pool, so the status is ignored.
+        Failures are logged only, the service can still start without a warm pool.
+        """
+        async def open_connection(url: str) -> bool:
+            try:
+                await self.async_client.head(url)
+                return True
+            except httpx.HTTPError as e:
+                print(f"Could not warm up a connection to {url}: {e}")
+                return False
+
+        started = time.perf_counter()
+        opened = await asyncio.gather(*[open_connection(url) for url in urls for _ in range(connections)])
+        print(f"Opened {sum(opened)} of {len(opened)} warm-up connections in {time.perf_counter() - started:.2f}s")
+
+    async def aclose(self) -> None:
+        """Close the pooled connections on shutdown. The next use opens new clients, so
+        the pool keeps working across app lifespans in the same process."""
+        async_client, self._async_client = self._async_client, None
+        client, self._client = self._client, None
+        if async_client is not None:
+            await async_client.aclose()
+        if client is not None:
+            client.close()
+
+
+http_pool = HTTPClientPool()
+
+
+class RoboflowHTTPClient:
+    """Calls the hosted Roboflow inference API through the shared connection pool.
+
+    Drop-in for the ``infer`` and ``infer_async`` methods of InferenceHTTPClient
+    with the v0 hosted API, which opens a new connection for every call.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        pool: Optional[HTTPClientPool] = None,
+        max_retries: int = 2,
+        retry_delay: float = 1.0,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+        self.pool = pool or http_pool
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def _request(self, image: np.ndarray, model_id: str) -> dict:
+        success, encoded = cv2.imencode(".jpg", image)
+        if not success:
+            raise ValueError("Could not encode the image for Roboflow")
+        return {
+            "url": f"{self.api_url}/{model_id}",
+            "params": {"api_key": self.api_key},
+            "content": base64.b64encode(encoded),
+            "headers": {"Content-Type": "application/x-www-form-urlencoded"},
+        }
+
+    def infer(self, image: np.ndarray, model_id: Optional[str] = None) -> dict:
+        request = self._request(image, model_id or settings.ROBOFLOW_MODEL_ID)
+        for attempt in range(self.max_retries + 1):
+            response = self.pool.client.post(**request)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                break
+            time.sleep(self.retry_delay)
+        response.raise_for_status()
+        return response.json()
+
+    async def infer_async(self, image: np.ndarray, model_id: Optional[str] = None) -> dict:
+        # JPEG encoding is CPU work, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        request = await loop.run_in_executor(None, self._request, image, model_id or settings.ROBOFLOW_MODEL_ID)
+        for attempt in range(self.max_retries + 1):
+            response = await self.pool.async_client.post(**request)
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                break
+            await asyncio.sleep(self.retry_delay)
+        response.raise_for_status()
+        return response.json()
@@ -1,29 +1,65 @@
+import asyncio
 import base64
+import hashlib
 import cv2
 import numpy as np
 from io import BytesIO
-from typing import List, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 from fastapi import HTTPException
-import supervision as sv
-from inference_sdk import InferenceHTTPClient
 
 from config import settings
+from .detectors import DetectorBackend, create_detector
+from .http_clients import RoboflowHTTPClient
+from .masks import CROPPED_MASK_KEY, CroppedMask, compact_detections, drop_empty_masks
+from .process_pool import ProcessWorkerPool, shared_process_pool
+from .tiling import merge_tile_detections, tile_windows
+
+if TYPE_CHECKING:
+    import supervision as sv
 
 class ImageProcessingService:
-    def __init__(self):
-        self.client = InferenceHTTPClient(
-            api_url=settings.ROBOFLOW_API_URL,
-            api_key=settings.ROBOFLOW_API_KEY,
-        )
+    def __init__(
+        self,
+        client: Optional[RoboflowHTTPClient] = None,
+        detector: Optional[DetectorBackend] = None,
+        process_pool: Optional[ProcessWorkerPool] = None,
+    ):
+        # The backend is built once here, so a local model is loaded at startup
+        self.detector = detector or create_detector(client)
+        # Decoding and region extraction run in worker processes when PROCESS_POOL_WORKERS is set
+        self.process_pool = process_pool
+
+    @property
+    def process_pool(self) -> Optional[ProcessWorkerPool]:
+        """The given pool, or the shared one, looked up on every use as it is replaced after a shutdown"""
+        return self._process_pool or shared_process_pool()
+
+    @process_pool.setter
+    def process_pool(self, process_pool: Optional[ProcessWorkerPool]) -> None:
+        self._process_pool = process_pool
     
     def decode_base64_image(self, base64_image: str) -> np.ndarray:
+        return self.decode_image_bytes(self.base64_to_bytes(base64_image))
+
+    def base64_to_bytes(self, base64_image: str) -> bytes:
         try:
             # Remove data URL prefix if present
             if base64_image.startswith('data:image'):
                 base64_image = base64_image.split(',')[1]
 
-            image_data = base64.b64decode(base64_image)
+            return base64.b64decode(base64_image)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+
+    def decode_image_bytes(self, image_data: bytes) -> np.ndarray:
+        process_pool = self.process_pool
+        if process_pool is not None:
+            return process_pool.decode(image_data)
+
+        try:
+            # frombuffer wraps the bytes without copying them
             image_array = np.frombuffer(image_data, dtype=np.uint8)
+            self._check_image_size(image_array)
             image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
 
             if image is None:
@@ -31,43 +67,207 @@ class ImageProcessingService:
 
             return image
 
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+
+    def _check_image_size(self, image_array: np.ndarray) -> None:
+        """Reject images over IMAGE_MAX_PIXELS before the full frame is allocated.
+
+        A 1/8 scale grayscale decode reveals the size cheaply, JPEG decoders
+        skip most of the work at reduced scales.
+        """
+        if not settings.IMAGE_MAX_PIXELS:
+            return
+
+        preview = cv2.imdecode(image_array, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if preview is None:
+            raise ValueError("Could not decode image")
+
+        pixels = preview.shape[0] * preview.shape[1] * 64
+        if pixels > settings.IMAGE_MAX_PIXELS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image has about {pixels / 1e6:.0f} MP, at most {settings.IMAGE_MAX_PIXELS / 1e6:.0f} MP are supported"
+            )
     
-    def detect_books_in_image(self, image: np.ndarray) -> sv.Detections:
-        results = self.client.infer(image, model_id=settings.ROBOFLOW_MODEL_ID)
-        return sv.Detections.from_inference(results)
-    
-    def extract_book_regions(self, image: np.ndarray, detections: sv.Detections) -> Tuple[List[np.ndarray], List]:
-        masks_isolated = []
-        polygons = [sv.mask_to_polygons(mask) for mask in detections.mask]
+    def _difference_hash(self, image: np.ndarray, hash_size: int) -> np.ndarray:
+        """Packed difference hash (dHash) bits, stable under re-encoding and small noise"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+        return np.packbits(resized[:, 1:] > resized[:, :-1])
 
-        for mask in detections.mask:
-            y_indices, x_indices = np.where(mask)
-            if len(y_indices) == 0 or len(x_indices) == 0:
-                continue
+    def compute_perceptual_hash(self, image: np.ndarray, hash_size: int = 16) -> str:
+        height, width = image.shape[:2]
+        return f"{width}x{height}:{self._difference_hash(image, hash_size).tobytes().hex()}"
 
-            x_min, x_max = np.min(x_indices), np.max(x_indices)
-            y_min, y_max = np.min(y_indices), np.max(y_indices)
+    def compute_content_digest(self, image: np.ndarray) -> str:
+        """Digest of the exact decoded pixels, to tell apart images that share a perceptual hash"""
+        pixels = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(pixels.data, digest_size=16).hexdigest()
+        return f"{'x'.join(map(str, pixels.shape))}:{digest}"
 
-            # Extract the region using bounding box
-            roi = image[y_min:y_max+1, x_min:x_max+1].copy()
+    def compute_result_cache_key(self, image: np.ndarray, hash_size: int = 16) -> Tuple[str, str]:
+        """Perceptual hash the result cache is keyed on, and the digest confirming a hit"""
+        return self.compute_perceptual_hash(image, hash_size), self.compute_content_digest(image)
 
-            # Create a mask for the cropped region
-            cropped_mask = mask[y_min:y_max+1, x_min:x_max+1]
+    def compute_region_fingerprints(self, regions: List[np.ndarray], hash_size: int = 16) -> List[Tuple[np.ndarray, float, np.ndarray]]:
+        """dHash, aspect ratio and mean color of each spine crop, used to recognise spines across scans"""
+        fingerprints = []
+        for region in regions:
+            # Mean color over the masked pixels only, so the black background doesn't dilute it
+            masked = region.any(axis=2)
+            color = region[masked].mean(axis=0) if masked.any() else np.zeros(3)
+            fingerprints.append((
+                self._difference_hash(region, hash_size),
+                region.shape[1] / max(region.shape[0], 1),
+                color.astype(np.float32),
+            ))
+        return fingerprints
 
-            # Apply the mask: keep pixels within the polygon, set others to black
-            roi[~cropped_mask] = [0, 0, 0]
+    def _detection_size(self, image: np.ndarray) -> Optional[Tuple[int, int]]:
+        """(width, height) to downscale the image to for detection, None to detect at full size"""
+        height, width = image.shape[:2]
+        max_dimension = settings.DETECTION_MAX_DIMENSION
+        if not max_dimension or max(height, width) <= max_dimension:
+            return None
+        scale = max_dimension / max(height, width)
+        return max(1, round(width * scale)), max(1, round(height * scale))
 
-            masks_isolated.append(roi)
+    def _downscale(self, image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+        """Resize for detection without aliasing.
 
-        print("Calculated masks...")
+        INTER_AREA is only fast for exact halvings, so the image is halved
+        while it is at least twice too large, and the last step, under 2x,
+        uses INTER_LINEAR. About 4x faster than a single INTER_AREA resize.
+        """
+        while image.shape[1] >= 2 * size[0] and image.shape[0] >= 2 * size[1]:
+            image = cv2.resize(image, (image.shape[1] // 2, image.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        return cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+
+    def _to_image_coordinates(self, detections: "sv.Detections", image: np.ndarray, detected_size: Tuple[int, int]) -> "sv.Detections":
+        """Scale boxes found on the downscaled copy back to the image. The cropped masks stay
+        at the detection resolution, extract_book_regions maps them onto the full resolution crops."""
+        height, width = image.shape[:2]
+        scale_x, scale_y = width / detected_size[0], height / detected_size[1]
+        # Crop full frame masks while they still line up with the boxes
+        compact_detections(detections)
+        detections.xyxy = detections.xyxy * np.array([scale_x, scale_y, scale_x, scale_y])
+        return detections
+
+    def detect_books_in_image(self, image: np.ndarray) -> "sv.Detections":
+        size = self._detection_size(image)
+        if size is None:
+            return drop_empty_masks(self.detector.detect(image))
+        detections = self.detector.detect(self._downscale(image, size))
+        return drop_empty_masks(self._to_image_coordinates(detections, image, size))
+
+    async def detect_books_in_image_async(self, image: np.ndarray) -> "sv.Detections":
+        size = self._detection_size(image)
+        if size is None:
+            return drop_empty_masks(await self.detector.detect_async(image))
+
+        # Resizing is CPU work, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        small = await loop.run_in_executor(None, self._downscale, image, size)
+        detections = await self.detector.detect_async(small)
+        return drop_empty_masks(self._to_image_coordinates(detections, image, size))
+
+    def should_tile(self, image: np.ndarray) -> bool:
+        """Panoramas are detected tile by tile, a single downscaled copy would make their books too small"""
+        height, width = image.shape[:2]
+        return settings.DETECTION_TILING and max(height, width) >= settings.DETECTION_TILE_MIN_ASPECT * min(height, width)
+
+    async def detect_and_extract_tiled(self, image: np.ndarray) -> Tuple["sv.Detections", List[np.ndarray], List]:
+        """Detect books and extract their regions in overlapping square tiles, then merge the tiles.
+
+        Masks only ever cover one tile at detection resolution, so memory
+        stays bounded however long the panorama is.
+        """
+        height, width = image.shape[:2]
+        windows = tile_windows(width, height, settings.DETECTION_TILE_OVERLAP)
+        semaphore = asyncio.Semaphore(max(1, settings.DETECTION_TILE_CONCURRENCY))
+        loop = asyncio.get_running_loop()
+
+        async def process_tile(window):
+            x_min, y_min, x_max, y_max = window
+            tile = image[y_min:y_max, x_min:x_max]
+            async with semaphore:
+                detections = await self.detect_books_in_image_async(tile)
+                regions, polygons = await loop.run_in_executor(None, self.extract_book_regions, tile, detections)
+
+            offset = np.array([x_min, y_min])
+            detections.xyxy = detections.xyxy + np.tile(offset, 2)
+            # The masks are relative to their tile and no longer needed
+            del detections.data[CROPPED_MASK_KEY]
+            return detections, regions, [[polygon + offset for polygon in polygon_list] for polygon_list in polygons]
+
+        tiles = await asyncio.gather(*[process_tile(window) for window in windows])
+
+        import supervision as sv
+
+        detections = sv.Detections.merge([tile_detections for tile_detections, _, _ in tiles])
+        regions = [region for _, tile_regions, _ in tiles for region in tile_regions]
+        polygons = [polygon_list for _, _, tile_polygons in tiles for polygon_list in tile_polygons]
+        tile_indices = np.concatenate(
+            [np.full(len(tile_detections), tile) for tile, (tile_detections, _, _) in enumerate(tiles)]
+        )
+
+        keep = merge_tile_detections(detections.xyxy, detections.confidence, windows, tile_indices, width, height)
+        print(f"Merged {len(regions)} detections from {len(windows)} tiles into {len(keep)} books")
+        return detections[keep], [regions[i] for i in keep], [polygons[i] for i in keep]
+    
+    def extract_book_regions(self, image: np.ndarray, detections: "sv.Detections") -> Tuple[List[np.ndarray], List]:
+        masks = compact_detections(detections).data[CROPPED_MASK_KEY]
+        process_pool = self.process_pool
+        if process_pool is not None:
+            return process_pool.extract_regions(image, masks)
+        return self.extract_regions(image, masks)
+
+    def extract_regions(self, image: np.ndarray, masks: List[CroppedMask]) -> Tuple[List[np.ndarray], List]:
+        """Masked, upright crop and polygons of every book, one of each per mask.
+
+        Detections without a mask must be dropped first (see drop_empty_masks),
+        so the regions line up with the detections.
+        """
+        import supervision as sv
 
-        # Prepare all regions for processing (rotate 90 degrees counterclockwise)
         processed_regions = []
-        for region in masks_isolated:
-            rotated_region = cv2.rotate(region, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            processed_regions.append(rotated_region)
+        polygons = []
+
+        height, width = image.shape[:2]
+
+        for mask in masks:
+            x_min, y_min, x_max, y_max = mask.bounds
+            cropped_mask = mask.mask
+
+            # Trace the polygon on the cropped mask and shift it back to image coordinates
+            offset = np.array([x_min, y_min])
+            mask_polygons = [polygon + offset for polygon in sv.mask_to_polygons(cropped_mask)]
+
+            # Masks may come from a downscaled copy of the image, crops are taken at full resolution
+            scale = np.array([width / mask.frame_size[0], height / mask.frame_size[1]])
+            if not np.allclose(scale, 1.0):
+                polygons.append([np.rint(polygon * scale).astype(np.int32) for polygon in mask_polygons])
+                x_min, y_min = int(x_min * scale[0]), int(y_min * scale[1])
+                x_max = min(width, int(np.ceil(x_max * scale[0])))
+                y_max = min(height, int(np.ceil(y_max * scale[1])))
+                # Smooth the upscaled mask edges rather than blowing up its pixels
+                cropped_mask = cv2.resize(
+                    cropped_mask.astype(np.uint8) * 255, (x_max - x_min, y_max - y_min), interpolation=cv2.INTER_LINEAR
+                ) > 127
+            else:
+                polygons.append(mask_polygons)
+
+            # Apply the mask and rotate 90 degrees counterclockwise in a single pass:
+            # np.rot90 returns views, so np.where writes the final region directly
+            roi = image[y_min:y_max, x_min:x_max]
+            processed_regions.append(
+                np.where(np.rot90(cropped_mask)[..., None], np.rot90(roi), np.uint8(0))
+            )
+
+        print("Calculated masks...")
 
         # Save individual regions for debugging if enabled
         if settings.SAVE_DEBUG_IMAGES:
@@ -0,0 +1,153 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from models import BookAnnotation
+from .array_utils import hamming_distances, pairwise_iou
+
+# dHash bits, aspect ratio and mean color of a spine, as computed by ImageProcessingService
+Fingerprint = Tuple[np.ndarray, float, np.ndarray]
+
+
+class ShelfInventory:
+    """Books last seen in each bookcase, stored in SQLite so scans can be diffed against them.
+
+    Every book is stored with its annotation and the fingerprint of its spine.
+    A new scan is matched against the stored books by position and appearance,
+    so only spines that are new to the bookcase need to be read again.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        iou_threshold: float,
+        max_distance: int,
+        max_aspect_difference: float = 0.15,
+        max_color_difference: float = 20.0,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_aspect_difference = max_aspect_difference
+        self.max_color_difference = max_color_difference
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS inventory_books ("
+            "inventory_id TEXT NOT NULL, position INTEGER NOT NULL, annotation TEXT NOT NULL, "
+            "fingerprint BLOB NOT NULL, aspect REAL NOT NULL, color BLOB NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (inventory_id, position))"
+        )
+        self._db.commit()
+
+    def load(self, inventory_id: str) -> List[Tuple[BookAnnotation, Fingerprint]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT annotation, fingerprint, aspect, color FROM inventory_books "
+                "WHERE inventory_id = ? ORDER BY position",
+                (inventory_id,),
+            ).fetchall()
+
+        return [
+            (
+                BookAnnotation.model_validate_json(annotation),
+                (np.frombuffer(fingerprint, dtype=np.uint8), aspect, np.frombuffer(color, dtype=np.float32)),
+            )
+            for annotation, fingerprint, aspect, color in rows
+        ]
+
+    def updated_at(self, inventory_id: str) -> Optional[float]:
+        """When the inventory was last saved, None if it doesn't exist"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MAX(updated_at) FROM inventory_books WHERE inventory_id = ?", (inventory_id,)
+            ).fetchone()
+        return row[0]
+
+    def save(self, inventory_id: str, books: List[Tuple[BookAnnotation, Fingerprint]]) -> None:
+        """Replace the stored books of an inventory with the given state"""
+        now = time.time()
+        rows = [
+            (
+                inventory_id,
+                position,
+                annotation.model_dump_json(),
+                np.ascontiguousarray(fingerprint, dtype=np.uint8).tobytes(),
+                float(aspect),
+                np.ascontiguousarray(color, dtype=np.float32).tobytes(),
+                now,
+            )
+            for position, (annotation, (fingerprint, aspect, color)) in enumerate(books)
+        ]
+        with self._lock:
+            self._db.execute("DELETE FROM inventory_books WHERE inventory_id = ?", (inventory_id,))
+            self._db.executemany("INSERT INTO inventory_books VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def delete(self, inventory_id: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM inventory_books WHERE inventory_id = ?", (inventory_id,)
+            ).rowcount
+            self._db.commit()
+        return deleted > 0
+
+    def match(
+        self,
+        stored: List[Tuple[BookAnnotation, Fingerprint]],
+        boxes: np.ndarray,
+        fingerprints: List[Fingerprint],
+    ) -> Tuple[Dict[int, int], Set[int]]:
+        """Match scanned books to stored ones.
+
+        Returns a mapping from scanned to stored index, and the scanned indices
+        whose book was found at a different position. A book matches when its
+        spine looks the same; it stays in place when its box also overlaps the
+        stored box by at least ``iou_threshold``.
+        """
+        if not stored or not fingerprints:
+            return {}, set()
+
+        stored_boxes = np.array([annotation.xyxy for annotation, _ in stored], dtype=np.float32)
+        stored_hashes = np.stack([fingerprint for _, (fingerprint, _, _) in stored])
+        stored_aspects = np.array([aspect for _, (_, aspect, _) in stored], dtype=np.float32)
+        stored_colors = np.stack([color for _, (_, _, color) in stored])
+
+        hashes = np.stack([fingerprint for fingerprint, _, _ in fingerprints])
+        aspects = np.array([aspect for _, aspect, _ in fingerprints], dtype=np.float32)
+        colors = np.stack([color for _, _, color in fingerprints])
+
+        distances = hamming_distances(hashes[:, None, :], stored_hashes[None, :, :])
+        aspect_difference = np.abs(aspects[:, None] - stored_aspects[None, :]) / np.maximum(aspects[:, None], 1e-6)
+        color_difference = np.abs(colors[:, None, :] - stored_colors[None, :, :]).max(axis=2)
+        similar = (
+            (distances <= self.max_distance)
+            & (aspect_difference <= self.max_aspect_difference)
+            & (color_difference <= self.max_color_difference)
+        )
+        iou = pairwise_iou(np.asarray(boxes, dtype=np.float32)[:len(fingerprints)], stored_boxes)
+
+        matches: Dict[int, int] = {}
+        moved: Set[int] = set()
+        matched_stored: Set[int] = set()
+
+        # Greedily pair books that stayed in place first, best overlap first,
+        # then books that moved, closest fingerprint first
+        in_place = np.argwhere(similar & (iou >= self.iou_threshold))
+        in_place = in_place[np.argsort(-iou[in_place[:, 0], in_place[:, 1]], kind="stable")]
+        elsewhere = np.argwhere(similar)
+        elsewhere = elsewhere[np.argsort(distances[elsewhere[:, 0], elsewhere[:, 1]], kind="stable")]
+
+        for pairs, has_moved in ((in_place, False), (elsewhere, True)):
+            for scanned, stored_index in pairs.tolist():
+                if scanned in matches or stored_index in matched_stored:
+                    continue
+                matches[scanned] = stored_index
+                matched_stored.add(stored_index)
+                if has_moved:
+                    moved.add(scanned)
+
+        return matches, moved
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Union
+
+from models import BookAnnotation
+from .book_detection_service import BookDetectionService
+from .metrics import JOB_QUEUE_DEPTH, JOBS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class DetectionJobQueue:
+    """Bounded queue of detection jobs run in the background by a pool of workers.
+
+    Clients submit an image, get a job id back immediately and poll for the
+    status, the books whose titles are already known, and the final result.
+    Jobs live in memory and, when ``db_path`` is set, finished jobs are also
+    written to a SQLite database so results can still be fetched after a restart.
+    The database is only used from the default executor, never on the event loop.
+    """
+
+    def __init__(
+        self,
+        detection_service: BookDetectionService,
+        max_queued: int,
+        workers: int,
+        ttl_seconds: float,
+        max_jobs: int,
+        db_path: Optional[str] = None,
+    ):
+        self.detection_service = detection_service
+        self.max_queued = max_queued
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        # Created lazily so they bind to the running event loop
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS detection_jobs ("
+                "job_id TEXT PRIMARY KEY, job TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _start_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._worker_tasks = [task for task in self._worker_tasks if not task.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    def submit(self, image: Union[str, bytes]) -> str:
+        """Queue a base64 string or raw image bytes, raising JobQueueFullError when the queue is full"""
+        self._start_workers()
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "annotations": [],
+            "completed": [],
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+
+        try:
+            self._queue.put_nowait((job_id, image))
+        except asyncio.QueueFull:
+            JOBS.inc(status="rejected")
+            raise JobQueueFullError(f"The job queue is full ({self.max_queued} jobs waiting)")
+
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+
+        with self._lock:
+            self._store(job)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        """Snapshot of a job, with its annotations so far and the indices of the completed books"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return {
+                    **job,
+                    "annotations": [annotation.model_copy() for annotation in job["annotations"]],
+                    "completed": list(job["completed"]),
+                }
+
+        if self._db is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._load, job_id)
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, image = await self._queue.get()
+            JOB_QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                await self._run(job_id, image)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str, image: Union[str, bytes]) -> None:
+        await self._update(job_id, status=RUNNING)
+
+        def on_progress(annotations: List[BookAnnotation], completed: List[int]) -> None:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job["annotations"] = annotations
+                    job["completed"] = sorted(set(job["completed"]) | set(completed))
+                    job["updated_at"] = time.time()
+
+        try:
+            decoded_image = await self.detection_service.decode_image(image)
+            annotations = await self.detection_service.detect_books_in_image(decoded_image, on_progress)
+            await self._update(
+                job_id, status=DONE, annotations=annotations, completed=list(range(len(annotations)))
+            )
+        except Exception as e:
+            # HTTPException carries its message in detail
+            error = getattr(e, "detail", None) or str(e)
+            print(f"Error in detection job {job_id}: {error}")
+            await self._update(job_id, status=FAILED, error=error)
+
+    async def _update(self, job_id: str, **changes) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(changes, updated_at=time.time())
+            finished = job["status"] in (DONE, FAILED)
+            if finished:
+                JOBS.inc(status=job["status"])
+                job = dict(job)
+
+        if finished and self._db is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._persist, job)
+
+    def _store(self, job: dict) -> None:
+        self._jobs[job["job_id"]] = job
+        self._expire(job["created_at"])
+
+    def _expire(self, now: float) -> None:
+        # Drop expired and, past max_jobs, the oldest finished jobs; queued and running jobs are kept
+        for job_id, job in list(self._jobs.items()):
+            finished = job["status"] in (DONE, FAILED)
+            expired = self.ttl_seconds > 0 and now - job["updated_at"] > self.ttl_seconds
+            if finished and (expired or len(self._jobs) > self.max_jobs):
+                del self._jobs[job_id]
+
+    def _persist(self, job: dict) -> None:
+        """Write a finished job and drop the expired ones, in the database"""
+        payload = json.dumps({
+            **job,
+            "annotations": [annotation.model_dump() for annotation in job["annotations"]],
+        })
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO detection_jobs (job_id, job, updated_at) VALUES (?, ?, ?)",
+                (job["job_id"], payload, job["updated_at"]),
+            )
+            if self.ttl_seconds > 0:
+                self._db.execute(
+                    "DELETE FROM detection_jobs WHERE updated_at < ?", (job["updated_at"] - self.ttl_seconds,)
+                )
+            self._db.commit()
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        with self._db_lock:
+            row = self._db.execute("SELECT job FROM detection_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = json.loads(row[0])
+        job["annotations"] = [BookAnnotation.model_validate(item) for item in job["annotations"]]
+        return job
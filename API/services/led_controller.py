@@ -0,0 +1,87 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+from .http_clients import HTTPClientPool, http_pool
+
+
+def led_ranges(
+    xyxy: np.ndarray,
+    shelf_indices: np.ndarray,
+    shelves: int,
+    led_count: int,
+    strip_shelves: int = 1,
+    serpentine: bool = False,
+) -> np.ndarray:
+    """LED range (start, end exclusive) in front of every book, as an (n, 2) array.
+
+    The strip is split evenly over ``strip_shelves`` shelves, running left to
+    right along each, or back and forth when ``serpentine``. Photo shelves
+    (``shelf_indices``, top to bottom out of ``shelves``) are spread over the
+    strip shelves. The bookcase is taken to span from the leftmost to the
+    rightmost book, and every book gets at least one LED.
+    """
+    if len(xyxy) == 0:
+        return np.empty((0, 2), dtype=np.int32)
+
+    strip_shelves = max(1, strip_shelves)
+    leds_per_shelf = max(1, led_count // strip_shelves)
+    left, right = xyxy[:, 0].min(), xyxy[:, 2].max()
+    width = max(right - left, 1e-6)
+
+    start = np.floor((xyxy[:, 0] - left) / width * leds_per_shelf).astype(np.int32)
+    end = np.ceil((xyxy[:, 2] - left) / width * leds_per_shelf).astype(np.int32)
+    start = np.clip(start, 0, leds_per_shelf - 1)
+    end = np.clip(np.maximum(end, start + 1), 1, leds_per_shelf)
+
+    rows = np.asarray(shelf_indices) * strip_shelves // max(1, shelves)
+    if serpentine:
+        reversed_rows = rows % 2 == 1
+        start, end = (
+            np.where(reversed_rows, leds_per_shelf - end, start),
+            np.where(reversed_rows, leds_per_shelf - start, end),
+        )
+    offset = rows * leds_per_shelf
+    return np.column_stack([start + offset, end + offset]).astype(np.int32)
+
+
+class LedController:
+    """Lights LED ranges on the ESP32 strip controller.
+
+    Every update is one POST to its /set_ranges endpoint, clearing the strip
+    and lighting all ranges at once, sent through the shared connection pool.
+    """
+
+    def __init__(self, url: str, pool: Optional[HTTPClientPool] = None, timeout: Optional[float] = None):
+        self.url = url.rstrip("/")
+        self.pool = pool or http_pool
+        self.timeout = timeout if timeout is not None else settings.LED_CONTROLLER_TIMEOUT
+
+    async def light(
+        self,
+        ranges: Sequence[Tuple[int, int]],
+        color: Tuple[int, int, int] = (255, 255, 255),
+        brightness: int = 100,
+        clear: bool = True,
+    ) -> None:
+        r, g, b = color
+        payload = {
+            "clear": clear,
+            "ranges": [
+                {"start": int(start), "end": int(end), "r": r, "g": g, "b": b, "a": brightness}
+                for start, end in ranges
+            ],
+        }
+        response = await self.pool.async_client.post(f"{self.url}/set_ranges", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+    async def clear(self) -> None:
+        await self.light([], clear=True)
+
+
+def create_led_controller() -> Optional[LedController]:
+    """The controller at settings.LED_CONTROLLER_URL, None when no controller is configured"""
+    if not settings.LED_CONTROLLER_URL:
+        return None
+    return LedController(settings.LED_CONTROLLER_URL)
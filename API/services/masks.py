@@ -0,0 +1,131 @@
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+if TYPE_CHECKING:
+    # supervision takes about half a second to import, it is loaded on the first detection
+    import supervision as sv
+
+# Detections carry their masks under this data key instead of as N full frame masks
+CROPPED_MASK_KEY = "cropped_mask"
+
+
+class CroppedMask:
+    """Segmentation mask of one detection, stored for its bounding box only.
+
+    The crop sits at (``x``, ``y``) in a frame of ``frame_size`` (width,
+    height), the image the detector saw, which may be a downscaled copy of the
+    photo. Memory scales with the book area instead of the frame.
+    """
+
+    __slots__ = ("x", "y", "mask", "frame_size")
+
+    def __init__(self, x: int, y: int, mask: np.ndarray, frame_size: Tuple[int, int]):
+        self.x = x
+        self.y = y
+        self.mask = mask
+        self.frame_size = frame_size
+
+    @property
+    def bounds(self) -> Tuple[int, int, int, int]:
+        """(x_min, y_min, x_max, y_max) in frame coordinates, exclusive on the max side"""
+        height, width = self.mask.shape
+        return self.x, self.y, self.x + width, self.y + height
+
+    @classmethod
+    def from_crop(cls, x: int, y: int, mask: np.ndarray, frame_size: Tuple[int, int]) -> Optional["CroppedMask"]:
+        """Trim a mask crop at (x, y) to its set pixels, None if it is empty"""
+        rows = np.flatnonzero(mask.any(axis=1))
+        if len(rows) == 0:
+            return None
+        cols = np.flatnonzero(mask.any(axis=0))
+        return cls(
+            x + int(cols[0]), y + int(rows[0]), mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1], frame_size
+        )
+
+    @classmethod
+    def from_polygon(cls, polygon: np.ndarray, frame_size: Tuple[int, int]) -> Optional["CroppedMask"]:
+        """Rasterize a polygon into a mask of its bounding box, clipped to the frame"""
+        width, height = frame_size
+        # Round like sv.Detections.from_inference, truncating would shift the mask up and left
+        points = np.round(polygon).astype(np.int32)
+        x_min, y_min = np.maximum(points.min(axis=0), 0)
+        x_max, y_max = np.minimum(points.max(axis=0) + 1, [width, height])
+        if x_max <= x_min or y_max <= y_min:
+            return None
+
+        mask = np.zeros((y_max - y_min, x_max - x_min), dtype=np.uint8)
+        cv2.fillPoly(mask, [points - [x_min, y_min]], 1)
+        return cls.from_crop(int(x_min), int(y_min), mask.view(bool), frame_size)
+
+    @classmethod
+    def from_dense(cls, mask: np.ndarray, xyxy: np.ndarray, padding: int = 2) -> Optional["CroppedMask"]:
+        """Crop a full frame mask to its set pixels.
+
+        Only the detection box (plus a little padding) is scanned, so the cost
+        scales with the book size instead of the full frame.
+        """
+        height, width = mask.shape
+        x_min = int(np.clip(np.floor(xyxy[0]) - padding, 0, width))
+        y_min = int(np.clip(np.floor(xyxy[1]) - padding, 0, height))
+        x_max = int(np.clip(np.ceil(xyxy[2]) + padding + 1, 0, width))
+        y_max = int(np.clip(np.ceil(xyxy[3]) + padding + 1, 0, height))
+
+        cropped = cls.from_crop(x_min, y_min, mask[y_min:y_max, x_min:x_max], (width, height))
+        if cropped is None:
+            # The mask lies outside its box, fall back to a full-frame reduction
+            cropped = cls.from_crop(0, 0, mask, (width, height))
+        if cropped is not None:
+            # Keep the crop, not a view that would pin the full frame mask in memory
+            cropped.mask = cropped.mask.copy()
+        return cropped
+
+
+def detections_from_inference(result: dict) -> "sv.Detections":
+    """sv.Detections.from_inference for a segmentation response, with a CroppedMask
+    rasterized from every polygon instead of N full frame masks"""
+    import supervision as sv
+
+    predictions = result["predictions"]
+    detections = sv.Detections.from_inference({
+        **result,
+        "predictions": [
+            {key: value for key, value in prediction.items() if key != "points"} for prediction in predictions
+        ],
+    })
+
+    frame_size = (int(result["image"]["width"]), int(result["image"]["height"]))
+    masks: List[Optional[CroppedMask]] = []
+    for prediction in predictions:
+        points = prediction.get("points") or []
+        polygon = np.array([[point["x"], point["y"]] for point in points], dtype=np.float64)
+        masks.append(CroppedMask.from_polygon(polygon, frame_size) if len(points) >= 3 else None)
+    detections.data[CROPPED_MASK_KEY] = masks
+    return detections
+
+
+def compact_detections(detections: "sv.Detections") -> "sv.Detections":
+    """Replace full frame masks with cropped ones, in place. Detections from the
+    detector backends already carry cropped masks and are returned as is."""
+    if CROPPED_MASK_KEY in detections.data:
+        return detections
+
+    if detections.mask is None:
+        detections.data[CROPPED_MASK_KEY] = [None] * len(detections)
+    else:
+        detections.data[CROPPED_MASK_KEY] = [
+            CroppedMask.from_dense(mask, xyxy) for mask, xyxy in zip(detections.mask, detections.xyxy)
+        ]
+        detections.mask = None
+    return detections
+
+
+def drop_empty_masks(detections: "sv.Detections") -> "sv.Detections":
+    """Detections with a cropped mask, without the ones whose polygon was degenerate or empty.
+
+    Every kept detection yields exactly one region, so regions, polygons and
+    boxes stay aligned by index down the pipeline.
+    """
+    masks = compact_detections(detections).data[CROPPED_MASK_KEY]
+    return detections[np.array([mask is not None for mask in masks], dtype=bool)]
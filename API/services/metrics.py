@@ -0,0 +1,252 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Latency buckets in seconds, from cache hits up to slow Gemini calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples(),
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last one is +Inf), sum and count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, totals = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), list(totals)) for key, (counts, totals) in self._values.items()]
+
+        samples = []
+        for key, counts, (total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                samples.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            samples.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return samples
+
+
+class MetricsRegistry:
+    """Collects metrics and renders them in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "bookshelf_stage_duration_seconds",
+    "Time spent in each stage of the detection pipeline",
+    ["stage"],
+)
+HTTP_REQUESTS = metrics.counter(
+    "bookshelf_http_requests_total",
+    "HTTP requests handled, by route and status code",
+    ["route", "status"],
+)
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "bookshelf_http_request_duration_seconds",
+    "End to end HTTP request latency, by route",
+    ["route"],
+)
+HTTP_IN_FLIGHT = metrics.gauge(
+    "bookshelf_http_requests_in_flight",
+    "HTTP requests currently being handled",
+)
+HTTP_BYTES_IN = metrics.counter(
+    "bookshelf_http_request_bytes_total",
+    "Bytes received in HTTP request bodies",
+)
+HTTP_BYTES_OUT = metrics.counter(
+    "bookshelf_http_response_bytes_total",
+    "Bytes sent in HTTP response bodies",
+)
+GEMINI_UPLOAD_BYTES = metrics.counter(
+    "bookshelf_gemini_upload_bytes_total",
+    "Encoded image bytes sent to Gemini",
+)
+GEMINI_CALLS = metrics.counter(
+    "bookshelf_gemini_calls_total",
+    "Gemini calls, by outcome",
+    ["outcome"],
+)
+CACHE_LOOKUPS = metrics.counter(
+    "bookshelf_cache_lookups_total",
+    "Cache lookups, by cache and result",
+    ["cache", "result"],
+)
+CACHE_HIT_RATIO = metrics.gauge(
+    "bookshelf_cache_hit_ratio",
+    "Fraction of cache lookups that were hits, by cache",
+    ["cache"],
+)
+COALESCED_REQUESTS = metrics.counter(
+    "bookshelf_coalesced_requests_total",
+    "Detection requests answered by an identical request already in flight",
+)
+JOB_QUEUE_DEPTH = metrics.gauge(
+    "bookshelf_job_queue_depth",
+    "Detection jobs waiting for a worker",
+)
+JOBS = metrics.counter(
+    "bookshelf_jobs_total",
+    "Detection jobs, by final status (done, failed or rejected because the queue was full)",
+    ["status"],
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request counts, latency, in-flight requests and body sizes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                HTTP_BYTES_IN.inc(len(message.get("body", b"")))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                HTTP_BYTES_OUT.inc(len(message.get("body", b"")))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope, use its template to keep labels bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(route=route, status=str(status["code"]))
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route)
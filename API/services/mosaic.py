@@ -0,0 +1,42 @@
+from typing import List
+
+import cv2
+import numpy as np
+
+LABEL_WIDTH = 72
+SEPARATOR_HEIGHT = 6
+
+
+def build_spine_mosaic(regions: List[np.ndarray], width: int, max_height: int, first_number: int = 1) -> np.ndarray:
+    """Stack rotated spine crops into one image of numbered horizontal strips.
+
+    Every strip is scaled to the same width and numbered, starting at
+    ``first_number``, in a column on the left. A single image can then carry
+    many spines and the model can refer to each one by number. The whole
+    mosaic is scaled down if it exceeds ``max_height``.
+    """
+    content_width = width - LABEL_WIDTH
+    strips = []
+    for number, region in enumerate(regions, start=first_number):
+        height = max(1, round(region.shape[0] * content_width / max(region.shape[1], 1)))
+        strip = np.zeros((height, width, 3), dtype=np.uint8)
+        strip[:, LABEL_WIDTH:] = cv2.resize(region, (content_width, height), interpolation=cv2.INTER_AREA)
+
+        # White label on the dark left column, centered vertically
+        label = str(number)
+        scale = min(1.2, max(0.4, height / 40))
+        (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+        origin = ((LABEL_WIDTH - text_width) // 2, (height + text_height) // 2)
+        cv2.putText(strip, label, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (255, 255, 255), 2, cv2.LINE_AA)
+
+        strips.append(strip)
+        strips.append(np.full((SEPARATOR_HEIGHT, width, 3), 255, dtype=np.uint8))
+
+    mosaic = np.vstack(strips[:-1])
+    if mosaic.shape[0] > max_height:
+        scale = max_height / mosaic.shape[0]
+        mosaic = cv2.resize(
+            mosaic, (max(1, round(width * scale)), max_height), interpolation=cv2.INTER_AREA
+        )
+
+    return mosaic
@@ -0,0 +1,75 @@
+import base64
+import itertools
+from typing import List, Optional, Union
+
+import cv2
+import numpy as np
+
+# "float" keeps the original nested [x, y] lists
+POLYGON_FORMATS = ("float", "int", "delta", "binary")
+
+EncodedPolygon = Union[List[List[float]], List[List[int]], List[int], str]
+
+
+class PolygonEncoding:
+    """Compact representation of annotation polygons in responses.
+
+    Polygons are optionally simplified with Douglas-Peucker (``tolerance`` in
+    pixels, 0 keeps every point), then written as:
+
+    * ``float``: ``[[x, y], ...]`` as stored
+    * ``int``: ``[[x, y], ...]`` rounded to whole pixels
+    * ``delta``: flat ``[x0, y0, dx1, dy1, ...]`` integers, each point relative to the previous one
+    * ``binary``: base64 of little-endian uint16 ``x, y`` pairs, for images up to 65535 pixels
+    """
+
+    def __init__(self, polygon_format: str = "float", tolerance: float = 0.0):
+        if polygon_format not in POLYGON_FORMATS:
+            raise ValueError(f"Unknown polygon format: {polygon_format}, expected one of {', '.join(POLYGON_FORMATS)}")
+        self.polygon_format = polygon_format
+        self.tolerance = tolerance
+
+    @classmethod
+    def from_request(
+        cls, polygon_format: Optional[str], tolerance: Optional[float], accept: str = ""
+    ) -> Optional["PolygonEncoding"]:
+        """Build the encoding from query values, falling back to ``polygons`` and ``simplify``
+        parameters of the Accept media type, e.g. ``application/json; polygons=delta; simplify=1.5``.
+        Returns None when neither asks for anything but the default."""
+        for media_range in accept.split(","):
+            for parameter in media_range.split(";")[1:]:
+                name, _, value = parameter.strip().partition("=")
+                if name == "polygons" and polygon_format is None:
+                    polygon_format = value.strip().strip('"')
+                elif name == "simplify" and tolerance is None:
+                    tolerance = float(value.strip().strip('"'))
+
+        if polygon_format in (None, "float") and not tolerance:
+            return None
+        return cls(polygon_format or "float", tolerance or 0.0)
+
+    def encode_polygon(self, polygon: List[List[float]]) -> EncodedPolygon:
+        # Flattening first is several times faster than converting the nested lists directly
+        points = np.fromiter(
+            itertools.chain.from_iterable(polygon), dtype=np.float64, count=2 * len(polygon)
+        ).reshape(-1, 2)
+        if self.tolerance > 0 and len(points) > 2:
+            # approxPolyDP only takes float32, which is exact for pixel coordinates
+            simplified = cv2.approxPolyDP(points.astype(np.float32).reshape(-1, 1, 2), self.tolerance, True)
+            points = simplified.reshape(-1, 2).astype(np.float64)
+
+        if self.polygon_format == "float":
+            return points.tolist()
+
+        points = np.rint(points).astype(np.int32)
+        if self.polygon_format == "int":
+            return points.tolist()
+        if self.polygon_format == "delta":
+            deltas = points.copy()
+            deltas[1:] -= points[:-1]
+            return deltas.ravel().tolist()
+        # Polygons lie within the image, so they fit unsigned 16 bit coordinates
+        return base64.b64encode(np.clip(points, 0, 0xFFFF).astype("<u2").tobytes()).decode("ascii")
+
+    def encode(self, polygons: List[List[List[float]]]) -> List[EncodedPolygon]:
+        return [self.encode_polygon(polygon) for polygon in polygons]
@@ -0,0 +1,194 @@
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+from fastapi import HTTPException
+
+from config import settings
+
+# Name of a shared memory block and the (offset, shape, dtype) of every array packed into it
+SharedArrays = Tuple[str, List[Tuple[int, Tuple[int, ...], str]]]
+
+
+def share_arrays(arrays: Sequence[np.ndarray]) -> Tuple[shared_memory.SharedMemory, SharedArrays]:
+    """Copy arrays into one new shared memory block, returning the block and its picklable description.
+
+    The receiving process maps the block and reads the arrays in place. The
+    block lives until someone unlinks it, which the side that reads last does.
+    """
+    layout, size = [], 0
+    for array in arrays:
+        layout.append((size, array.shape, array.dtype.str))
+        size += array.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    for array, (offset, shape, dtype) in zip(arrays, layout):
+        np.ndarray(shape, dtype, buffer=block.buf, offset=offset)[...] = array
+    return block, (block.name, layout)
+
+
+def _on_shared_arrays(shared: SharedArrays, call: Callable[[List[np.ndarray]], object]):
+    """Call with views of the arrays of a block, which must not outlive the call"""
+    name, layout = shared
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return call([np.ndarray(shape, dtype, buffer=block.buf, offset=offset) for offset, shape, dtype in layout])
+    finally:
+        try:
+            block.close()
+        except BufferError:
+            # A traceback still holds views of the block, it is unmapped once they are gone
+            pass
+
+
+def receive_arrays(shared: SharedArrays) -> List[np.ndarray]:
+    """Copy the arrays of a block sent by another process, then unlink it"""
+    try:
+        return _on_shared_arrays(shared, lambda views: [view.copy() for view in views])
+    finally:
+        shared_memory.SharedMemory(name=shared[0]).unlink()
+
+
+class _WorkerHTTPError(Exception):
+    """An HTTPException raised in a worker, FastAPI's own can't be unpickled"""
+
+
+# State of a worker process, set up by _init_worker
+_image_service = None
+
+
+def _init_worker() -> None:
+    global _image_service
+    from .detectors import NoDetector
+    from .image_service import ImageProcessingService
+
+    # Every worker runs one stage at a time, OpenCV threads on top would oversubscribe the cores
+    cv2.setNumThreads(1)
+    # Workers run the stages themselves, never in a pool of their own
+    settings.PROCESS_POOL_WORKERS = 0
+    _image_service = ImageProcessingService(detector=NoDetector())
+
+
+def _ping() -> None:
+    pass
+
+
+def _decode(image_bytes: bytes) -> SharedArrays:
+    try:
+        image = _image_service.decode_image_bytes(image_bytes)
+    except HTTPException as e:
+        raise _WorkerHTTPError(e.status_code, e.detail)
+    block, shared = share_arrays([image])
+    block.close()
+    return shared
+
+
+def _extract_regions(shared_image: SharedArrays, masks: list) -> Tuple[SharedArrays, List]:
+    regions, polygons = _on_shared_arrays(
+        shared_image, lambda arrays: _image_service.extract_regions(arrays[0], masks)
+    )
+    block, shared_regions = share_arrays(regions)
+    block.close()
+    return shared_regions, polygons
+
+
+def _encode(shared_images: SharedArrays, indices: List[int], max_dimension: int) -> List[bytes]:
+    from .gemini_service import encode_image
+
+    return _on_shared_arrays(
+        shared_images, lambda images: [encode_image(images[i], max_dimension) for i in indices]
+    )
+
+
+class ProcessWorkerPool:
+    """Runs the CPU-bound pipeline stages in worker processes, away from the GIL of the event loop.
+
+    Decoding, region extraction and crop encoding are mostly OpenCV calls
+    that release the GIL, but the Python and NumPy code around them does
+    not, so on a busy server the threads of one process keep waiting on each
+    other and on the event loop. Frames and crops are handed over through
+    shared memory instead of being pickled: the sender copies them into a
+    block once, the worker reads them in place, and only the block name and
+    array layout go through the pipe.
+
+    Workers are spawned rather than forked, so they don't inherit the threads
+    and open connections of the server, and read the settings from the
+    environment when they start.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def warm_up(self) -> None:
+        """Start every worker, so the first requests don't wait for them to import the pipeline"""
+        for future in [self._executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _result(self, future: Future):
+        try:
+            return future.result()
+        except _WorkerHTTPError as e:
+            raise HTTPException(status_code=e.args[0], detail=e.args[1])
+
+    def decode(self, image_bytes: bytes) -> np.ndarray:
+        return receive_arrays(self._result(self._executor.submit(_decode, image_bytes)))[0]
+
+    def extract_regions(self, image: np.ndarray, masks: list) -> Tuple[List[np.ndarray], List]:
+        block, shared_image = share_arrays([image])
+        try:
+            shared_regions, polygons = self._result(self._executor.submit(_extract_regions, shared_image, masks))
+        finally:
+            block.close()
+            block.unlink()
+        return receive_arrays(shared_regions), polygons
+
+    def encode_images(self, images: List[np.ndarray], max_dimension: int) -> List[bytes]:
+        """Encode the images for Gemini, split evenly over the workers"""
+        if not images:
+            return []
+        block, shared_images = share_arrays(images)
+        chunks = np.array_split(np.arange(len(images)), min(self.workers, len(images)))
+        futures = [self._executor.submit(_encode, shared_images, chunk.tolist(), max_dimension) for chunk in chunks]
+        try:
+            return [encoded for future in futures for encoded in self._result(future)]
+        finally:
+            # Other chunks may still be reading the block when one fails
+            wait(futures)
+            block.close()
+            block.unlink()
+
+
+_shared_pool: Optional[ProcessWorkerPool] = None
+_shared_pool_lock = threading.Lock()
+
+
+def shared_process_pool() -> Optional[ProcessWorkerPool]:
+    """The process-wide worker pool, created on first use, None when PROCESS_POOL_WORKERS is 0"""
+    global _shared_pool
+    if settings.PROCESS_POOL_WORKERS <= 0:
+        return None
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ProcessWorkerPool(settings.PROCESS_POOL_WORKERS)
+    return _shared_pool
+
+
+def shutdown_shared_process_pool() -> None:
+    """Stop the workers of the process-wide pool on shutdown. The next use starts a new
+    pool, so it keeps working across app lifespans in the same process."""
+    global _shared_pool
+    with _shared_pool_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.shutdown()
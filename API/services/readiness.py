@@ -0,0 +1,48 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict
+
+
+class Readiness:
+    """Warm-up steps run in the background on startup, as reported by /ready.
+
+    The server answers requests while the steps run, so a new worker comes up
+    right away and an orchestrator polling /ready only sends it traffic once
+    the first requests no longer pay for the warm-up. A failed step keeps the
+    worker unready, with its error in the report.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._steps: Dict[str, dict] = {}
+
+    def start(self, name: str, call: Callable[[], Awaitable]) -> asyncio.Task:
+        # Registered before the task runs, so /ready never reports a step that hasn't started yet as done
+        self._steps[name] = {"status": "running"}
+        return asyncio.create_task(self._run(name, call))
+
+    async def _run(self, name: str, call: Callable[[], Awaitable]) -> None:
+        step = self._steps[name]
+        started = time.perf_counter()
+        try:
+            await call()
+            step["status"] = "done"
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {str(e)}")
+            step["status"] = "failed"
+            step["error"] = str(e)
+        step["seconds"] = round(time.perf_counter() - started, 3)
+
+    @property
+    def ready(self) -> bool:
+        return all(step["status"] == "done" for step in self._steps.values())
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.perf_counter() - self._started, 3),
+            "steps": {name: dict(step) for name, step in self._steps.items()},
+        }
+
+
+readiness = Readiness()
@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from models import ProcessingResult
+from .array_utils import hamming_distances
+from .metrics import CACHE_LOOKUPS
+
+
+class RegionCache:
+    """Near-duplicate cache of Gemini results for individual book spines.
+
+    Each spine crop is fingerprinted with a dHash. A lookup returns the result of
+    the closest stored fingerprint within ``max_distance`` bits whose aspect
+    ratio and mean color also match, so a spine photographed again is not
+    re-sent to Gemini. The color check keeps plain, low-texture spines (which
+    all hash alike) from being mistaken for each other.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        max_distance: int,
+        fingerprint_bytes: int,
+        max_aspect_difference: float = 0.15,
+        max_color_difference: float = 20.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.max_aspect_difference = max_aspect_difference
+        self.max_color_difference = max_color_difference
+        self._lock = threading.Lock()
+
+        # Fixed-size slots so a lookup is a single vectorized scan
+        self._fingerprints = np.zeros((max_entries, fingerprint_bytes), dtype=np.uint8)
+        self._aspects = np.zeros(max_entries, dtype=np.float32)
+        self._colors = np.zeros((max_entries, 3), dtype=np.float32)
+        self._created_at = np.zeros(max_entries, dtype=np.float64)
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._results: List[Optional[ProcessingResult]] = [None] * max_entries
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def _live_slots(self, now: float) -> np.ndarray:
+        live = np.ones(self._size, dtype=bool)
+        if self.ttl_seconds > 0:
+            live &= now - self._created_at[:self._size] <= self.ttl_seconds
+        return live
+
+    def get(self, fingerprint: np.ndarray, aspect: float, color: np.ndarray) -> Optional[ProcessingResult]:
+        now = time.time()
+        with self._lock:
+            if self._size == 0:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="region", result="miss")
+                return None
+
+            distances = hamming_distances(self._fingerprints[:self._size], fingerprint)
+            aspect_difference = np.abs(self._aspects[:self._size] - aspect) / max(aspect, 1e-6)
+            color_difference = np.abs(self._colors[:self._size] - color).max(axis=1)
+            candidates = (
+                self._live_slots(now)
+                & (distances <= self.max_distance)
+                & (aspect_difference <= self.max_aspect_difference)
+                & (color_difference <= self.max_color_difference)
+            )
+
+            if not candidates.any():
+                self.misses += 1
+                CACHE_LOOKUPS.inc(cache="region", result="miss")
+                return None
+
+            slot = int(np.argmin(np.where(candidates, distances, distances.max() + 1)))
+            self._last_used[slot] = now
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache="region", result="hit")
+            return self._results[slot]
+
+    def set(self, fingerprint: np.ndarray, aspect: float, color: np.ndarray, result: ProcessingResult) -> None:
+        now = time.time()
+        with self._lock:
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                # Reuse an expired slot if there is one, otherwise the least recently used
+                expired = np.flatnonzero(~self._live_slots(now))
+                slot = int(expired[0]) if len(expired) else int(np.argmin(self._last_used))
+
+            self._fingerprints[slot] = fingerprint
+            self._aspects[slot] = aspect
+            self._colors[slot] = color
+            self._created_at[slot] = now
+            self._last_used[slot] = now
+            self._results[slot] = result
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "region_cache_hits": self.hits,
+                "region_cache_misses": self.misses,
+            }
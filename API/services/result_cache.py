@@ -0,0 +1,171 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from models import BookAnnotation
+from .metrics import CACHE_LOOKUPS
+
+
+# Time the entry was stored, digest of the exact image it was computed for, and the result
+Entry = Tuple[float, str, List[BookAnnotation]]
+
+
+class ResultCache:
+    """LRU/TTL cache of detection results keyed on a perceptual image hash.
+
+    The perceptual hash is coarse: on a whole-shelf photo, removing one spine
+    or swapping two flips only a few of its bits, so different shelves can share
+    a key. Every entry therefore also stores a digest of the exact image, and a
+    lookup only hits when the digests match too. A changed shelf never gets the
+    books of the previous one, it replaces them once detected.
+
+    Entries live in memory and, when ``db_path`` is set, are also written to a
+    SQLite database so they survive restarts. On the event loop use get_async
+    and set_async, which only touch the database from the default executor.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        # Guards the entries and counters, the database has its own lock so
+        # memory lookups never wait for disk I/O
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS result_cache ("
+                "key TEXT PRIMARY KEY, annotations TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, digest TEXT)"
+            )
+            # Databases written before digests were stored get the column, their rows never match
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(result_cache)")}
+            if "digest" not in columns:
+                self._db.execute("ALTER TABLE result_cache ADD COLUMN digest TEXT")
+            self._db.commit()
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def get(self, key: str, digest: str) -> Optional[List[BookAnnotation]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory_entry(key, now)
+        if entry is None and self._db is not None:
+            with self._db_lock:
+                entry = self._load_from_db(key, now)
+        with self._lock:
+            if entry is not None:
+                self._store_in_memory(key, entry)
+            return self._record_lookup(entry, digest)
+
+    async def get_async(self, key: str, digest: str) -> Optional[List[BookAnnotation]]:
+        """get, looking in memory inline and in the database from the default executor"""
+        if self._db is None:
+            return self.get(key, digest)
+        with self._lock:
+            entry = self._memory_entry(key, time.time())
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return self._record_lookup(entry, digest)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, key, digest)
+
+    def set(self, key: str, digest: str, annotations: List[BookAnnotation]) -> None:
+        now = time.time()
+        with self._lock:
+            self._store_in_memory(key, (now, digest, annotations))
+        if self._db is not None:
+            with self._db_lock:
+                self._save_to_db(key, digest, annotations, now)
+
+    async def set_async(self, key: str, digest: str, annotations: List[BookAnnotation]) -> None:
+        """set, writing to the database from the default executor"""
+        if self._db is None:
+            return self.set(key, digest, annotations)
+        now = time.time()
+        with self._lock:
+            self._store_in_memory(key, (now, digest, annotations))
+
+        def save() -> None:
+            with self._db_lock:
+                self._save_to_db(key, digest, annotations, now)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, save)
+
+    def _memory_entry(self, key: str, now: float) -> Optional[Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and self._is_expired(entry[0], now):
+            del self._entries[key]
+            return None
+        return entry
+
+    def _record_lookup(self, entry: Optional[Entry], digest: str) -> Optional[List[BookAnnotation]]:
+        # An entry with another digest is a different image that happens to share the perceptual hash
+        if entry is None or entry[1] != digest:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache="result", result="miss")
+            return None
+        self.hits += 1
+        CACHE_LOOKUPS.inc(cache="result", result="hit")
+        return entry[2]
+
+    def _save_to_db(self, key: str, digest: str, annotations: List[BookAnnotation], now: float) -> None:
+        payload = json.dumps([annotation.model_dump() for annotation in annotations])
+        self._db.execute(
+            "INSERT OR REPLACE INTO result_cache (key, annotations, created_at, accessed_at, digest) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, payload, now, now, digest),
+        )
+        # Drop expired rows and keep only the most recently used entries on disk
+        if self.ttl_seconds > 0:
+            self._db.execute("DELETE FROM result_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM result_cache WHERE key NOT IN "
+            "(SELECT key FROM result_cache ORDER BY accessed_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._db.commit()
+
+    def _store_in_memory(self, key: str, entry: Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_db(self, key: str, now: float) -> Optional[Entry]:
+        row = self._db.execute(
+            "SELECT annotations, created_at, digest FROM result_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        payload, created_at, digest = row
+        if self._is_expired(created_at, now):
+            self._db.execute("DELETE FROM result_cache WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+
+        self._db.execute("UPDATE result_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        annotations = [BookAnnotation.model_validate(item) for item in json.loads(payload)]
+        return created_at, digest or "", annotations
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_hit_ratio": round(self.hits / lookups, 4) if lookups > 0 else 0.0,
+            }
@@ -0,0 +1,147 @@
+from typing import List
+
+import numpy as np
+
+# Shelves need this many books before their line fit is trusted for tilt estimation
+MIN_BOOKS_FOR_TILT = 3
+
+# Lying books are stacked when their widths overlap by this fraction of the narrower one
+STACK_MIN_OVERLAP = 0.5
+# and the upper one rests within this fraction of the thinner one's height of the lower one's top
+STACK_MAX_GAP = 0.25
+
+
+def _cluster_intervals(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Label overlapping [start, end) intervals with the same cluster id, top to bottom.
+
+    Sweep line over the intervals sorted by start: a new cluster begins where an
+    interval starts at or below the furthest end seen so far.
+    """
+    order = np.argsort(starts, kind="stable")
+    sorted_starts, sorted_ends = starts[order], ends[order]
+    furthest_end = np.maximum.accumulate(sorted_ends)
+
+    new_cluster = np.empty(len(order), dtype=bool)
+    new_cluster[0] = True
+    new_cluster[1:] = sorted_starts[1:] >= furthest_end[:-1]
+
+    labels = np.empty(len(order), dtype=np.intp)
+    labels[order] = np.cumsum(new_cluster) - 1
+    return labels
+
+
+def _label_stacks(xyxy: np.ndarray) -> np.ndarray:
+    """Label books stacked on top of each other with the same id, every other book gets its own.
+
+    Only lying books, wider than tall, are stacked, so a tall book reaching past
+    the shelf above is never joined to the books standing there.
+    """
+    labels = np.arange(len(xyxy))
+    lying = np.flatnonzero(xyxy[:, 2] - xyxy[:, 0] > xyxy[:, 3] - xyxy[:, 1])
+    if len(lying) < 2:
+        return labels
+
+    x1, y1, x2, y2 = (xyxy[lying, column] for column in range(4))
+    # Candidates for the book under each one have their top within the gap of its bottom,
+    # found in the lying books sorted by top instead of comparing every pair
+    order = np.argsort(y1, kind="stable")
+    reach = STACK_MAX_GAP * (y2 - y1)
+    first = np.searchsorted(y1[order], y2 - reach, side="left")
+    last = np.searchsorted(y1[order], y2 + reach, side="right")
+    counts = last - first
+    upper = np.repeat(np.arange(len(lying)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    lower = order[np.repeat(first, counts) + offsets]
+
+    overlap = np.minimum(x2[lower], x2[upper]) - np.maximum(x1[lower], x1[upper])
+    narrower = np.minimum(x2[lower] - x1[lower], x2[upper] - x1[upper])
+    thinner = np.minimum(y2[lower] - y1[lower], y2[upper] - y1[upper])
+    # The upper book rests near the top of the lower one, above its middle, across most of its width
+    stacked = (
+        (np.abs(y2[upper] - y1[lower]) <= STACK_MAX_GAP * thinner)
+        & (y2[upper] < (y1[lower] + y2[lower]) / 2)
+        & (overlap >= STACK_MIN_OVERLAP * narrower)
+    )
+    lower, upper = lower[stacked], upper[stacked]
+    if len(lower) == 0:
+        return labels
+
+    # Spread the smallest id through the stacks until they settle, stacks are only a few books high
+    stack = np.arange(len(lying))
+    while True:
+        spread = stack.copy()
+        np.minimum.at(spread, lower, stack[upper])
+        np.minimum.at(spread, upper, stack[lower])
+        if np.array_equal(spread, stack):
+            break
+        stack = spread
+    labels[lying] = lying[stack]
+    return labels
+
+
+def _estimate_tilt(center_x: np.ndarray, bottom: np.ndarray, labels: np.ndarray) -> float:
+    """Median slope of the line fitted through the book bottoms of each shelf"""
+    slopes = []
+    for label in np.unique(labels):
+        members = labels == label
+        if members.sum() < MIN_BOOKS_FOR_TILT or np.ptp(center_x[members]) == 0:
+            continue
+        slope, _ = np.polyfit(center_x[members], bottom[members], 1)
+        slopes.append(slope)
+    return float(np.median(slopes)) if slopes else 0.0
+
+
+def group_boxes_into_shelves(
+    xyxy: np.ndarray, correct_tilt: bool = False, extent: float = 0.5
+) -> List[np.ndarray]:
+    """Group book boxes into shelves, returning the book indices of each shelf.
+
+    Shelves are ordered top to bottom and the books of a shelf left to right.
+    Books share a shelf when their vertical extents overlap, found with a sweep
+    line in O(n log n). Books stand on the shelf line, so an extent reaches up
+    from the bottom of the book by the ``extent`` fraction of its height, and a
+    short book still overlaps the tall ones next to it. Heights are capped at
+    the median book height, so one tall or fallen book can't bridge two
+    shelves. Lying books stacked on each other count as one book from the
+    bottom of the stack to its top, so the upper ones don't form shelves of
+    their own. With ``correct_tilt`` a line is fitted through the bottoms of each
+    shelf and the books are regrouped along the median slope, for photos taken
+    at an angle.
+    """
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    if len(xyxy) == 0:
+        return []
+
+    xyxy = np.column_stack([
+        np.minimum(xyxy[:, 0], xyxy[:, 2]), np.minimum(xyxy[:, 1], xyxy[:, 3]),
+        np.maximum(xyxy[:, 0], xyxy[:, 2]), np.maximum(xyxy[:, 1], xyxy[:, 3]),
+    ])
+    center_x = (xyxy[:, 0] + xyxy[:, 2]) / 2
+    center_y = (xyxy[:, 1] + xyxy[:, 3]) / 2
+
+    # A stack of lying books stands on the shelf as one tall book
+    stacks = _label_stacks(xyxy)
+    bottom = np.full(len(xyxy), -np.inf)
+    top = np.full(len(xyxy), np.inf)
+    np.maximum.at(bottom, stacks, xyxy[:, 3])
+    np.minimum.at(top, stacks, xyxy[:, 1])
+    bottom, heights = bottom[stacks], bottom[stacks] - top[stacks]
+    reach = np.minimum(heights, np.median(heights)) * extent
+
+    labels = _cluster_intervals(bottom - reach, bottom)
+
+    slope = _estimate_tilt(center_x, bottom, labels) if correct_tilt else 0.0
+    if slope != 0.0:
+        # Measure heights along the shelf lines, relative to the left edge of the photo
+        bottom = bottom - slope * center_x
+        labels = _cluster_intervals(bottom - reach, bottom)
+        center_y = center_y - slope * center_x
+
+    # Sort by shelf, then left to right, and split wherever the shelf changes
+    order = np.lexsort((center_x, labels))
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    shelves = np.split(order, boundaries)
+
+    # Cluster ids follow interval starts, order shelves by their mean height to be safe
+    shelves.sort(key=lambda indices: center_y[indices].mean())
+    return shelves
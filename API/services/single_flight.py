@@ -0,0 +1,40 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from .metrics import COALESCED_REQUESTS
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one.
+
+    The first caller starts the work in a task, callers arriving while it
+    runs await that same task and get its result or exception. The task is
+    shielded, so a caller that goes away does not cancel the work for the
+    others. Once the task is done the key is free again, results are not
+    cached.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            COALESCED_REQUESTS.inc()
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception retrieved, every waiter may have gone away
+        if not task.cancelled():
+            task.exception()
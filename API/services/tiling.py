@@ -0,0 +1,87 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from .array_utils import pairwise_iou
+
+# (x_min, y_min, x_max, y_max) of a tile in image coordinates
+Window = Tuple[int, int, int, int]
+
+
+def tile_windows(width: int, height: int, overlap: float) -> List[Window]:
+    """Square tiles as tall (or wide) as the short side, overlapping by ``overlap`` along the long side"""
+    side = min(width, height)
+    length = max(width, height)
+    stride = max(1, int(side * (1 - overlap)))
+
+    starts = list(range(0, max(length - side, 0) + 1, stride))
+    # Always end with a tile flush with the far edge
+    if starts[-1] + side < length:
+        starts.append(length - side)
+
+    if width >= height:
+        return [(start, 0, start + side, height) for start in starts]
+    return [(0, start, width, start + side) for start in starts]
+
+
+def _touches_inner_edge(xyxy: np.ndarray, window: Window, width: int, height: int, margin: float) -> np.ndarray:
+    """Boxes that reach a tile border shared with a neighbouring tile, so they may be cut off"""
+    x_min, y_min, x_max, y_max = window
+    cut = np.zeros(len(xyxy), dtype=bool)
+    if x_min > 0:
+        cut |= xyxy[:, 0] <= x_min + margin
+    if y_min > 0:
+        cut |= xyxy[:, 1] <= y_min + margin
+    if x_max < width:
+        cut |= xyxy[:, 2] >= x_max - margin
+    if y_max < height:
+        cut |= xyxy[:, 3] >= y_max - margin
+    return cut
+
+
+def merge_tile_detections(
+    xyxy: np.ndarray,
+    confidence: np.ndarray,
+    windows: List[Window],
+    tile_indices: np.ndarray,
+    width: int,
+    height: int,
+    iou_threshold: float = 0.5,
+    containment_threshold: float = 0.7,
+    margin: float = 2.0,
+) -> np.ndarray:
+    """Indices of the detections to keep after merging overlapping tiles.
+
+    A book in the overlap of two tiles is found twice, and a book crossing a
+    tile border is cut in one of them. Detections away from inner tile borders
+    are preferred, then the most confident. A detection is dropped when it
+    overlaps one kept from another tile by ``iou_threshold`` or lies mostly
+    inside it.
+    """
+    if len(xyxy) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    cut = np.zeros(len(xyxy), dtype=bool)
+    for tile, window in enumerate(windows):
+        members = tile_indices == tile
+        cut[members] = _touches_inner_edge(xyxy[members], window, width, height, margin)
+
+    confidence = confidence if confidence is not None else np.ones(len(xyxy))
+    order = np.lexsort((-confidence, cut))
+
+    iou = pairwise_iou(xyxy, xyxy)
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    # Intersection over the smaller box, catches a cut-off half of a book
+    intersection = iou * (areas[:, None] + areas[None, :]) / (1 + iou)
+    containment = intersection / np.maximum(np.minimum(areas[:, None], areas[None, :]), 1e-6)
+
+    keep = []
+    suppressed = np.zeros(len(xyxy), dtype=bool)
+    for index in order:
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        # The detector already separated the books within a tile, only merge across tiles
+        duplicates = (iou[index] >= iou_threshold) | (containment[index] >= containment_threshold)
+        suppressed |= duplicates & (tile_indices != tile_indices[index])
+    return np.sort(np.array(keep, dtype=np.intp))
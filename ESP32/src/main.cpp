@@ -80,6 +80,58 @@ void setup() {
     }
   );
 
+  server.on("/set_ranges", HTTP_POST, [](AsyncWebServerRequest *request){}, NULL,
+    [](AsyncWebServerRequest *request, uint8_t *data, size_t len, size_t index, size_t total) {
+      // Larger bodies arrive in several chunks, a batch of ranges fits in one
+      if (len != total) {
+        if (index == 0) {
+          request->send(413, "application/json", "{\"error\":\"Body too large\"}");
+        }
+        return;
+      }
+
+      DynamicJsonDocument doc(4096);
+      DeserializationError error = deserializeJson(doc, data, len);
+
+      if (error) {
+        request->send(400, "application/json", "{\"error\":\"Invalid JSON\"}");
+        return;
+      }
+
+      JsonArray ranges = doc["ranges"];
+      if (ranges.isNull()) {
+        request->send(400, "application/json", "{\"error\":\"Expected a ranges array\"}");
+        return;
+      }
+
+      if (doc["clear"] | false) {
+        FastLED.clear();
+      }
+
+      for (JsonObject range : ranges) {
+        int start = max(range["start"] | 0, 0);
+        int end = min(range["end"] | start + 1, NUM_LEDS);
+        int r = range["r"] | 255;
+        int g = range["g"] | 255;
+        int b = range["b"] | 255;
+        int a = range["a"] | 100;
+
+        if (start >= end) {
+          Serial.println("Invalid LED range.");
+          continue;
+        }
+
+        Serial.printf("LEDs %d-%d → RGB(%d,%d,%d) @ %d%% opacity\n", start, end - 1, r, g, b, a);
+        fill_solid(leds + start, end - start, CRGB(r, g, b).nscale8(map(a, 0, 100, 0, 255)));
+      }
+
+      // A single show() for the whole batch
+      FastLED.show();
+
+      request->send(200, "application/json", "{\"status\":\"ok\"}");
+    }
+  );
+
   server.begin();
 }
 